@@ -0,0 +1,150 @@
+"""
+Micro-benchmark of the payload formats exchanged between controllers.
+
+Cleans a real movies dataset the way MoviesPreprocessor does and compares,
+for a FilterByYear-like stage (read release_date, keep some rows, forward two
+columns), the CSV round trip against the columnar batch. It also compares,
+for a FilterByCountry-like stage, genres/countries/languages sent as strings
+against dictionary codes (common/dictionary.py).
+
+Usage (from the repository root):
+    python3 benchmarks/columnar_batch_benchmark.py [movies.csv] [rows_per_batch]
+"""
+import ast
+import csv
+import io
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from common.columnar_batch import ColumnarBatch, ColumnType, date_to_int, year_of
+from common.dictionary import COUNTRIES, GENRES, LANGUAGES
+from common.middleware_message_protocol import MiddlewareMessage
+
+DEFAULT_DATASET = ".data/movies_metadata_1.csv"
+DEFAULT_ROWS_PER_BATCH = 100
+REPETITIONS = 5
+
+COLUMNS = [
+    "id", "title", "genres", "release_date", "overview",
+    "production_countries", "spoken_languages", "budget", "revenue"
+]
+SCHEMA = [
+    ("id", ColumnType.INT),
+    ("title", ColumnType.STRING),
+    ("genres", ColumnType.STRING_LIST),
+    ("release_date", ColumnType.INT),
+    ("overview", ColumnType.STRING),
+    ("production_countries", ColumnType.STRING_LIST),
+    ("spoken_languages", ColumnType.STRING_LIST),
+    ("budget", ColumnType.FLOAT),
+    ("revenue", ColumnType.FLOAT),
+]
+CODES_SCHEMA = [
+    ("id", ColumnType.INT),
+    ("title", ColumnType.STRING),
+    ("genres", ColumnType.CODE_LIST, GENRES),
+    ("release_date", ColumnType.INT),
+    ("overview", ColumnType.STRING),
+    ("production_countries", ColumnType.CODE_LIST, COUNTRIES),
+    ("spoken_languages", ColumnType.CODE_LIST, LANGUAGES),
+    ("budget", ColumnType.FLOAT),
+    ("revenue", ColumnType.FLOAT),
+]
+COUNTRY_FILTER = ["Argentina", "Spain"]
+COUNTRY_MASK = COUNTRIES.mask_of(COUNTRY_FILTER)
+
+
+def names(value):
+    try:
+        return [data['name'] for data in ast.literal_eval(value)]
+    except (ValueError, SyntaxError):
+        return []
+
+
+def load_rows(path):
+    csv.field_size_limit(sys.maxsize)
+    rows = []
+    with open(path, newline='') as f:
+        reader = csv.DictReader(f)
+        for row in reader:
+            if any(row.get(col) in (None, '', 'null') for col in COLUMNS):
+                continue
+            try:
+                rows.append([
+                    int(row["id"]), row["title"], names(row["genres"]), row["release_date"], row["overview"],
+                    names(row["production_countries"]), names(row["spoken_languages"]),
+                    float(row["budget"]), float(row["revenue"]),
+                ])
+            except ValueError:
+                continue
+    return rows
+
+
+def csv_stage(payload):
+    lines = csv.reader(io.StringIO(payload), delimiter=',', quotechar='"')
+    result = [[line[0], line[1]] for line in lines if int(line[3].split('-')[0]) >= 2000]
+    return MiddlewareMessage.write_csv_batch(result)
+
+
+def columnar_stage(payload):
+    batch = ColumnarBatch.from_bytes(payload)
+    rows = [i for i, date in enumerate(batch.column("release_date")) if year_of(date) >= 2000]
+    return batch.take(rows, "id", "title").to_bytes()
+
+
+def country_strings_stage(payload):
+    batch = ColumnarBatch.from_bytes(payload)
+    rows = [
+        i for i, countries in enumerate(batch.column("production_countries"))
+        if all(country in countries for country in COUNTRY_FILTER)
+    ]
+    return batch.take(rows, "title", "genres", "release_date").to_bytes()
+
+
+def country_codes_stage(payload):
+    batch = ColumnarBatch.from_bytes(payload)
+    rows = [
+        i for i, countries in enumerate(batch.column("production_countries"))
+        if COUNTRIES.mask(countries) & COUNTRY_MASK == COUNTRY_MASK
+    ]
+    return batch.take(rows, "title", "genres", "release_date").to_bytes()
+
+
+def measure(label, fn, n_batches):
+    elapsed = min(timeit.repeat(fn, number=1, repeat=REPETITIONS))
+    print(f"{label:<24} {n_batches / elapsed:>12.0f} batch/s")
+
+
+def main():
+    path = sys.argv[1] if len(sys.argv) > 1 else DEFAULT_DATASET
+    rows_per_batch = int(sys.argv[2]) if len(sys.argv) > 2 else DEFAULT_ROWS_PER_BATCH
+    rows = load_rows(path)
+    batches = [rows[i:i + rows_per_batch] for i in range(0, len(rows), rows_per_batch)]
+
+    csv_payloads = [MiddlewareMessage.write_csv_batch(batch) for batch in batches]
+    typed_batches = [[row[:3] + [date_to_int(row[3])] + row[4:] for row in batch] for batch in batches]
+    columnar_payloads = [ColumnarBatch.from_rows(SCHEMA, batch).to_bytes() for batch in typed_batches]
+    codes_payloads = [
+        ColumnarBatch.from_rows(CODES_SCHEMA, [
+            row[:2] + [GENRES.encode(row[2])] + row[3:5]
+            + [COUNTRIES.encode(row[5]), LANGUAGES.encode(row[6])] + row[7:]
+            for row in batch
+        ]).to_bytes()
+        for batch in typed_batches
+    ]
+    csv_size = sum(len(p.encode('utf-8')) for p in csv_payloads)
+    columnar_size = sum(len(p) for p in columnar_payloads)
+    codes_size = sum(len(p) for p in codes_payloads)
+    print(f"dataset: {path} | batches: {len(batches)} | csv: {csv_size / 2**20:.2f} MiB | columnar: {columnar_size / 2**20:.2f} MiB | columnar with codes: {codes_size / 2**20:.2f} MiB")
+
+    measure("filter by year csv", lambda: [csv_stage(p) for p in csv_payloads], len(batches))
+    measure("filter by year columnar", lambda: [columnar_stage(p) for p in columnar_payloads], len(batches))
+    measure("filter by country names", lambda: [country_strings_stage(p) for p in columnar_payloads], len(batches))
+    measure("filter by country codes", lambda: [country_codes_stage(p) for p in codes_payloads], len(batches))
+
+
+if __name__ == "__main__":
+    main()
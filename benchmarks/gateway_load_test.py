@@ -0,0 +1,149 @@
+"""
+Load test of the gateway with many concurrent clients.
+
+Opens the given number of connections at once against a running gateway and
+each one plays the same session as the Go client: TYPE_INIT, query 0, the
+movies, credits and ratings batches with their EOFs and FINISH_SEND_FILES.
+Every client sends the same batches, built from the first rows of each file
+of the dataset directory (rows joined with '|', up to rows_per_batch rows
+and 64 KiB per batch, like the client).
+
+Reports the init round trip, the upload time per client and the aggregated
+ingestion throughput. With wait_results=1 each client also waits for the five
+EOF_QUERY messages and the time to results is reported (needs the whole
+system running, e.g. docker compose up without the client containers).
+Gateway memory can be followed meanwhile with `docker stats gateway`.
+
+Usage (from the repository root):
+    python3 benchmarks/gateway_load_test.py [host:port] [clients] [rows_per_file] [data_dir] [wait_results] [rows_per_batch]
+    python3 benchmarks/gateway_load_test.py localhost:12345 2000 1000 .data 0
+"""
+import asyncio
+import csv
+import io
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from common.defines import ClientCommunication
+from common.message_protocol import MessageProtocol
+from common.socket_handler import SocketHandler
+
+DEFAULT_ADDRESS = "localhost:12345"
+DEFAULT_CLIENTS = 100
+DEFAULT_ROWS_PER_FILE = 1000
+DEFAULT_DATA_DIR = ".data"
+DEFAULT_ROWS_PER_BATCH = 100
+MAX_BATCH_SIZE = 64 * 1024
+FILES = [
+    ("movies_metadata.csv", ClientCommunication.BATCH_MOVIES, ClientCommunication.EOF_MOVIES),
+    ("credits.csv", ClientCommunication.BATCH_CREDITS, ClientCommunication.EOF_CREDITS),
+    ("ratings.csv", ClientCommunication.BATCH_RATINGS, ClientCommunication.EOF_RATINGS),
+]
+EOF_RESULTS = {
+    ClientCommunication.EOF_QUERY_1, ClientCommunication.EOF_QUERY_2, ClientCommunication.EOF_QUERY_3,
+    ClientCommunication.EOF_QUERY_4, ClientCommunication.EOF_QUERY_5,
+}
+
+
+def load_batches(path, limit, rows_per_batch):
+    csv.field_size_limit(sys.maxsize)
+    batches, batch, batch_size = [], [], 0
+    with open(path, newline='') as f:
+        reader = csv.reader(f)
+        next(reader)  # header
+        for n, row in enumerate(reader):
+            if n == limit:
+                break
+            output = io.StringIO()
+            csv.writer(output, lineterminator='').writerow(row)
+            line = output.getvalue()
+            if batch and (len(batch) == rows_per_batch or batch_size + len(line) + 1 > MAX_BATCH_SIZE):
+                batches.append('|'.join(batch))
+                batch, batch_size = [], 0
+            batch.append(line)
+            batch_size += len(line) + 1
+    if batch:
+        batches.append('|'.join(batch))
+    return batches
+
+
+async def run_client(host, port, files, wait_results, stats):
+    start = time.perf_counter()
+    reader, writer = await asyncio.open_connection(host, port)
+    await SocketHandler.send_message_to_stream(writer, MessageProtocol(ClientCommunication.TYPE_INIT.value))
+    response = await SocketHandler.receive_message_from_stream(reader)
+    if response is None or response.type_message != ClientCommunication.CODE_INIT:
+        raise ConnectionError("the gateway did not answer TYPE_INIT")
+    stats["init"].append(time.perf_counter() - start)
+
+    upload_start = time.perf_counter()
+    await SocketHandler.send_message_to_stream(writer, MessageProtocol(ClientCommunication.TYPE_QUERY.value, "0"))
+    for batches, batch_type, eof_type in files:
+        for batch in batches:
+            await SocketHandler.send_message_to_stream(writer, MessageProtocol(batch_type.value, batch))
+        await SocketHandler.send_message_to_stream(writer, MessageProtocol(eof_type.value))
+    await SocketHandler.send_message_to_stream(writer, MessageProtocol(ClientCommunication.FINISH_SEND_FILES.value))
+    stats["upload"].append(time.perf_counter() - upload_start)
+
+    if wait_results:
+        results_start = time.perf_counter()
+        pending = set(EOF_RESULTS)
+        while pending:
+            message = await SocketHandler.receive_message_from_stream(reader)
+            if message is None:
+                raise ConnectionError("the gateway closed the connection before sending every result")
+            pending.discard(message.type_message)
+        stats["results"].append(time.perf_counter() - results_start)
+    await SocketHandler.send_message_to_stream(writer, MessageProtocol(ClientCommunication.TYPE_FINISH_COMMUNICATION.value))
+    writer.close()
+    await writer.wait_closed()
+
+
+def report(label, samples):
+    if not samples:
+        return
+    samples = sorted(samples)
+    p99 = samples[min(len(samples) - 1, int(len(samples) * 0.99))]
+    print(f"{label:<16} p50 {statistics.median(samples) * 1000:>10.1f} ms  p99 {p99 * 1000:>10.1f} ms  max {samples[-1] * 1000:>10.1f} ms")
+
+
+async def main():
+    host, port = (sys.argv[1] if len(sys.argv) > 1 else DEFAULT_ADDRESS).rsplit(":", 1)
+    clients = int(sys.argv[2]) if len(sys.argv) > 2 else DEFAULT_CLIENTS
+    rows_per_file = int(sys.argv[3]) if len(sys.argv) > 3 else DEFAULT_ROWS_PER_FILE
+    data_dir = sys.argv[4] if len(sys.argv) > 4 else DEFAULT_DATA_DIR
+    wait_results = len(sys.argv) > 5 and sys.argv[5] == "1"
+    rows_per_batch = int(sys.argv[6]) if len(sys.argv) > 6 else DEFAULT_ROWS_PER_BATCH
+
+    files = [(load_batches(os.path.join(data_dir, name), rows_per_file, rows_per_batch), batch_type, eof_type)
+             for name, batch_type, eof_type in FILES]
+    n_batches = sum(len(batches) for batches, _, _ in files)
+    n_bytes = sum(len(batch) for batches, _, _ in files for batch in batches)
+    print(f"gateway: {host}:{port} | clients: {clients} | batches per client: {n_batches} | bytes per client: {n_bytes}")
+
+    stats = {"init": [], "upload": [], "results": []}
+    start = time.perf_counter()
+    outcomes = await asyncio.gather(
+        *(run_client(host, int(port), files, wait_results, stats) for _ in range(clients)),
+        return_exceptions=True
+    )
+    elapsed = time.perf_counter() - start
+    failed = [outcome for outcome in outcomes if isinstance(outcome, Exception)]
+
+    completed = clients - len(failed)
+    print(f"completed: {completed} | failed: {len(failed)} | elapsed: {elapsed:.1f} s")
+    if failed:
+        print(f"first failure: {failed[0]!r}")
+    report("init", stats["init"])
+    report("upload", stats["upload"])
+    report("results", stats["results"])
+    print(f"throughput       {len(stats['upload']) * n_batches / elapsed:>10.1f} batches/s  "
+          f"{len(stats['upload']) * n_bytes / elapsed / 2**20:>8.1f} MiB/s")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
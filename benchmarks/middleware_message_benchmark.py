@@ -0,0 +1,96 @@
+"""
+Micro-benchmark of the MiddlewareMessage wire formats.
+
+Builds batches from a real movies dataset the same way the client does
+(100 rows per batch) and compares encode/decode throughput of the legacy
+"<|>" text format against the binary framed format.
+
+Usage (from the repository root):
+    python3 benchmarks/middleware_message_benchmark.py [movies.csv] [rows_per_batch]
+"""
+import csv
+import io
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from common.defines import QueryNumber
+from common.middleware_message_protocol import MiddlewareMessage, MiddlewareMessageType
+
+DEFAULT_DATASET = ".data/movies_metadata_1.csv"
+DEFAULT_ROWS_PER_BATCH = 100
+REPETITIONS = 5
+
+
+def load_batches(path, rows_per_batch):
+    csv.field_size_limit(sys.maxsize)
+    batches = []
+    with open(path, newline='') as f:
+        reader = csv.reader(f)
+        next(reader)  # header
+        rows = []
+        for row in reader:
+            rows.append(row)
+            if len(rows) == rows_per_batch:
+                batches.append(rows)
+                rows = []
+        if rows:
+            batches.append(rows)
+    payloads = []
+    for rows in batches:
+        output = io.StringIO()
+        csv.writer(output).writerows(rows)
+        payloads.append(output.getvalue())
+    return payloads
+
+
+def build_messages(payloads):
+    return [
+        MiddlewareMessage(
+            query_number=QueryNumber.ALL_QUERYS,
+            client_id=331234567890123456789012345678901234567,
+            seq_number=seq_number,
+            type=MiddlewareMessageType.MOVIES_BATCH,
+            payload=payload,
+            controller_name="movies_preprocessor_0",
+        )
+        for seq_number, payload in enumerate(payloads)
+    ]
+
+
+def encode(messages, payloads, encoder):
+    # Reset the payload so the cached utf-8 buffer is not reused between runs
+    for msg, payload in zip(messages, payloads):
+        msg.payload = payload
+        encoder(msg)
+
+
+def measure(label, fn, total_bytes, n_messages):
+    elapsed = min(timeit.repeat(fn, number=1, repeat=REPETITIONS))
+    print(f"{label:<28} {n_messages / elapsed:>12.0f} msg/s {total_bytes / elapsed / 2**20:>10.1f} MiB/s")
+
+
+def main():
+    path = sys.argv[1] if len(sys.argv) > 1 else DEFAULT_DATASET
+    rows_per_batch = int(sys.argv[2]) if len(sys.argv) > 2 else DEFAULT_ROWS_PER_BATCH
+    payloads = load_batches(path, rows_per_batch)
+    messages = build_messages(payloads)
+    total_bytes = sum(len(p.encode('utf-8')) for p in payloads)
+    print(f"dataset: {path} | batches: {len(messages)} | payload: {total_bytes / 2**20:.1f} MiB")
+
+    text_bodies = [msg.encode_to_str().encode() for msg in messages]
+    binary_bodies = [msg.encode_to_bytes() for msg in messages]
+
+    measure("encode text", lambda: encode(messages, payloads, lambda msg: msg.encode_to_str().encode()), total_bytes, len(messages))
+    measure("encode binary", lambda: encode(messages, payloads, lambda msg: msg.encode_to_bytes()), total_bytes, len(messages))
+    measure("decode text", lambda: [MiddlewareMessage.decode_from_bytes(b).payload for b in text_bodies], total_bytes, len(messages))
+    measure("decode binary", lambda: [MiddlewareMessage.decode_from_bytes(b).payload for b in binary_bodies], total_bytes, len(messages))
+    measure("decode binary (no payload)", lambda: [MiddlewareMessage.decode_from_bytes(b).payload_bytes for b in binary_bodies], total_bytes, len(messages))
+    measure("forward text", lambda: [MiddlewareMessage.decode_from_bytes(b).encode_to_str().encode() for b in text_bodies], total_bytes, len(messages))
+    measure("forward binary", lambda: [MiddlewareMessage.decode_from_bytes(b).encode_to_bytes() for b in binary_bodies], total_bytes, len(messages))
+
+
+if __name__ == "__main__":
+    main()
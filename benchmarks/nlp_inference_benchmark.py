@@ -0,0 +1,90 @@
+"""
+Benchmark of the sentiment inference done by AggregatorNlp, on CPU.
+
+Takes the movies that reach the aggregator for Query 5 (overview, budget > 0
+and revenue > 0) and compares the original path, one transformers pipeline
+call per movie, against SentimentClassifier with every sentiment backend
+(pytorch, int8, onnx), several batch sizes and worker pool sizes. For each
+one it reports the load time, movies/s and how many labels match the original
+pipeline.
+
+Needs transformers and torch installed (same as the aggregator_nlp image),
+and onnxruntime plus a model directory made by export_model.py for the onnx
+backend.
+
+Usage (from the repository root):
+    python3 benchmarks/nlp_inference_benchmark.py [movies.csv] [movies] [batch_sizes] [backends] [model_dir] [processes]
+    python3 benchmarks/nlp_inference_benchmark.py .data/movies_metadata.csv 512 8,32 pytorch,int8,onnx /model 1,4
+"""
+import csv
+import os
+import sys
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, os.path.join(ROOT, "controllers", "aggregators", "aggregator_nlp"))
+
+from transformers import pipeline
+from sentiment import MODEL, SentimentClassifier, load_backend
+
+DEFAULT_DATASET = ".data/movies_metadata_1.csv"
+DEFAULT_MOVIES = 512
+DEFAULT_BATCH_SIZES = "8,32,64"
+DEFAULT_BACKENDS = "pytorch,int8"
+DEFAULT_PROCESSES = "1"
+
+
+def load_overviews(path, limit):
+    csv.field_size_limit(sys.maxsize)
+    overviews = []
+    with open(path, newline='') as f:
+        for row in csv.DictReader(f):
+            try:
+                if row["overview"] and float(row["budget"]) > 0 and float(row["revenue"]) > 0:
+                    overviews.append(SentimentClassifier.truncate(row["overview"]))
+            except (ValueError, TypeError):
+                continue
+            if len(overviews) == limit:
+                break
+    return overviews
+
+
+def timed(fn):
+    start = time.perf_counter()
+    result = fn()
+    return result, time.perf_counter() - start
+
+
+def report(label, load_time, elapsed, n_movies, matches=None):
+    agreement = "" if matches is None else f" {matches / n_movies:>8.1%} same label"
+    print(f"{label:<28} load {load_time:>6.1f} s {n_movies / elapsed:>10.1f} movies/s{agreement}")
+
+
+def main():
+    path = sys.argv[1] if len(sys.argv) > 1 else DEFAULT_DATASET
+    limit = int(sys.argv[2]) if len(sys.argv) > 2 else DEFAULT_MOVIES
+    batch_sizes = [int(size) for size in (sys.argv[3] if len(sys.argv) > 3 else DEFAULT_BATCH_SIZES).split(",")]
+    backends = (sys.argv[4] if len(sys.argv) > 4 else DEFAULT_BACKENDS).split(",")
+    model_dir = sys.argv[5] if len(sys.argv) > 5 and sys.argv[5] else None
+    processes = [int(count) for count in (sys.argv[6] if len(sys.argv) > 6 else DEFAULT_PROCESSES).split(",")]
+    overviews = load_overviews(path, limit)
+    print(f"dataset: {path} | movies: {len(overviews)} | torch threads: 1")
+
+    analyzer, load_time = timed(lambda: pipeline('sentiment-analysis', model=model_dir or MODEL))
+    analyzer(overviews[0])  # warm-up
+    expected, elapsed = timed(lambda: [analyzer(text)[0]['label'] for text in overviews])
+    report("pipeline one by one", load_time, elapsed, len(overviews))
+
+    for name in backends:
+        backend, load_time = timed(lambda: load_backend(name, model_dir))
+        for count in processes:
+            for batch_size in batch_sizes:
+                classifier = SentimentClassifier(backend, batch_size, processes=count)
+                sentiments, elapsed = timed(lambda: classifier.classify(overviews))
+                classifier.close()
+                matches = sum(sentiments[text] == label for text, label in zip(overviews, expected))
+                report(f"{name} x{count} batched ({batch_size})", load_time, elapsed, len(overviews), matches)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+"""
+Correctness check and micro-benchmark of the TMDB list-of-dicts extractor.
+
+Reads every genres, production_countries and spoken_languages cell of a movies
+dataset and every cast cell of a credits dataset, checks that extract_names
+returns exactly what the previous ast.literal_eval implementation returns
+(literal_names) for all of them plus a few hand-written edge cases, and
+compares the throughput of both.
+
+Exits with status 1 if any cell differs.
+
+Usage (from the repository root):
+    python3 benchmarks/tmdb_names_benchmark.py [movies.csv] [credits.csv]
+"""
+import csv
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from common.tmdb_format import extract_names, literal_names
+
+DEFAULT_MOVIES = ".data/movies_metadata_1.csv"
+DEFAULT_CREDITS = ".data/credits_1.csv"
+MOVIES_COLUMNS = ["genres", "production_countries", "spoken_languages"]
+CREDITS_COLUMNS = ["cast"]
+REPETITIONS = 3
+
+EDGE_CASES = [
+    "[]",
+    "",
+    "nan",
+    "[{'id': 16, 'name': 'Animation'}, {'id': 35, 'name': 'Comedy'}]",
+    """[{'character': "Jimmy, 'name': 'not a name'", 'name': "Jim O'Brien", 'order': 0, 'profile_path': None}]""",
+    """[{'iso_639_1': 'fr', 'name': 'Fran\\xe7ais'}]""",
+    """[{'id': 1, 'name': 'It\\'s "quoted"'}]""",
+    "[{'id': 1, 'name': None}]",
+    "[{'id': 1, 'name': 'Truncated'}, {'id'",
+    "[{'name': 'line\nbreak'}]",
+    "[{'id': 1, 'popularity': 1.5e-05, 'name': 'Exponent'}]",
+    "[{'id': -3, 'name': '', 'adult': False}]",
+]
+
+
+def load_cells(path, columns):
+    if not os.path.exists(path):
+        print(f"{path}: not found, skipped")
+        return []
+    csv.field_size_limit(sys.maxsize)
+    cells = []
+    with open(path, newline='') as f:
+        for row in csv.DictReader(f):
+            cells.extend(row[col] for col in columns if row.get(col) is not None)
+    return cells
+
+
+def check(cells):
+    mismatches = 0
+    for cell in cells:
+        try:
+            expected = literal_names(cell)
+        except Exception as e:
+            expected = type(e)
+        try:
+            got = extract_names(cell)
+        except Exception as e:
+            got = type(e)
+        if got != expected:
+            mismatches += 1
+            if mismatches <= 5:
+                print(f"MISMATCH {cell[:120]!r}: {got!r} != {expected!r}")
+    return mismatches
+
+
+def measure(label, fn, cells):
+    elapsed = min(timeit.repeat(lambda: [fn(cell) for cell in cells], number=1, repeat=REPETITIONS))
+    size = sum(len(cell) for cell in cells)
+    print(f"{label:<28} {len(cells) / elapsed:>12.0f} cells/s {size / elapsed / 2**20:>8.1f} MiB/s")
+    return elapsed
+
+
+def main():
+    movies_path = sys.argv[1] if len(sys.argv) > 1 else DEFAULT_MOVIES
+    credits_path = sys.argv[2] if len(sys.argv) > 2 else DEFAULT_CREDITS
+    datasets = [
+        ("movies", load_cells(movies_path, MOVIES_COLUMNS)),
+        ("credits", load_cells(credits_path, CREDITS_COLUMNS)),
+    ]
+
+    mismatches = check(EDGE_CASES)
+    for name, cells in datasets:
+        mismatches += check(cells)
+        print(f"{name}: {len(cells)} cells checked")
+    print(f"mismatches: {mismatches}")
+
+    for name, cells in datasets:
+        cells = [cell for cell in cells if cell]
+        if not cells:
+            continue
+        baseline = measure(f"{name} literal_eval", literal_names, cells)
+        fast = measure(f"{name} extract_names", extract_names, cells)
+        print(f"{name} speedup: {baseline / fast:.1f}x")
+
+    sys.exit(1 if mismatches else 0)
+
+
+if __name__ == "__main__":
+    main()
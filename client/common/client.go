@@ -7,6 +7,7 @@ import (
 	"os"
 	"os/signal"
 	"strconv"
+	"strings"
 	"syscall"
 	"time"
 
@@ -28,6 +29,7 @@ type ClientConfig struct {
 	Phase          int
 	FilesToProcess []string // Lista de archivos a procesar
 	Query          int
+	Compression    string // Codecs de compresion que se ofrecen al gateway, separados por coma
 }
 
 // Client Entity that encapsulates how1
@@ -38,6 +40,7 @@ type Client struct {
 	bufferedLine    string                      // Buffer to store a line that didn't fit in the previous batch
 	hasBufferedLine bool                        // Flag to indicate if we have a buffered line
 	resultQueries   map[int]*result.ResultQuery // Store results of queries
+	compression     string                      // Codec negociado con el gateway, vacio si no se comprime
 }
 
 // NewClient Initializes a new client receiving the configuration
@@ -104,7 +107,7 @@ func (c *Client) handleInit() bool {
 	// Send the client ID to the server
 	message := communication.NewMessageProtocol(
 		communication.TYPE_INIT,
-		[]byte{},
+		[]byte(c.config.Compression),
 	)
 	err := c.protocol.SendMessage(message)
 	if err != nil {
@@ -132,9 +135,15 @@ func (c *Client) handleInit() bool {
 		return true
 	}
 
-	c.config.ID = string(recv_id.Payload)
-	log.Infof("action: receive_message_code_init | result: success | new_id: %v",
+	// La respuesta es "<id>" o "<id>;<codec>" si el gateway acepto comprimir los batches
+	initResponse := strings.SplitN(string(recv_id.Payload), ";", 2)
+	c.config.ID = initResponse[0]
+	if len(initResponse) == 2 {
+		c.compression = initResponse[1]
+	}
+	log.Infof("action: receive_message_code_init | result: success | new_id: %v | compression: %v",
 		c.config.ID,
+		c.compression,
 	)
 
 	c.config.Phase = communication.CODE_QUERY
@@ -382,6 +391,18 @@ func (c *Client) handleBatch(reader *FileReader, code int) bool {
 		}
 	}
 
+	if c.compression != "" {
+		compressed, err := communication.CompressBatch(c.compression, batch)
+		if err != nil {
+			log.Errorf("action: compress_batch | result: fail | client_id: %v | error: %v",
+				c.config.ID,
+				err,
+			)
+			return true
+		}
+		batch = compressed
+	}
+
 	messageBatch := communication.NewMessageProtocol(
 		code,
 		batch,
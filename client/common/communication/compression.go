@@ -0,0 +1,28 @@
+package communication
+
+import (
+	"bytes"
+	"compress/zlib"
+	"fmt"
+)
+
+// Codec de compresion de los batches, negociado con el gateway en TYPE_INIT
+const COMPRESSION_ZLIB = "zlib"
+
+// CompressBatch separa las filas del batch con '\n' (lo que hace el gateway con
+// los batches sin comprimir) y lo comprime con el codec negociado
+func CompressBatch(codec string, batch []byte) ([]byte, error) {
+	if codec != COMPRESSION_ZLIB {
+		return nil, fmt.Errorf("unsupported compression codec: %s", codec)
+	}
+	lines := bytes.ReplaceAll(batch, []byte{'|'}, []byte{'\n'})
+	var buf bytes.Buffer
+	writer := zlib.NewWriter(&buf)
+	if _, err := writer.Write(lines); err != nil {
+		return nil, err
+	}
+	if err := writer.Close(); err != nil {
+		return nil, err
+	}
+	return buf.Bytes(), nil
+}
@@ -35,6 +35,7 @@ func InitConfig() (*viper.Viper, error) {
 	v.BindEnv("batch", "maxAmount")
 	v.BindEnv("files") // Binding for the list of files to process
 	v.BindEnv("query", "number")
+	v.BindEnv("compression")
 	// Try to read configuration from config file. If config file
 	// does not exists then ReadInConfig will fail but configuration
 	// can be loaded from the environment variables so we shouldn't
@@ -56,7 +57,7 @@ func InitConfig() (*viper.Viper, error) {
 // PrintConfig Print all the configuration parameters of the program.
 // For debugging purposes only
 func PrintConfig(v *viper.Viper) {
-	Log.Infof("action: config | result: success | client_id: %s | server_address: %s | tester_address: %s | loop_amount: %v | loop_period: %v | log_level: %s | batch_maxAmount: %v | files: %v | query_number: %v",
+	Log.Infof("action: config | result: success | client_id: %s | server_address: %s | tester_address: %s | loop_amount: %v | loop_period: %v | log_level: %s | batch_maxAmount: %v | files: %v | query_number: %v | compression: %v",
 		v.GetString("id"),
 		v.GetString("server.address"),
 		v.GetString("tester.address"),
@@ -66,5 +67,6 @@ func PrintConfig(v *viper.Viper) {
 		v.GetInt("batch.maxAmount"),
 		v.GetStringSlice("files"),
 		v.GetInt("query.number"),
+		v.GetString("compression"),
 	)
 }
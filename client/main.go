@@ -28,6 +28,7 @@ func main() {
 		MaxAmount:     v.GetInt("batch.maxAmount"),
 		Phase:         communication.CODE_INIT,
 		Query:         v.GetInt("query"),
+		Compression:   v.GetString("compression"),
 	}
 
 	client := common.NewClient(clientConfig)
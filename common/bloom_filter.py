@@ -0,0 +1,76 @@
+"""
+Filtro de Bloom de ids de pelicula. Los joiners publican el de las peliculas
+de cada cliente cuando reciben todas, y los preprocessors de ratings y credits
+descartan las filas de peliculas que no estan en el filtro antes de enviarlas.
+Un filtro de Bloom no tiene falsos negativos: una fila descartada nunca se
+hubiera unido con una pelicula. Los falsos positivos solo se envian de mas.
+"""
+import hashlib
+import math
+import struct
+
+DEFAULT_ERROR_RATE = 0.01
+MAX_CACHED_KEYS = 1_000_000
+
+# bits (4) | cantidad de hashes (1) | bits del filtro
+HEADER = struct.Struct("!IB")
+
+
+def key_hashes(key) -> tuple[int, int]:
+    """Dos hashes de 64 bits estables entre procesos, para el double hashing"""
+    digest = hashlib.blake2b(str(key).encode('utf-8'), digest_size=16).digest()
+    return int.from_bytes(digest[:8], 'big'), int.from_bytes(digest[8:], 'big') | 1
+
+
+class BloomFilter:
+
+    def __init__(self, size_bits: int, hash_count: int, bits: bytearray | None = None):
+        self.size_bits = max(8, size_bits)
+        self.hash_count = max(1, hash_count)
+        self.bits = bits if bits is not None else bytearray((self.size_bits + 7) // 8)
+        # Las claves se repiten mucho (un id de pelicula por rating): se cachea el resultado
+        self.cache = {}
+
+    @classmethod
+    def for_capacity(cls, capacity: int, error_rate: float = DEFAULT_ERROR_RATE):
+        """Filtro dimensionado para capacity claves con la tasa de falsos positivos dada"""
+        capacity = max(1, capacity)
+        size_bits = math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2)
+        hash_count = round(size_bits / capacity * math.log(2))
+        return cls(size_bits, hash_count)
+
+    @classmethod
+    def from_keys(cls, keys, error_rate: float = DEFAULT_ERROR_RATE):
+        keys = list(keys)
+        bloom = cls.for_capacity(len(keys), error_rate)
+        for key in keys:
+            bloom.add(key)
+        return bloom
+
+    def positions(self, key):
+        h1, h2 = key_hashes(key)
+        return [(h1 + i * h2) % self.size_bits for i in range(self.hash_count)]
+
+    def add(self, key):
+        for position in self.positions(key):
+            self.bits[position >> 3] |= 1 << (position & 7)
+        self.cache.clear()
+
+    def __contains__(self, key) -> bool:
+        found = self.cache.get(key)
+        if found is None:
+            if len(self.cache) >= MAX_CACHED_KEYS:
+                self.cache.clear()
+            found = self.cache[key] = all(self.bits[position >> 3] & (1 << (position & 7)) for position in self.positions(key))
+        return found
+
+    def to_bytes(self) -> bytes:
+        return HEADER.pack(self.size_bits, self.hash_count) + bytes(self.bits)
+
+    @classmethod
+    def from_bytes(cls, data: bytes | memoryview):
+        size_bits, hash_count = HEADER.unpack_from(data)
+        bits = bytearray(data[HEADER.size:])
+        if len(bits) != (size_bits + 7) // 8:
+            raise ValueError(f"Truncated bloom filter: expected {(size_bits + 7) // 8} bytes, got {len(bits)}")
+        return cls(size_bits, hash_count, bits)
@@ -0,0 +1,287 @@
+import struct
+import sys
+from array import array
+from enum import Enum
+from itertools import accumulate
+from common.dictionary import DICTIONARIES
+
+# Layout
+#   magic (2) | rows (4) | columns (2)
+#   and then, for every column:
+#   name length (1) | type (1) | data length (4) | name | data
+# The first magic byte (0xC0) is never valid at the start of an UTF-8 string,
+# so a columnar payload can not be mistaken for a CSV one.
+#
+# CODE and CODE_LIST columns hold codes of a common.dictionary.Dictionary:
+#   dictionary id (1) | extra names (2) | extra names as STRING | [list offsets] | uint16 codes
+# Codes of names outside the shared list are process local, so they travel as
+# shared size + position in the extra names and are interned again on decode.
+COLUMNAR_MAGIC = b"\xc0\x01"
+BATCH_HEADER = struct.Struct("<2sIH")
+COLUMN_HEADER = struct.Struct("<BBI")
+DICTIONARY_HEADER = struct.Struct("<BH")
+OFFSET_SIZE = 4
+LITTLE_ENDIAN = sys.byteorder == "little"
+
+
+class ColumnType(Enum):
+    INT = 1           # int64
+    FLOAT = 2         # float64
+    STRING = 3        # offsets + utf-8 data
+    STRING_LIST = 4   # list offsets + item offsets + utf-8 data
+    CODE_LIST = 5     # dictionary + list offsets + uint16 codes
+    CODE = 6          # dictionary + uint16 codes
+
+
+CODE_TYPES = (ColumnType.CODE, ColumnType.CODE_LIST)
+
+
+def date_to_int(date: str) -> int:
+    """'YYYY-MM-DD' -> YYYYMMDD. Missing parts count as 0, unparseable dates as 0"""
+    try:
+        parts = date.split('-')
+        year = int(parts[0])
+        month = int(parts[1]) if len(parts) > 1 else 0
+        day = int(parts[2]) if len(parts) > 2 else 0
+        return year * 10000 + month * 100 + day
+    except (ValueError, AttributeError):
+        return 0
+
+
+def year_of(date: int) -> int:
+    return date // 10000
+
+
+def _to_array(typecode, raw):
+    values = array(typecode)
+    values.frombytes(raw)
+    if not LITTLE_ENDIAN:
+        values.byteswap()
+    return values
+
+
+def _array_bytes(typecode, values):
+    values = array(typecode, values)
+    if not LITTLE_ENDIAN:
+        values.byteswap()
+    return values.tobytes()
+
+
+def _encode_strings(values):
+    encoded = [value.encode('utf-8') for value in values]
+    offsets = _array_bytes('I', accumulate((len(value) for value in encoded), initial=0))
+    return offsets + b"".join(encoded)
+
+
+def _decode_strings(raw, count):
+    offsets_end = (count + 1) * OFFSET_SIZE
+    offsets = _to_array('I', raw[:offsets_end])
+    data = bytes(raw[offsets_end:])
+    if data.isascii():
+        # Byte offsets are char offsets, slice the decoded text directly
+        text = data.decode('ascii')
+        return [text[offsets[i]:offsets[i + 1]] for i in range(count)]
+    return [data[offsets[i]:offsets[i + 1]].decode('utf-8') for i in range(count)]
+
+
+def _encode_codes(column_type, values, dictionary):
+    if column_type == ColumnType.CODE_LIST:
+        prefix = _array_bytes('I', accumulate((len(codes) for codes in values), initial=0))
+        codes = [code for row_codes in values for code in row_codes]
+    else:
+        prefix = b""
+        codes = values
+    extra = {}
+    if len(dictionary) > dictionary.shared_size:
+        shared_size = dictionary.shared_size
+        for code in codes:
+            if code >= shared_size and code not in extra:
+                extra[code] = shared_size + len(extra)
+        if extra:
+            codes = [extra.get(code, code) for code in codes]
+    header = DICTIONARY_HEADER.pack(dictionary.id, len(extra)) + _encode_strings(dictionary.decode(extra))
+    return header + prefix + _array_bytes('H', codes)
+
+
+def _decode_codes(column_type, raw, num_rows):
+    dictionary_id, extra_count = DICTIONARY_HEADER.unpack_from(raw)
+    dictionary = DICTIONARIES[dictionary_id]
+    position = DICTIONARY_HEADER.size
+    extra_end = position + (extra_count + 1) * OFFSET_SIZE
+    extra_end += _to_array('I', raw[extra_end - OFFSET_SIZE:extra_end])[0]
+    extra = _decode_strings(raw[position:extra_end], extra_count)
+    position = extra_end
+    if column_type == ColumnType.CODE_LIST:
+        lists_end = position + (num_rows + 1) * OFFSET_SIZE
+        lists_offsets = _to_array('I', raw[position:lists_end])
+        position = lists_end
+    codes = _to_array('H', raw[position:])
+    if extra:
+        local = dictionary.encode(extra)
+        shared_size = dictionary.shared_size
+        codes = [code if code < shared_size else local[code - shared_size] for code in codes]
+    if column_type == ColumnType.CODE:
+        return codes
+    return [tuple(codes[lists_offsets[i]:lists_offsets[i + 1]]) for i in range(num_rows)]
+
+
+def _encode_column(column_type, values, dictionary=None):
+    if dictionary is not None:
+        return _encode_codes(column_type, values, dictionary)
+    if column_type == ColumnType.INT:
+        return _array_bytes('q', values)
+    if column_type == ColumnType.FLOAT:
+        return _array_bytes('d', values)
+    if column_type == ColumnType.STRING:
+        return _encode_strings(values)
+    lists_offsets = _array_bytes('I', accumulate((len(items) for items in values), initial=0))
+    return lists_offsets + _encode_strings([item for items in values for item in items])
+
+
+def _decode_column(column_type, raw, num_rows):
+    if column_type in CODE_TYPES:
+        return _decode_codes(column_type, raw, num_rows)
+    if column_type == ColumnType.INT:
+        return _to_array('q', raw)
+    if column_type == ColumnType.FLOAT:
+        return _to_array('d', raw)
+    if column_type == ColumnType.STRING:
+        return _decode_strings(raw, num_rows)
+    lists_end = (num_rows + 1) * OFFSET_SIZE
+    lists_offsets = _to_array('I', raw[:lists_end])
+    items = _decode_strings(raw[lists_end:], lists_offsets[-1] if num_rows else 0)
+    return [tuple(items[lists_offsets[i]:lists_offsets[i + 1]]) for i in range(num_rows)]
+
+
+class Column:
+    """
+    A typed column. It keeps whichever representation it was created with
+    (python values or encoded bytes) and builds the other one on demand, so
+    columns that are only forwarded are never decoded. CODE and CODE_LIST
+    columns also know the dictionary of their codes.
+    """
+    __slots__ = ("name", "type", "dictionary", "_values", "_raw")
+
+    def __init__(self, name: str, column_type: ColumnType, values=None, raw=None, dictionary=None):
+        self.name = name
+        self.type = column_type
+        if dictionary is None and raw is not None and column_type in CODE_TYPES:
+            dictionary = DICTIONARIES[raw[0]]
+        self.dictionary = dictionary
+        self._values = values
+        self._raw = raw
+
+    @property
+    def values(self):
+        return self._values
+
+    def decode(self, num_rows):
+        if self._values is None:
+            self._values = _decode_column(self.type, self._raw, num_rows)
+        return self._values
+
+    def encode(self):
+        if self._raw is None:
+            self._raw = _encode_column(self.type, self._values, self.dictionary)
+        return self._raw
+
+
+class ColumnarBatch:
+    """
+    Batch of rows stored by column. Columns are only decoded when a controller
+    asks for them, so a stage that filters on two columns does not pay for
+    parsing the rest of the movie.
+    """
+
+    def __init__(self, num_rows: int = 0):
+        self.num_rows = num_rows
+        self._columns: dict[str, Column] = {}
+
+    def __len__(self):
+        return self.num_rows
+
+    @classmethod
+    def from_rows(cls, schema: list[tuple], rows):
+        """
+        Build a batch from rows whose values follow the order of the schema.
+        Schema entries are (name, type), or (name, type, dictionary) for codes
+        """
+        rows = list(rows)
+        batch = cls(len(rows))
+        columns = list(zip(*rows)) if rows else [() for _ in schema]
+        for (name, column_type, *dictionary), values in zip(schema, columns):
+            batch.add_column(name, column_type, list(values), *dictionary)
+        return batch
+
+    def add_column(self, name: str, column_type: ColumnType, values, dictionary=None):
+        if len(values) != self.num_rows:
+            raise ValueError(f"Column {name} has {len(values)} values, expected {self.num_rows}")
+        if (dictionary is None) != (column_type not in CODE_TYPES):
+            raise ValueError(f"Column {name} of type {column_type.name} needs a dictionary only for codes")
+        self._columns[name] = Column(name, column_type, values=values, dictionary=dictionary)
+        return self
+
+    @property
+    def column_names(self) -> list[str]:
+        return list(self._columns)
+
+    def column_type(self, name: str) -> ColumnType:
+        return self._columns[name].type
+
+    def column_dictionary(self, name: str):
+        return self._columns[name].dictionary
+
+    def column(self, name: str):
+        return self._columns[name].decode(self.num_rows)
+
+    def rows(self, *names):
+        """Iterate the given columns (all by default) as tuples, in the given order"""
+        return zip(*(self.column(name) for name in names or self._columns))
+
+    def select(self, *names):
+        """Projection. Encoded columns are shared, not re-encoded"""
+        batch = ColumnarBatch(self.num_rows)
+        for name in names:
+            batch._columns[name] = self._columns[name]
+        return batch
+
+    def take(self, indices, *names):
+        """Rows at the given positions, keeping only the given columns (all by default)"""
+        indices = list(indices)
+        batch = ColumnarBatch(len(indices))
+        for name in names or self._columns:
+            column = self._columns[name]
+            values = column.decode(self.num_rows)
+            batch._columns[name] = Column(name, column.type, values=[values[i] for i in indices], dictionary=column.dictionary)
+        return batch
+
+    def to_bytes(self) -> bytes:
+        parts = [BATCH_HEADER.pack(COLUMNAR_MAGIC, self.num_rows, len(self._columns))]
+        for column in self._columns.values():
+            name = column.name.encode('utf-8')
+            raw = column.encode()
+            parts.append(COLUMN_HEADER.pack(len(name), column.type.value, len(raw)))
+            parts.append(name)
+            parts.append(raw)
+        return b"".join(parts)
+
+    @classmethod
+    def from_bytes(cls, buffer):
+        view = memoryview(buffer)
+        magic, num_rows, num_columns = BATCH_HEADER.unpack_from(view)
+        if magic != COLUMNAR_MAGIC:
+            raise ValueError("Payload is not a columnar batch")
+        batch = cls(num_rows)
+        position = BATCH_HEADER.size
+        for _ in range(num_columns):
+            name_size, column_type, data_size = COLUMN_HEADER.unpack_from(view, position)
+            position += COLUMN_HEADER.size
+            name = str(view[position:position + name_size], 'utf-8')
+            position += name_size
+            batch._columns[name] = Column(name, ColumnType(column_type), raw=view[position:position + data_size])
+            position += data_size
+        return batch
+
+    @staticmethod
+    def is_columnar(buffer) -> bool:
+        return len(buffer) >= len(COLUMNAR_MAGIC) and bytes(buffer[:len(COLUMNAR_MAGIC)]) == COLUMNAR_MAGIC
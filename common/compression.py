@@ -0,0 +1,75 @@
+"""
+Compresion de los payloads de MiddlewareMessage. zlib esta siempre disponible;
+lz4 y zstd se usan solo si estan instalados los paquetes lz4 y zstandard, en
+el gateway y en los controllers que reciben los mensajes.
+"""
+import zlib
+
+try:
+    import lz4.frame as lz4_frame
+except ImportError:
+    lz4_frame = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+NO_COMPRESSION = 0
+ZLIB = 1
+LZ4 = 2
+ZSTD = 3
+
+CODECS = {
+    "zlib": ZLIB,
+    "lz4": LZ4,
+    "zstd": ZSTD,
+}
+# Orden de preferencia al negociar con el cliente
+PREFERENCE = ["zstd", "lz4", "zlib"]
+
+
+def is_available(codec: int) -> bool:
+    if codec == LZ4:
+        return lz4_frame is not None
+    if codec == ZSTD:
+        return zstandard is not None
+    return codec in (NO_COMPRESSION, ZLIB)
+
+
+def available_codecs() -> list[str]:
+    return [name for name in PREFERENCE if is_available(CODECS[name])]
+
+
+def negotiate(offered: str, allowed: list[str]) -> str | None:
+    """
+    Elige el codec para un cliente: el preferido entre los que ofrece el cliente
+    (nombres separados por coma), los permitidos por configuracion y los
+    disponibles en este proceso. None si no hay ninguno en comun
+    """
+    offered_codecs = {name.strip() for name in offered.split(",")}
+    for name in available_codecs():
+        if name in offered_codecs and name in allowed:
+            return name
+    return None
+
+
+def compress(codec: int, data: bytes) -> bytes:
+    if codec == ZLIB:
+        return zlib.compress(data)
+    if codec == LZ4:
+        return lz4_frame.compress(data)
+    if codec == ZSTD:
+        return zstandard.ZstdCompressor().compress(data)
+    raise ValueError(f"Unknown compression codec: {codec}")
+
+
+def decompress(codec: int, data: bytes | memoryview) -> bytes:
+    if codec == ZLIB:
+        return zlib.decompress(data)
+    if codec == LZ4:
+        return lz4_frame.decompress(data)
+    if codec == ZSTD:
+        # decompressobj no necesita que el frame tenga el tamaño original
+        return zstandard.ZstdDecompressor().decompressobj().decompress(data)
+    raise ValueError(f"Unknown compression codec: {codec}")
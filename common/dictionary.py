@@ -0,0 +1,120 @@
+"""
+Codificacion por diccionario de los paises, generos e idiomas de las peliculas.
+
+MoviesPreprocessor reemplaza cada nombre por un codigo entero chico y el resto
+del pipeline trabaja con los codigos: los filtros comparan mascaras de bits y
+los group by acumulan en listas indexadas por codigo. Los nombres se vuelven a
+buscar recien en los sinks.
+
+Cada diccionario empieza con una lista de nombres compartida por todos los
+procesos (los valores del dataset de TMDB), asi sus codigos significan lo mismo
+en todos los controllers. Las listas solo pueden crecer agregando nombres al
+final: cambiar el orden cambia el significado de los codigos en vuelo. Un
+nombre que no esta en la lista recibe un codigo local al proceso, y en los
+batches viaja como texto (ver ColumnType.CODE_LIST), asi que nunca se pierde
+mientras queden codigos libres: con la tabla llena los nombres nuevos reciben
+el codigo reservado de UNKNOWN_NAME, en lugar de fallar el mensaje.
+"""
+import logging
+
+GENRE_NAMES = (
+    "Action", "Adventure", "Animation", "Comedy", "Crime", "Documentary", "Drama",
+    "Family", "Fantasy", "Foreign", "History", "Horror", "Music", "Mystery",
+    "Romance", "Science Fiction", "TV Movie", "Thriller", "War", "Western",
+)
+
+COUNTRY_NAMES = (
+    "Argentina", "Spain", "United States of America", "United Kingdom", "France",
+    "Germany", "Italy", "Canada", "Japan", "India", "Australia", "Russia", "Mexico",
+    "China", "Hong Kong", "South Korea", "Sweden", "Denmark", "Belgium", "Netherlands",
+    "Brazil", "Ireland", "Switzerland", "Austria", "Norway", "Finland", "Poland",
+    "Czech Republic", "Hungary", "New Zealand", "South Africa", "Chile", "Colombia",
+    "Uruguay", "Venezuela", "Peru", "Portugal", "Greece", "Turkey", "Israel", "Iran",
+    "Taiwan", "Thailand", "Philippines", "Indonesia", "Singapore", "Soviet Union",
+    "Czechoslovakia", "Serbia", "Serbia and Montenegro", "Croatia", "Slovenia",
+    "Slovakia", "Bosnia and Herzegovina", "Macedonia", "Montenegro", "Albania",
+    "Romania", "Bulgaria", "Ukraine", "Georgia", "Armenia", "Kazakhstan", "Uzbekistan",
+    "Estonia", "Lithuania", "Luxembourg", "Iceland", "Egypt", "Morocco", "Tunisia",
+    "Lebanon", "Iraq", "United Arab Emirates", "Palestinian Territory", "Pakistan",
+    "Sri Lanka", "Cuba", "Dominican Republic", "Panama", "Guatemala", "Paraguay",
+    "Bolivia", "Bahamas", "Chad", "Cote D'Ivoire",
+)
+
+LANGUAGE_NAMES = (
+    "English", "Español", "Français", "Deutsch", "Italiano", "日本語", "Pусский",
+    "普通话", "Português", "한국어/조선말", "हिन्दी", "svenska", "Dansk", "Nederlands",
+    "Norsk", "suomi", "Polski", "Český", "Magyar", "ελληνικά", "Türkçe", "العربية",
+    "עִבְרִית", "فارسی", "ภาษาไทย", "广州话 / 廣州話", "Latin", "No Language", "",
+    "Afrikaans", "Bahasa indonesia", "Bosanski", "Català", "Cymraeg", "Eesti",
+    "Esperanto", "Gaeilge", "Hrvatski", "Malti", "Română", "Slovenčina",
+    "Slovenščina", "Srpski", "Tiếng Việt", "euskera", "shqip", "Íslenska",
+    "Український", "български език", "اردو", "বাংলা", "ਪੰਜਾਬੀ", "தமிழ்",
+    "తెలుగు", "ქართული",
+)
+
+MAX_CODES = 1 << 16  # Los codigos viajan como uint16
+MAX_CACHED_MASKS = 100_000
+UNKNOWN_NAME = "<unknown>"  # Nombre de los codigos que ya no entran en la tabla
+
+
+class Dictionary:
+
+    def __init__(self, dictionary_id: int, shared_names):
+        self.id = dictionary_id
+        self.names = list(shared_names)
+        self.shared_size = len(self.names)
+        self.codes = {name: code for code, name in enumerate(self.names)}
+        # Las mismas combinaciones de codigos se repiten en muchas peliculas: se cachea su mascara
+        self.masks = {}
+
+    def __len__(self):
+        return len(self.names)
+
+    def code(self, name: str) -> int:
+        """Codigo del nombre. Los nombres fuera de la lista compartida se agregan con un codigo local"""
+        code = self.codes.get(name)
+        if code is None:
+            if len(self.names) >= MAX_CODES - 1:
+                return self.unknown_code()
+            code = self.codes[name] = len(self.names)
+            self.names.append(name)
+        return code
+
+    def unknown_code(self) -> int:
+        """Codigo de UNKNOWN_NAME, el ultimo de la tabla, para los nombres que ya no tienen lugar"""
+        code = self.codes.get(UNKNOWN_NAME)
+        if code is None:
+            logging.warning(f"action: dictionary_full | dictionary: {self.id} | new names are coded as {UNKNOWN_NAME}")
+            code = self.codes[UNKNOWN_NAME] = len(self.names)
+            self.names.append(UNKNOWN_NAME)
+        return code
+
+    def encode(self, names) -> tuple:
+        return tuple(self.code(name) for name in names)
+
+    def name(self, code: int) -> str:
+        return self.names[code]
+
+    def decode(self, codes) -> tuple:
+        return tuple(self.names[code] for code in codes)
+
+    def mask(self, codes) -> int:
+        """Conjunto de codigos como bits de un entero"""
+        mask = self.masks.get(codes)
+        if mask is None:
+            if len(self.masks) >= MAX_CACHED_MASKS:
+                self.masks.clear()
+            mask = 0
+            for code in codes:
+                mask |= 1 << code
+            self.masks[codes] = mask
+        return mask
+
+    def mask_of(self, names) -> int:
+        return self.mask(self.encode(names))
+
+
+GENRES = Dictionary(1, GENRE_NAMES)
+COUNTRIES = Dictionary(2, COUNTRY_NAMES)
+LANGUAGES = Dictionary(3, LANGUAGE_NAMES)
+DICTIONARIES = {dictionary.id: dictionary for dictionary in (GENRES, COUNTRIES, LANGUAGES)}
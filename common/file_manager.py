@@ -1,61 +1,161 @@
 import csv
+import io
 import os
+import struct
+import zlib
 from typing import List, Iterator, Any
 import logging
 import json
-# from .utils import md5sum
-import subprocess
+
+# Log de segmentos: cada batch guardado es un registro
+#   length (4) | crc32 (4) | filas del batch en csv
+# El archivo solo crece con append. Si el nodo se cae a mitad de una escritura
+# el ultimo registro queda incompleto o con un crc invalido, y se trunca al
+# recuperar el archivo.
+RECORD_HEADER = struct.Struct("<II")
+
 
 class FileManager:
+    # Logs ya recuperados por este proceso, antes de hacerles append
+    recovered_logs = set()
+    # Archivos escritos sin fsync, pendientes del proximo sync_pending (group commit)
+    pending_syncs = set()
+
     def __init__(self, path):
         self.path = path
         self.tmp_path = path + '.tmp'
 
-    def save_data(self, filename, new_data):
+    def save_data(self, filename, new_data, sync=True):
         """
-        Atomically append data to a file with proper disk flushing.
-        
+        Append a batch of rows as a new record of the segment log and flush it to disk.
+
         Args:
             filename: Target file to append to
             new_data: List of rows to append
+            sync: fsync now, or leave it for the next sync_pending
+        Returns:
+            The checksum of the log after the append (see get_file_hash)
+        """
+        output = io.StringIO()
+        writer = csv.writer(output, quoting=csv.QUOTE_MINIMAL)
+        writer.writerows(new_data)
+        return self.append_record(output.getvalue().encode('utf-8'), filename, sync)
+
+    def replace_data(self, filename, new_data, sync=True):
         """
-        ## checkpoints and 
-        # Cambiar a modo append y revisar lineas con errores
-        """ 
-        TODO: Hacer append en vez de crear un nuevo archivo y remplazarlo. En caso de falla,
-            chequear el ultimo batch a ver si es el mismo que tengo para ver si es duplicado.
-            
+        Reemplaza el log por uno nuevo con las filas dadas en un solo registro
+        (escrito aparte y renombrado, asi una caida deja el log anterior o el nuevo).
+        Devuelve el checksum del log nuevo.
         """
-        with open(self.tmp_path, 'w+') as tmp_file:
-            # Copy original file if it exists
+        tmp_filename = filename + '.tmp'
+        if os.path.exists(tmp_filename):
+            os.remove(tmp_filename)
+        self.recovered_logs.add(tmp_filename)
+        checksum = self.save_data(tmp_filename, new_data, sync)
+        os.rename(tmp_filename, filename)
+        self.recovered_logs.discard(tmp_filename)
+        self.pending_syncs.discard(tmp_filename)
+        self.recovered_logs.add(filename)
+        # El rename se hace durable con el fsync del directorio
+        self.pending_syncs.add(filename)
+        return checksum
+
+    def append_record(self, payload: bytes, filename=None, sync=True):
+        """Append a raw record to the log (self.path by default) and return its checksum"""
+        filename = filename or self.path
+        if filename not in self.recovered_logs:
+            self.recover(filename)
+        crc = zlib.crc32(payload)
+        with open(filename, 'ab') as log:
+            log.write(RECORD_HEADER.pack(len(payload), crc) + payload)
+            log.flush()
+            if sync:
+                os.fsync(log.fileno())
+            else:
+                self.pending_syncs.add(filename)
+            return self.log_checksum(log.tell(), crc)
+
+    @classmethod
+    def sync_pending(cls):
+        """
+        Hace durables de una vez todas las escrituras hechas con sync=False: un fsync
+        por archivo y uno por directorio (archivos nuevos, renames y truncados).
+        """
+        files, cls.pending_syncs = cls.pending_syncs, set()
+        directories = {os.path.dirname(file) or '.' for file in files}
+        for file in files:
             try:
-                with open(filename, 'r') as original:
-                    tmp_file.write(original.read())
+                fd = os.open(file, os.O_RDONLY)
             except FileNotFoundError:
-                # File doesn't exist yet, that's fine for append
-                pass
-            
-            # Append the new data
-            writer = csv.writer(tmp_file, quoting=csv.QUOTE_MINIMAL)
-            writer.writerows(new_data)
-            
-            # Ensure data is written to disk
-            tmp_file.flush()
-            os.fsync(tmp_file.fileno())
-        
-        # Atomic replacement
-        os.rename(self.tmp_path, filename)
-        return self.md5sum_system(filename)
+                continue  # Se borro despues de escribirlo
+            try:
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+        for directory in directories:
+            fd = os.open(directory, os.O_RDONLY)
+            try:
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+
+    def records(self) -> Iterator[bytes]:
+        """Payloads of the valid records of the log, in order"""
+        try:
+            for _, _, payload in self.scan_records(self.path):
+                yield payload
+        except FileNotFoundError:
+            return
+
+    @staticmethod
+    def log_checksum(size, last_crc):
+        """Tamaño del log y crc de su ultimo registro: cambia con cada batch guardado"""
+        return f"{size}-{last_crc:08x}"
 
     @classmethod
-    def md5sum_system(cls, filename):
-        result = subprocess.run(['md5sum', filename], capture_output=True, text=True)
-        return result.stdout.split()[0]
-    
+    def scan_records(cls, filename) -> Iterator[tuple[int, int, bytes]]:
+        """
+        Itera (fin del registro, crc, payload) de los registros validos del log.
+        Se detiene en el primer registro incompleto o corrupto.
+        """
+        with open(filename, 'rb') as log:
+            position = 0
+            while True:
+                header = log.read(RECORD_HEADER.size)
+                if len(header) < RECORD_HEADER.size:
+                    return
+                length, crc = RECORD_HEADER.unpack(header)
+                payload = log.read(length)
+                if len(payload) < length or zlib.crc32(payload) != crc:
+                    return
+                position += RECORD_HEADER.size + length
+                yield position, crc, payload
+
+    @classmethod
+    def recover(cls, filename):
+        """
+        Trunca la cola rota del log, si la hay, y devuelve su checksum.
+        Devuelve None si el archivo no existe o no tiene registros.
+        """
+        cls.recovered_logs.add(filename)
+        end, last_crc = 0, None
+        try:
+            for end, last_crc, _ in cls.scan_records(filename):
+                pass
+            if os.path.getsize(filename) != end:
+                logging.warning(f"action: recover_log | file: {filename} | result: truncated | size: {end}")
+                with open(filename, 'r+b') as log:
+                    log.truncate(end)
+                    log.flush()
+                    os.fsync(log.fileno())
+        except FileNotFoundError:
+            return None
+        return None if last_crc is None else cls.log_checksum(end, last_crc)
+
     @classmethod
     def get_file_hash(self, filename):
         try:
-            return self.md5sum_system(filename)
+            return self.recover(filename)
         except Exception as e:
             logging.error(f"Error getting file hash for {filename}: {str(e)}")
             return None
@@ -68,10 +168,8 @@ class FileManager:
             An iterator that yields rows from the file.
         """
         try:
-            with open(self.path, 'r') as f:
-                reader = csv.reader(f)
-                for row in reader:
-                    yield row
+            for payload in self.records():
+                yield from csv.reader(io.StringIO(payload.decode('utf-8')))
         except (FileNotFoundError, IOError):
             return iter([])  # Return an empty iterator if the file does not exist or there is an I/O error
         
@@ -79,6 +177,8 @@ class FileManager:
     def clean_temp_files(self, files_to_remove):
         """Elimina los archivos temporales creados para un cliente"""
         for file in files_to_remove:
+            self.recovered_logs.discard(file)
+            self.pending_syncs.discard(file)
             try:
                 if os.path.exists(file):
                     os.remove(file)
@@ -96,8 +196,13 @@ class FileManager:
         except (FileNotFoundError, json.JSONDecodeError) as e:
             return {}
         
-    def save_state(self, data):
+    def save_state(self, data, sync=False):
         with open(self.tmp_path, 'w+') as f:
             f.write(data)
             f.flush()
+            if sync:
+                # Antes del rename, para no dejar un archivo vacio despues de una caida
+                os.fsync(f.fileno())
         os.rename(self.tmp_path, self.path)
+        if sync:
+            self.pending_syncs.add(self.path)
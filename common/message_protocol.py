@@ -6,15 +6,43 @@ class MessageProtocol:
         self.type_message = ClientCommunication(typeMessage)
         self.payload = payload
 
-    def encodeMessageBytes(self) -> bytes:
-        if self.payload is None:
-            return bytes([self.type_message.value])
+    @property
+    def payload(self) -> str | None:
+        """Payload as text, decoded from the received buffer on first access"""
+        if self._payload is None and self._payload_view is not None:
+            self._payload = str(self._payload_view, 'utf-8')
+        return self._payload
+
+    @payload.setter
+    def payload(self, value):
+        if value is None or isinstance(value, str):
+            self._payload = value
+            self._payload_view = None
         else:
-            return bytes([self.type_message.value]) + self.payload.encode('utf-8')
-    
+            self._payload = None
+            self._payload_view = memoryview(value)
+
+    @property
+    def payload_bytes(self) -> bytes | memoryview:
+        """Payload as raw bytes, without going through str when it was never decoded"""
+        if self._payload_view is None:
+            self._payload_view = memoryview(self._payload.encode('utf-8') if self._payload is not None else b"")
+        return self._payload_view
+
+    def encodeMessageBytes(self) -> bytes:
+        return bytes([self.type_message.value]) + self.payload_bytes
+
     @classmethod
-    def decodeMessageBytes(cls, messageBytes):
+    def decodeMessageBytes(cls, messageBytes, copy_payload=False):
+        """
+        Decodes a message without copying its payload: it stays as a view over
+        messageBytes and is decoded to str on first access. With copy_payload it
+        is decoded right away, for buffers that are going to be reused
+        """
         # idClient = messageBytes[0]
-        typeMessage = messageBytes[0]
-        payload = messageBytes[1:].decode('utf-8')
-        return cls(typeMessage, payload)
\ No newline at end of file
+        view = memoryview(messageBytes)
+        typeMessage = view[0]
+        payload = view[1:]
+        if copy_payload:
+            payload = str(payload, 'utf-8')
+        return cls(typeMessage, payload)
@@ -1,27 +1,61 @@
 from typing import Callable
+from itertools import groupby
 import pika
 import logging
 
+DEFAULT_FLUSH_INTERVAL = 0.05  # segundos
+
 class RabbitMQConnectionHandler:
     def __init__(self, 
                  producer_exchange_name: str | None, 
                  producer_queues_to_bind: dict[str,list[str]] | None, 
                  consumer_exchange_name: str | None, 
                  consumer_queues_to_recv_from: list[str] | None,
-                 secondary_consumer_exchange_name: str | None = None
+                 secondary_consumer_exchange_name: str | None = None,
+                 publisher_batch_size: int = 1,
+                 publisher_flush_interval: float = DEFAULT_FLUSH_INTERVAL,
+                 prefetch_count: int = 1,
+                 group_commit_size: int = 1
                  ):
         self.connection = pika.BlockingConnection(pika.ConnectionParameters(host='rabbitmq', heartbeat=3600))
         self.channel = self.connection.channel()
+        self.producer_exchange_name = None
+
+        # Publicacion en lotes: con publisher_batch_size > 1 el canal pasa a modo
+        # transaccional y las publicaciones y acks de hasta publisher_batch_size
+        # mensajes consumidos se confirman juntos en un solo tx_commit, en lugar
+        # de esperar la confirmacion del broker en cada basic_publish.
+        self.publisher_batch_size = max(1, publisher_batch_size)
+        self.publisher_flush_interval = publisher_flush_interval
+        self.pending_publishes = 0
+        self.pending_acks = 0
+        self.last_delivery_tag = None
+        self.before_ack_callbacks: list[Callable] = []
+        self.flush_timer = None
+        # Group commit: con group_commit_size > 1 los acks se difieren aunque no se
+        # publique en lotes, para que las escrituras a disco de varios mensajes
+        # se hagan durables con un solo fsync antes de confirmarlos (ver run_on_flush)
+        self.group_commit_size = max(1, group_commit_size)
+        self.ack_window = max(self.publisher_batch_size, self.group_commit_size)
+
+        # Consumo en lotes: mensajes recibidos todavia no entregados al callback,
+        # en orden de llegada (ver set_batch_message_consumer_callback)
+        self.consume_batch = []
+        self.consume_batch_size = 1
+        self.consume_timer = None
+        # Los acks diferidos necesitan que el broker entregue al menos la ventana completa
+        self.prefetch_count = max(1, prefetch_count, self.ack_window)
 
         if producer_exchange_name is not None:
             self.__configure_producer_bindings(producer_exchange_name, producer_queues_to_bind)
         if consumer_exchange_name is not None:
             self.__configure_consumer_queues(consumer_exchange_name, consumer_queues_to_recv_from, secondary_consumer_exchange_name)
         
-        # Aumentar el prefetch_count para permitir que cada worker reciba múltiples mensajes
-        # Esto permite mejor distribución de carga entre los workers
-        self.channel.basic_qos(prefetch_count=1)  # Aumentamos de 1 a 10
-        self.channel.confirm_delivery()
+        self.channel.basic_qos(prefetch_count=self.prefetch_count)
+        if self.batches_publishes():
+            self.channel.tx_select()
+        else:
+            self.channel.confirm_delivery()
 
     def __configure_consumer_queues(self, 
                               consumer_exchange_name: str, 
@@ -53,25 +87,170 @@ class RabbitMQConnectionHandler:
         # Cambiamos auto_ack a False para confirmar manualmente los mensajes
         self.channel.basic_consume(queue=queue_name, on_message_callback=self._wrap_callback(main_callback), auto_ack=False)
 
+    def set_batch_message_consumer_callback(self,
+                                            queue_name: str,
+                                            batch_callback: Callable,
+                                            batch_size: int):
+        """
+        Entrega los mensajes de la cola de a lotes de hasta batch_size:
+        batch_callback(ch, messages) con messages una lista de (method, properties, body)
+        en orden de llegada. El lote completo se confirma con un solo ack multiple=True,
+        por lo que el callback tiene que persistir su estado una vez antes de retornar.
+        Un lote incompleto se entrega igual cuando la cola queda inactiva.
+        """
+        self.consume_batch_size = max(self.consume_batch_size, batch_size)
+        if self.consume_batch_size > self.prefetch_count:
+            self.prefetch_count = self.consume_batch_size
+            self.channel.basic_qos(prefetch_count=self.prefetch_count)
+        self.channel.basic_consume(queue=queue_name, on_message_callback=self._buffer_callback(batch_callback), auto_ack=False)
+
     # Añadimos un wrapper para el callback que confirma el mensaje después de procesarlo
     def _wrap_callback(self, callback):
         def wrapped_callback(ch, method, properties, body):
-            try:
-                # Llamamos al callback original
-                callback(ch, method, properties, body)
-                # Confirmamos el mensaje después del procesamiento exitoso
-                ch.basic_ack(delivery_tag=method.delivery_tag)
-            except Exception as e:
-                # En caso de error, rechazamos el mensaje y lo volvemos a encolar
-                ch.basic_nack(delivery_tag=method.delivery_tag, requeue=True)
-                raise e
+            # Llamamos al callback original
+            self.__process(lambda: callback(ch, method, properties, body), method.delivery_tag, 1)
         return wrapped_callback
 
+    def _buffer_callback(self, batch_callback):
+        def buffered_callback(ch, method, properties, body):
+            self.consume_batch.append((batch_callback, method, properties, body))
+            if len(self.consume_batch) >= self.consume_batch_size:
+                self.dispatch_consume_batch()
+            elif self.consume_timer is None:
+                self.consume_timer = self.connection.call_later(self.publisher_flush_interval, self.__on_consume_timer)
+        return buffered_callback
+
+    def dispatch_consume_batch(self):
+        """Entrega los mensajes acumulados, agrupando los consecutivos de una misma cola"""
+        if self.consume_timer is not None:
+            self.connection.remove_timeout(self.consume_timer)
+            self.consume_timer = None
+        messages, self.consume_batch = self.consume_batch, []
+        groups = [
+            (batch_callback, [(method, properties, body) for _, method, properties, body in group])
+            for batch_callback, group in groupby(messages, key=lambda message: message[0])
+        ]
+        for position, (batch_callback, batch) in enumerate(groups):
+            try:
+                self.__process(lambda: batch_callback(self.channel, batch), batch[-1][0].delivery_tag, len(batch))
+            except Exception:
+                # Los grupos siguientes ya salieron de consume_batch: se devuelven a la cola
+                # para que no queden sin ack hasta que se cierre el canal
+                remaining = [message for _, later_batch in groups[position + 1:] for message in later_batch]
+                if remaining:
+                    self.channel.basic_nack(delivery_tag=remaining[-1][0].delivery_tag, multiple=True, requeue=True)
+                    if self.batches_publishes():
+                        self.channel.tx_commit()
+                raise
+
+    def __process(self, callback, delivery_tag, count):
+        """Ejecuta el callback y confirma los count mensajes que terminan en delivery_tag"""
+        try:
+            callback()
+        except Exception as e:
+            # Lo procesado antes en la ventana es valido, se confirma antes del nack
+            self.flush()
+            # En caso de error, rechazamos el mensaje y lo volvemos a encolar
+            self.channel.basic_nack(delivery_tag=delivery_tag, multiple=count > 1, requeue=True)
+            if self.batches_publishes():
+                self.channel.tx_commit()
+            raise e
+        if not self.defers_acks():
+            # Confirmamos el mensaje después del procesamiento exitoso
+            self.channel.basic_ack(delivery_tag=delivery_tag, multiple=count > 1)
+            return
+        # El ack se difiere hasta que se confirmen las publicaciones que generó
+        # y se hagan durables sus escrituras
+        self.last_delivery_tag = delivery_tag
+        self.pending_acks += count
+        if self.pending_acks >= self.ack_window or self.pending_publishes >= self.publisher_batch_size:
+            self.flush()
+        elif self.flush_timer is None:
+            self.flush_timer = self.connection.call_later(self.publisher_flush_interval, self.__on_flush_timer)
+
+    def batches_publishes(self) -> bool:
+        return self.publisher_batch_size > 1
+
+    def defers_acks(self) -> bool:
+        return self.ack_window > 1
+
+    def run_before_ack(self, callback: Callable):
+        """
+        Registra una funcion a ejecutar en el proximo flush, despues de confirmar las
+        publicaciones y antes de hacer ack de los mensajes consumidos (ej: persistir estado).
+        Sin publicacion en lotes se ejecuta en el momento.
+        """
+        if not self.batches_publishes():
+            callback()
+        else:
+            self.run_on_flush(callback)
+
+    def run_on_flush(self, callback: Callable):
+        """
+        Registra una funcion a ejecutar en el proximo flush, antes del ack de los mensajes
+        consumidos, aunque no se publique en lotes (ej: fsync de lo escrito por esos mensajes).
+        Sin acks diferidos se ejecuta en el momento.
+        """
+        if not self.defers_acks():
+            callback()
+        elif callback not in self.before_ack_callbacks:
+            self.before_ack_callbacks.append(callback)
+
+    def flush(self):
+        """Confirma las publicaciones pendientes y luego hace ack de los mensajes que las generaron"""
+        if not self.defers_acks():
+            return
+        if self.consume_batch:
+            # Un ack multiple=True cubriria tambien a los mensajes sin procesar
+            self.dispatch_consume_batch()
+        if self.flush_timer is not None:
+            self.connection.remove_timeout(self.flush_timer)
+            self.flush_timer = None
+        if self.pending_publishes:
+            self.channel.tx_commit()
+            self.pending_publishes = 0
+        callbacks, self.before_ack_callbacks = self.before_ack_callbacks, []
+        for callback in callbacks:
+            callback()
+        if self.last_delivery_tag is not None:
+            self.channel.basic_ack(delivery_tag=self.last_delivery_tag, multiple=True)
+            if self.batches_publishes():
+                self.channel.tx_commit()
+            self.last_delivery_tag = None
+            self.pending_acks = 0
+
+    def __on_flush_timer(self):
+        self.flush_timer = None
+        self.flush()
+
+    def __on_consume_timer(self):
+        self.consume_timer = None
+        self.dispatch_consume_batch()
+
     def start_consuming(self):
         self.channel.start_consuming()
 
-    def send_message(self, routing_key: str, msg_body: str):
-        self.channel.basic_publish(exchange=self.producer_exchange_name, routing_key=routing_key, body=msg_body, properties=pika.BasicProperties(delivery_mode=pika.DeliveryMode.Persistent), mandatory=True)
+    def queue_depth(self, queue_name: str) -> int:
+        """Mensajes listos en la cola (sin los entregados sin ack), con un queue_declare pasivo"""
+        try:
+            return self.channel.queue_declare(queue=queue_name, passive=True).method.message_count
+        except pika.exceptions.ChannelClosedByBroker:
+            # La cola todavia no existe: el broker cierra el canal y hay que abrir otro
+            self.channel = self.connection.channel()
+            return 0
+
+    def declare_queue(self, queue_name: str):
+        self.channel.queue_declare(queue=queue_name, durable=True)
+
+    def send_message(self, routing_key: str, msg_body: bytes, exchange: str | None = None):
+        """Publica en el exchange del productor, o en exchange si se indica ("" publica directo a la cola routing_key)"""
+        exchange = self.producer_exchange_name if exchange is None else exchange
+        # Con confirm_delivery un mensaje sin cola destino hace fallar basic_publish (UnroutableError).
+        # En modo transaccional el basic.return llega aparte, despues de confirmar el lote:
+        # no se pide mandatory, las colas destino se declaran y enlazan en el constructor
+        self.channel.basic_publish(exchange=exchange, routing_key=routing_key, body=msg_body, properties=pika.BasicProperties(delivery_mode=pika.DeliveryMode.Persistent), mandatory=not self.batches_publishes())
+        if self.batches_publishes():
+            self.pending_publishes += 1
 
     def close_connection(self):
         self.channel.stop_consuming()
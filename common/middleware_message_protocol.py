@@ -1,10 +1,32 @@
 import csv
 from enum import Enum
 import io
+import struct
+from common.columnar_batch import ColumnarBatch
+from common.compression import NO_COMPRESSION, decompress
 from common.defines import QueryNumber
 
 SEPARATOR = "<|>"
 
+# Binary framing
+#   magic (1) | version (1) | query_number (1) | seq_number (8) | client_id (16)
+#   | type (1) | controller_name length (1) | payload length (4)
+#   | controller_name | payload
+# The magic byte can never be the first byte of a legacy text message (those
+# always start with the ASCII digits of the query number), so both formats can
+# coexist in the same queue while the controllers are being upgraded.
+#
+# Version 2 adds a flags byte after the version, whose low bits are the codec
+# the payload is compressed with (see common/compression.py). Messages without
+# flags are still encoded as version 1.
+WIRE_MAGIC = 0xB7
+WIRE_VERSION = 1
+WIRE_HEADER = struct.Struct("!BBBQ16sBBI")
+WIRE_VERSION_FLAGS = 2
+WIRE_HEADER_FLAGS = struct.Struct("!BBBBQ16sBBI")
+COMPRESSION_MASK = 0x03
+CLIENT_ID_SIZE = 16
+
 class MiddlewareMessageType(Enum):
     MOVIES_BATCH = 1
     RATINGS_BATCH = 2
@@ -13,7 +35,7 @@ class MiddlewareMessageType(Enum):
     EOF_RATINGS = 5
     EOF_CREDITS = 6
     RESULT_Q1 = 7
-    RESULT_Q2 = 8 
+    RESULT_Q2 = 8
     RESULT_Q3 = 9
     RESULT_Q4 = 10
     RESULT_Q5 = 11
@@ -24,33 +46,137 @@ class MiddlewareMessageType(Enum):
     EOF_RESULT_Q4 = 16
     EOF_RESULT_Q5 = 17
     ABORT = 18
+    HANDOFF = 19
+    REBALANCE_DONE = 20
+    MOVIES_FILTER = 21
 
 class MiddlewareMessage:
-    def __init__(self, query_number: int, client_id: int, seq_number: int, type: MiddlewareMessageType, payload: str = "", controller_name: str = ""):
+    def __init__(self, query_number: int, client_id: int, seq_number: int, type: MiddlewareMessageType, payload: str | bytes | memoryview = "", controller_name: str = "", compression: int = NO_COMPRESSION):
+        """compression: codec with which payload is already compressed"""
         self.query_number = QueryNumber(query_number)
         self.client_id = client_id
         self.seq_number = seq_number
         self.type = type
         self.controller_name = controller_name
         self.payload = payload
+        if compression != NO_COMPRESSION:
+            self._compressed_view = self.payload_bytes
+            self._payload_view = None
+            self.compression = compression
+
+    @property
+    def payload(self) -> str:
+        """Payload as text, decoded from the received buffer on first access"""
+        if self._payload is None:
+            self._payload = str(self.payload_bytes, 'utf-8')
+        return self._payload
+
+    @payload.setter
+    def payload(self, value):
+        if isinstance(value, str):
+            self._payload = value
+            self._payload_view = None
+        else:
+            self._payload = None
+            self._payload_view = memoryview(value)
+        self._compressed_view = None
+        self.compression = NO_COMPRESSION
+
+    @property
+    def payload_bytes(self) -> bytes | memoryview:
+        """Payload as raw bytes, without going through str when it was never decoded"""
+        if self._payload_view is None:
+            if self._compressed_view is not None:
+                # Se descomprime recien cuando el controller lee el payload
+                self._payload_view = memoryview(decompress(self.compression, self._compressed_view))
+            else:
+                self._payload_view = memoryview(self._payload.encode('utf-8'))
+        return self._payload_view
+
+    def encode_to_bytes(self) -> bytes:
+        controller_name = self.controller_name.encode('utf-8')
+        client_id = self.client_id.to_bytes(CLIENT_ID_SIZE, byteorder='big')
+        if self._compressed_view is not None:
+            # Un payload comprimido se reenvia tal cual, sin descomprimirlo
+            payload = self._compressed_view
+            header = WIRE_HEADER_FLAGS.pack(
+                WIRE_MAGIC,
+                WIRE_VERSION_FLAGS,
+                self.compression & COMPRESSION_MASK,
+                self.query_number.value,
+                self.seq_number,
+                client_id,
+                self.type.value,
+                len(controller_name),
+                len(payload),
+            )
+            return b"".join((header, controller_name, payload))
+        payload = self.payload_bytes
+        header = WIRE_HEADER.pack(
+            WIRE_MAGIC,
+            WIRE_VERSION,
+            self.query_number.value,
+            self.seq_number,
+            client_id,
+            self.type.value,
+            len(controller_name),
+            len(payload),
+        )
+        return b"".join((header, controller_name, payload))
 
     def encode_to_str(self) -> str:
+        """Legacy text encoding, kept for peers that still speak the "<|>" format"""
         return f"{self.query_number.value}{SEPARATOR}{self.client_id}{SEPARATOR}{self.seq_number}{SEPARATOR}{self.controller_name}{SEPARATOR}{self.type.value}{SEPARATOR}{self.payload}"
-    
+
     @classmethod
     def decode_from_bytes(cls, raw_msg_body: bytes):
-        msg = raw_msg_body.decode()
-        query_number, client_id, seq_number, controller_name, msg_type, payload  = msg.split(f"{SEPARATOR}")
+        if len(raw_msg_body) > 0 and raw_msg_body[0] == WIRE_MAGIC:
+            return cls.__decode_binary(raw_msg_body)
+        return cls.__decode_text(raw_msg_body)
+
+    @classmethod
+    def __decode_binary(cls, raw_msg_body: bytes):
+        view = memoryview(raw_msg_body)
+        version = view[1]
+        if version == WIRE_VERSION:
+            _, _, query_number, seq_number, client_id, msg_type, name_size, payload_size = WIRE_HEADER.unpack_from(view)
+            flags = 0
+            name_start = WIRE_HEADER.size
+        elif version == WIRE_VERSION_FLAGS:
+            _, _, flags, query_number, seq_number, client_id, msg_type, name_size, payload_size = WIRE_HEADER_FLAGS.unpack_from(view)
+            name_start = WIRE_HEADER_FLAGS.size
+        else:
+            raise ValueError(f"Unsupported middleware message version: {version}")
+        payload_start = name_start + name_size
+        payload_end = payload_start + payload_size
+        if payload_end != len(view):
+            raise ValueError(f"Truncated middleware message: expected {payload_end} bytes, got {len(view)}")
+        controller_name = str(view[name_start:payload_start], 'utf-8')
+
+        return cls(QueryNumber(query_number), int.from_bytes(client_id, byteorder='big'), seq_number, MiddlewareMessageType(msg_type), view[payload_start:payload_end], controller_name, flags & COMPRESSION_MASK)
+
+    @classmethod
+    def __decode_text(cls, raw_msg_body: bytes):
+        msg = bytes(raw_msg_body).decode()
+        query_number, client_id, seq_number, controller_name, msg_type, payload  = msg.split(f"{SEPARATOR}", 5)
 
         return cls(QueryNumber(int(query_number)), int(client_id), int(seq_number), MiddlewareMessageType(int(msg_type)), payload, controller_name)
 
     def get_batch_iter_from_payload(self):
         return csv.reader(io.StringIO(self.payload), delimiter=',', quotechar='"')
-        
+
+    def get_columnar_batch(self) -> ColumnarBatch:
+        """Typed batch sent between controllers. Columns are decoded on first access"""
+        return ColumnarBatch.from_bytes(self.payload_bytes)
+
     @classmethod
     def write_csv_batch(self, batch):
+        """
+        Serializa filas de resultados en el formato que espera el cliente: todos los
+        campos entre comillas, asi el gateway las reenvia sin volver a parsearlas
+        """
         output = io.StringIO()
-        csv_writer = csv.writer(output, quoting=csv.QUOTE_NONNUMERIC, quotechar='"')
+        csv_writer = csv.writer(output, quoting=csv.QUOTE_ALL, quotechar='"')
         csv_writer.writerows(batch)
         return output.getvalue().strip()
-        
\ No newline at end of file
+
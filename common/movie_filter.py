@@ -0,0 +1,99 @@
+"""
+Filtros de las peliculas de cada cliente entre los joiners por id de pelicula y
+los preprocessors que les envian ratings o credits.
+
+Cuando un joiner recibe todas las peliculas de un cliente publica un filtro de
+Bloom con sus ids (mensaje MOVIES_FILTER) a todos los preprocessors. Como cada
+preprocessor elige el joiner de cada fila con el mismo anillo, puede descartar
+las filas que van a un joiner cuyo filtro no tiene la pelicula. Mientras no
+llega el filtro de un joiner, sus filas se envian todas como antes; los filtros
+solo se guardan en memoria, asi que tras un reinicio tambien.
+"""
+import logging
+import struct
+from collections import OrderedDict
+from common.bloom_filter import BloomFilter, DEFAULT_ERROR_RATE
+from common.middleware_message_protocol import MiddlewareMessage, MiddlewareMessageType
+
+# nodo del joiner (2) | nodos del anillo (2) | filtro de Bloom
+FILTER_HEADER = struct.Struct("!HH")
+# Clientes con filtros en memoria: los filtros que llegan despues del EOF del
+# cliente no se pueden distinguir de los que llegan antes que sus filas
+MAX_FILTERED_CLIENTS = 1000
+
+
+class MovieFilterPublisher:
+    """
+    Publicacion de los filtros desde un joiner. Las subclases definen
+    movie_filter_routing_key y joined_movie_ids(client_id), y llaman a
+    init_movie_filter en el constructor.
+    """
+    movie_filter_routing_key = None
+
+    def init_movie_filter(self, error_rate=DEFAULT_ERROR_RATE):
+        self.movie_filter_error_rate = error_rate
+
+    @staticmethod
+    def movie_filter_queues(routing_key, number_producers):
+        """Cola de cada productor, todas con la misma clave: cada filtro llega a todos"""
+        return {f"{routing_key}_queue_{i}": [routing_key] for i in range(number_producers)}
+
+    def publish_movie_filter(self, client_id):
+        if not self.movie_filter_error_rate:
+            return
+        if self.pending_rebalance:
+            return  # Todavia pueden llegar peliculas de otros joiners, se publica al terminar la migracion
+        movie_ids = self.joined_movie_ids(client_id)
+        bloom = BloomFilter.from_keys(movie_ids, self.movie_filter_error_rate)
+        msg = MiddlewareMessage(
+            query_number=self.handoff_query_number,
+            client_id=client_id,
+            seq_number=0,
+            type=MiddlewareMessageType.MOVIES_FILTER,
+            payload=FILTER_HEADER.pack(self.id_worker, len(self.ring.nodes)) + bloom.to_bytes(),
+            controller_name=self.controller_name
+        )
+        self.rabbitmq_connection_handler.send_message(
+            routing_key=self.movie_filter_routing_key,
+            msg_body=msg.encode_to_bytes()
+        )
+        logging.info(f"action: publish_movie_filter | result: success | client_id: {client_id} | movies: {len(movie_ids)} | bytes: {len(bloom.bits)}")
+
+    def publish_movie_filters(self):
+        """Publica los filtros de los clientes que ya tienen todas sus peliculas"""
+        for client_id, state in self.clients_state.items():
+            if state["movies_eof"] == self.number_workers and "results_query" not in state:
+                self.publish_movie_filter(client_id)
+
+
+class MovieFilters:
+    """Filtros recibidos por un preprocessor, por cliente y nodo del anillo de joiners"""
+
+    def __init__(self, ring):
+        self.ring = ring
+        self.filters = OrderedDict()  # {client_id: {nodo: BloomFilter}}
+        self.dropped = {}  # {client_id: filas descartadas}
+
+    def update(self, data: MiddlewareMessage):
+        payload = data.payload_bytes
+        node, ring_size = FILTER_HEADER.unpack_from(payload)
+        if ring_size != len(self.ring.nodes) or node not in self.ring.nodes:
+            logging.warning(f"action: receive_movie_filter | result: ignored | client_id: {data.client_id} | from: {data.controller_name} | error: ring of {ring_size} nodes")
+            return
+        self.filters.setdefault(data.client_id, {})[node] = BloomFilter.from_bytes(payload[FILTER_HEADER.size:])
+        self.filters.move_to_end(data.client_id)
+        while len(self.filters) > MAX_FILTERED_CLIENTS:
+            self.filters.popitem(last=False)
+
+    def admits(self, client_id, movie_id, node) -> bool:
+        """False si el joiner node ya tiene todas las peliculas del cliente y movie_id no esta"""
+        bloom = self.filters.get(client_id, {}).get(node)
+        if bloom is None or movie_id in bloom:
+            return True
+        self.dropped[client_id] = self.dropped.get(client_id, 0) + 1
+        return False
+
+    def discard(self, client_id) -> int:
+        """Olvida los filtros del cliente y devuelve cuantas filas se descartaron"""
+        self.filters.pop(client_id, None)
+        return self.dropped.pop(client_id, 0)
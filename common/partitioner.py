@@ -0,0 +1,61 @@
+"""
+Particionado por id de pelicula hacia los joiners con un anillo de hashing
+consistente. Cada joiner ocupa vnodes puntos del anillo y una clave pertenece
+al primer punto que le sigue, asi al agregar un joiner solo cambian de dueño
+~1/N de las claves (con modulo cambian casi todas). Todos los productores
+que shardean por id de pelicula tienen que usar los mismos nodos y vnodes.
+"""
+import bisect
+import hashlib
+
+DEFAULT_VNODES = 64
+MAX_CACHED_KEYS = 1_000_000
+
+
+def stable_hash(value) -> int:
+    """Hash de 64 bits estable entre procesos (hash() de Python cambia con PYTHONHASHSEED)"""
+    return int.from_bytes(hashlib.blake2b(str(value).encode('utf-8'), digest_size=8).digest(), 'big')
+
+
+class ConsistentHashRing:
+
+    def __init__(self, nodes, vnodes=DEFAULT_VNODES):
+        self.nodes = sorted(set(nodes))
+        if not self.nodes:
+            raise ValueError("A hash ring needs at least one node")
+        self.vnodes = max(1, vnodes)
+        points = sorted((stable_hash(f"{node}#{i}"), node) for node in self.nodes for i in range(self.vnodes))
+        self.points = [point for point, _ in points]
+        self.point_nodes = [node for _, node in points]
+        # Las claves se repiten mucho (un id de pelicula por rating): se cachea su dueño
+        self.owners = {}
+        # Claves enviadas a cada nodo, para detectar particiones desbalanceadas
+        self.load = {node: 0 for node in self.nodes}
+
+    def node_for(self, key):
+        """Nodo dueño de la clave, sin contarla en las estadisticas"""
+        node = self.owners.get(key)
+        if node is None:
+            if len(self.owners) >= MAX_CACHED_KEYS:
+                self.owners.clear()
+            index = bisect.bisect(self.points, stable_hash(key)) % len(self.points)
+            node = self.owners[key] = self.point_nodes[index]
+        return node
+
+    def owner(self, key):
+        """Nodo dueño de la clave, contandola en la carga de ese nodo"""
+        node = self.node_for(key)
+        self.load[node] += 1
+        return node
+
+    def skew(self) -> float:
+        """Carga del nodo mas cargado sobre la carga media (1.0 es balance perfecto)"""
+        total = sum(self.load.values())
+        if not total:
+            return 1.0
+        return max(self.load.values()) / (total / len(self.nodes))
+
+    def load_stats(self) -> str:
+        total = sum(self.load.values())
+        load = ",".join(f"{node}:{count}" for node, count in self.load.items())
+        return f"keys: {total} | skew: {self.skew():.2f} | load: {load}"
@@ -0,0 +1,122 @@
+"""
+Plan de filtros y proyecciones de cada query sobre las peliculas limpias.
+
+Cada query declara las condiciones que tiene que cumplir una pelicula y las
+columnas que usa despues de los filtros. MoviesPreprocessor aplica el plan
+antes de publicar: a cada rama (country, country_invesment, nlp) le envia solo
+las filas que cumplen el plan de alguna de sus queries, con las columnas de
+esas queries (las de sus condiciones incluidas, para los filtros que las
+vuelven a evaluar). Los filtros siguen siendo correctos sobre batches ya
+filtrados, asi que el plan se puede cambiar o apagar sin tocarlos.
+
+Las condiciones se evaluan una vez por fila y por batch: las queries que
+comparten una condicion (ej: Argentina en Q1, Q3 y Q4) usan el mismo resultado.
+"""
+from common.columnar_batch import year_of
+from common.defines import QueryNumber
+from common.dictionary import COUNTRIES
+
+ID = "id"
+TITLE = "title"
+GENRES = "genres"
+YEAR = "release_date"  # YYYYMMDD
+OVERVIEW = "overview"
+PROD_COUNTRIES = "production_countries"
+BUDGET = "budget"
+REVENUE = "revenue"
+QUERIES = "queries"  # Mascara de query_bit de las queries que cumple cada fila
+
+
+def query_bit(query: QueryNumber) -> int:
+    return 1 << query.value
+
+
+class Condition:
+    """Predicado sobre los valores de una columna. key identifica condiciones iguales"""
+
+    def __init__(self, column: str, key: tuple, row_test):
+        self.column = column
+        self.key = (column, *key)
+        self.row_test = row_test
+
+    def evaluate(self, batch) -> list:
+        row_test = self.row_test
+        return [row_test(value) for value in batch.column(self.column)]
+
+
+def contains_all(column, dictionary, names):
+    """La lista de codigos de la columna tiene todos los nombres"""
+    mask = dictionary.mask_of(names)
+    return Condition(column, ("contains_all", mask), lambda codes: dictionary.mask(codes) & mask == mask)
+
+
+def length_is(column, length):
+    return Condition(column, ("length_is", length), lambda items: len(items) == length)
+
+
+def year_between(column, start, end=None):
+    """Fecha YYYYMMDD con el año en [start, end]. Las fechas desconocidas (0) no cumplen"""
+    end = end if end is not None else float("inf")
+    return Condition(column, ("year_between", start, end), lambda date: bool(date) and start <= year_of(date) <= end)
+
+
+def positive(column):
+    return Condition(column, ("positive",), lambda value: value > 0)
+
+
+def not_empty(column):
+    return Condition(column, ("not_empty",), bool)
+
+
+class QueryPlan:
+
+    def __init__(self, conditions, columns):
+        self.conditions = tuple(conditions)
+        self.columns = tuple(columns)  # Columnas que la query usa despues de los filtros
+
+
+ARGENTINA_AND_SPAIN = contains_all(PROD_COUNTRIES, COUNTRIES, ["Argentina", "Spain"])
+ARGENTINA = contains_all(PROD_COUNTRIES, COUNTRIES, ["Argentina"])
+SINCE_2000 = year_between(YEAR, 2000)
+
+QUERY_PLANS = {
+    QueryNumber.QUERY_1: QueryPlan([ARGENTINA_AND_SPAIN, year_between(YEAR, 2000, 2009)], [TITLE, GENRES]),
+    QueryNumber.QUERY_2: QueryPlan([length_is(PROD_COUNTRIES, 1)], [PROD_COUNTRIES, BUDGET]),
+    QueryNumber.QUERY_3: QueryPlan([ARGENTINA, SINCE_2000], [ID, TITLE]),
+    QueryNumber.QUERY_4: QueryPlan([ARGENTINA, SINCE_2000], [ID]),
+    QueryNumber.QUERY_5: QueryPlan([not_empty(OVERVIEW), positive(BUDGET), positive(REVENUE)], [OVERVIEW, BUDGET, REVENUE]),
+}
+
+
+def plan_columns(queries) -> list:
+    """Union de las columnas de las condiciones y de las salidas de las queries, sin repetir"""
+    columns = {}
+    for query in queries:
+        plan = QUERY_PLANS[query]
+        columns.update(dict.fromkeys(condition.column for condition in plan.conditions))
+        columns.update(dict.fromkeys(plan.columns))
+    return list(columns)
+
+
+def query_masks(batch, queries) -> list:
+    """Mascara de cada fila con el query_bit de cada una de las queries cuyo plan cumple"""
+    results = {}
+    masks = [0] * batch.num_rows
+    for query in queries:
+        passes = None
+        for condition in QUERY_PLANS[query].conditions:
+            if condition.key not in results:
+                results[condition.key] = condition.evaluate(batch)
+            result = results[condition.key]
+            passes = result if passes is None else [a and b for a, b in zip(passes, result)]
+        flag = query_bit(query)
+        for row, passed in enumerate(passes if passes is not None else [True] * batch.num_rows):
+            if passed:
+                masks[row] |= flag
+    return masks
+
+
+def apply_plan(batch, queries):
+    """Filas que cumplen el plan de alguna de las queries, con las columnas de plan_columns"""
+    rows = [row for row, mask in enumerate(query_masks(batch, queries)) if mask]
+    return batch.take(rows, *plan_columns(queries))
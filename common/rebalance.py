@@ -0,0 +1,164 @@
+import json
+import logging
+from common.file_manager import FileManager
+from common.middleware_message_protocol import MiddlewareMessage, MiddlewareMessageType
+from common.partitioner import ConsistentHashRing, DEFAULT_VNODES
+
+
+class RebalancingNode:
+    """
+    Migracion del estado de un joiner cuando cambian los nodos del anillo de
+    hashing consistente (ej: se agrega un joiner con N_JOINERS).
+
+    Cada joiner guarda en .data/<controller_name>_ring los nodos con los que
+    particiono su estado. Si al iniciar los nodos configurados son otros:
+      1. Para cada cliente en curso extrae las claves que ahora son de otro
+         joiner y se las envia en un mensaje HANDOFF a su cola de entrada, junto
+         con los EOF recibidos del cliente (todos los joiners reciben todos los
+         EOF, un joiner nuevo no recibio los anteriores a su alta). Los joiners
+         nuevos reciben un HANDOFF por cada cliente en curso aunque no les toque
+         ninguna clave.
+      2. Envia REBALANCE_DONE a todos los demas joiners del anillo nuevo.
+      3. Confirmadas las publicaciones, descarta el estado entregado.
+    Un joiner que inicia con un anillo nuevo no entrega resultados hasta recibir
+    REBALANCE_DONE de todos los demas; como cada joiner publica sus HANDOFF antes
+    que su REBALANCE_DONE en la misma cola, para entonces recibio todo su estado.
+    Los HANDOFF se deduplican por cliente con el nombre del joiner que los envia
+    y un seq_number que crece con el anillo, asi reenviarlos tras una caida a
+    mitad de la migracion es seguro.
+
+    Solo se soporta agregar joiners. Los batches ya ruteados con el anillo
+    anterior no se reenvian: los productores tienen que estar detenidos y las
+    colas de los joiners vacias al cambiar N_JOINERS (ver README).
+
+    Las subclases definen input_queue(node), extract_handoff(client_id),
+    drop_handoff(client_id), merge_handoff(client_id, entries) y send_results,
+    y pueden redefinir on_rebalance_complete.
+    """
+    handoff_query_number = None
+    progress_fields = ("movies_eof",)
+
+    def init_partitioning(self, id_worker, number_joiners, vnodes=DEFAULT_VNODES):
+        self.id_worker = id_worker
+        self.ring = ConsistentHashRing(range(number_joiners), vnodes)
+        self.ring_file = f".data/{self.controller_name}_ring"
+        ring_state = self.load_ring_state()
+        for node in self.ring.nodes:
+            self.rabbitmq_connection_handler.declare_queue(self.input_queue(node))
+        if ring_state is not None and ring_state["nodes"] == self.ring.nodes:
+            self.pending_rebalance = set(ring_state["pending"])
+            return
+        previous_nodes = ring_state["nodes"] if ring_state is not None else []
+        removed = set(previous_nodes) - set(self.ring.nodes)
+        if removed:
+            logging.warning(f"action: rebalance | result: fail | error: removing joiners {sorted(removed)} is not supported, their state is not migrated")
+        self.pending_rebalance = {node for node in self.ring.nodes if node != self.id_worker}
+        self.rebalance(previous_nodes)
+
+    def owns(self, key) -> bool:
+        return self.ring.node_for(key) == self.id_worker
+
+    def load_ring_state(self):
+        try:
+            with open(self.ring_file) as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+
+    def save_ring_state(self):
+        ring_state = {"nodes": self.ring.nodes, "pending": sorted(self.pending_rebalance)}
+        FileManager(self.ring_file).save_state(json.dumps(ring_state), sync=True)
+        FileManager.sync_pending()
+
+    def rebalance(self, previous_nodes):
+        new_nodes = set(self.ring.nodes) - set(previous_nodes) - {self.id_worker}
+        handoffs = {client_id: self.extract_handoff(client_id) for client_id in list(self.clients_state)}
+        moved = 0
+        for client_id, slices in handoffs.items():
+            progress = {field: self.clients_state[client_id][field] for field in self.progress_fields}
+            for node in sorted(set(slices) | new_nodes):
+                entries = slices.get(node, {})
+                self.send_rebalance_message(node, client_id, MiddlewareMessageType.HANDOFF, {"progress": progress, "entries": entries})
+                moved += len(entries)
+        for node in self.pending_rebalance:
+            self.send_rebalance_message(node, 0, MiddlewareMessageType.REBALANCE_DONE, {"node": self.id_worker, "nodes": self.ring.nodes})
+        self.rabbitmq_connection_handler.flush()
+
+        # Recien con los HANDOFF confirmados por el broker se descarta el estado entregado
+        for client_id, slices in handoffs.items():
+            if slices:
+                self.drop_handoff(client_id)
+        self.save_state()
+        self.rabbitmq_connection_handler.flush()
+        self.save_ring_state()
+        logging.info(f"action: rebalance | result: success | previous_nodes: {previous_nodes} | nodes: {self.ring.nodes} | "
+                     f"clients: {len(handoffs)} | moved_keys: {moved}")
+
+    def send_rebalance_message(self, node, client_id, type, payload):
+        msg = MiddlewareMessage(
+            query_number=self.handoff_query_number,
+            client_id=client_id,
+            # Crece con cada anillo nuevo (solo se agregan nodos), para deduplicar reenvios
+            seq_number=len(self.ring.nodes),
+            type=type,
+            payload=json.dumps(payload),
+            controller_name=f"{self.controller_name}_handoff"
+        )
+        # Exchange por defecto: llega a la cola del joiner aunque su productor todavia no la haya bindeado
+        self.rabbitmq_connection_handler.send_message(
+            routing_key=self.input_queue(node),
+            msg_body=msg.encode_to_bytes(),
+            exchange=""
+        )
+
+    def handle_rebalance_message(self, data) -> bool:
+        """Procesa HANDOFF y REBALANCE_DONE. Devuelve False para el resto de los mensajes"""
+        if data.type == MiddlewareMessageType.HANDOFF:
+            client_id = data.client_id
+            if client_id not in self.clients_state:
+                self.create_clients_state(client_id)
+            if data.seq_number <= self.clients_state[client_id].get(data.controller_name, 0):
+                logging.warning(f"Duplicated handoff for client {client_id} from {data.controller_name}. Ignoring.")
+                return True
+            handoff = json.loads(data.payload)
+            self.apply_progress(client_id, handoff["progress"])
+            self.merge_handoff(client_id, handoff["entries"])
+            self.clients_state[client_id][data.controller_name] = data.seq_number
+            logging.info(f"action: receive_handoff | result: success | client_id: {client_id} | from: {data.controller_name} | keys: {len(handoff['entries'])}")
+            self.save_state()
+            return True
+        if data.type == MiddlewareMessageType.REBALANCE_DONE:
+            done = json.loads(data.payload)
+            if done["nodes"] != self.ring.nodes or done["node"] not in self.pending_rebalance:
+                return True  # De otro anillo o repetido
+            self.pending_rebalance.discard(done["node"])
+            self.save_ring_state()
+            if not self.pending_rebalance:
+                logging.info(f"action: rebalance | result: complete | nodes: {self.ring.nodes}")
+                self.on_rebalance_complete()
+                for client_id in [client_id for client_id, state in self.clients_state.items() if "results_query" in state]:
+                    self.send_results(client_id, self.clients_state[client_id]["results_query"])
+                self.save_state()
+            return True
+        return False
+
+    def on_rebalance_complete(self):
+        """Hook al recibir REBALANCE_DONE de todos los demas joiners"""
+        pass
+
+    def apply_progress(self, client_id, progress):
+        """Toma los EOF que el joiner que entrega recibio antes del alta de este"""
+        state = self.clients_state[client_id]
+        loaded = state["movies_eof"] == self.number_workers
+        for field, value in progress.items():
+            state[field] = max(state[field], value)
+        if not loaded and state["movies_eof"] == self.number_workers:
+            self.loading_data(client_id)
+
+    def finish_client(self, client_id, query_number):
+        """Entrega los resultados del cliente, o los difiere hasta terminar la migracion en curso"""
+        if self.pending_rebalance:
+            logging.info(f"action: send_results | result: waiting_rebalance | client_id: {client_id} | pending: {sorted(self.pending_rebalance)}")
+            self.clients_state[client_id]["results_query"] = query_number.value
+            return
+        self.send_results(client_id, query_number)
@@ -8,13 +8,14 @@ import signal
 from typing import Optional, List
 from multiprocessing import Process, Value
 from common.file_manager import FileManager
+from common.state_store import StateStore, SET_OP, DELETE_OP, DEFAULT_SNAPSHOT_EVERY, DEFAULT_SNAPSHOT_INTERVAL
 import json
 
 HEALTH_CHECK_PORT = 5000
 
 class ResilientNode:
 
-    def __init__(self):
+    def __init__(self, snapshot_every=DEFAULT_SNAPSHOT_EVERY, snapshot_interval=DEFAULT_SNAPSHOT_INTERVAL):
         self.rabbitmq_connection_handler: Optional[RabbitMQConnectionHandler] = None
         self.node_is_alive = Value('b', True)
         self.joinable_processes: List[Process] = []
@@ -23,16 +24,28 @@ class ResilientNode:
         self.joinable_processes.append(check_health_process)
         self.controller_name = ""
         self.clients_state = {}  # Diccionario para almacenar el estado local de los clientes
+        self.processing_batch = False
+        # Campos grandes del estado de cada cliente (mapas del join). No se comparan
+        # enteros en cada mensaje: se persisten solo las claves marcadas con mark_state_keys
+        self.incremental_state_fields = ()
+        self.dirty_state_keys = {}  # {(client_id, field): set(keys)}
+        self.persisted_state = {}  # {client_id: {field: json persistido, u objeto si es incremental}}
+        self.snapshot_every = snapshot_every
+        self.snapshot_interval = snapshot_interval
+        self.state_store: Optional[StateStore] = None
         self.set_signals()
 
     def load_state(self, check_files_state = None):
-        self.clients_state = FileManager.load_state(f".data/{self.controller_name}_state.json")
+        self.state_store = StateStore(f".data/{self.controller_name}", self.snapshot_every, self.snapshot_interval)
+        self.clients_state = self.state_store.load()
+        self.persisted_state = {}
+        self.__state_delta()  # Toma el estado cargado como el ya persistido
         if check_files_state and self.clients_state != {}:
             check_files_state()  # Función para verificar el estado de los archivos temporales
         # iterar sobre el id del cliente para verificar los archivos temporales
 
     def check_file(self, client_id, file_type):
-        """Check if the file exists for the given client and type"""
+        """Check if the log got a batch appended after the last saved state (a batch that is going to be redelivered)"""
         prev_hash = self.clients_state[client_id]["hash_file"][file_type]
         filename = f".data/{file_type}-client-{client_id}"
         new_hash = FileManager.get_file_hash(filename)
@@ -46,9 +59,113 @@ class ResilientNode:
         self.clients_state[client_id]["hash_file"][file_type] = FileManager.get_file_hash(filename)
         self.save_state()
 
+    def set_consumer_callback(self, queue_name, callback, consume_batch_size=1):
+        """Registra el callback de a un mensaje, o de a lotes si consume_batch_size > 1"""
+        if consume_batch_size > 1:
+            self.rabbitmq_connection_handler.set_batch_message_consumer_callback(queue_name, self.batch_callback(callback), consume_batch_size)
+        else:
+            self.rabbitmq_connection_handler.set_message_consumer_callback(queue_name, callback)
+
+    def batch_callback(self, callback):
+        """
+        Adapta un callback de a un mensaje al consumo en lotes. Los mensajes se procesan
+        en orden sobre el mismo clients_state, asi la deduplicacion por seq_number ve los
+        mensajes anteriores del lote, y el estado se persiste una sola vez al final.
+        """
+        def process_batch(ch, messages):
+            self.processing_batch = True
+            try:
+                for method, properties, body in self.prepare_batch(messages):
+                    callback(ch, method, properties, body)
+            finally:
+                self.processing_batch = False
+                self.finish_batch()
+            self.save_state()
+        return process_batch
+
+    def group_commit(self) -> bool:
+        """
+        Si los acks se difieren, las escrituras a disco no se sincronizan de a una:
+        se hacen durables todas juntas en el flush, antes de confirmar los mensajes
+        """
+        return self.rabbitmq_connection_handler is not None and self.rabbitmq_connection_handler.defers_acks()
+
+    def prepare_batch(self, messages):
+        """
+        Hook para trabajo previo sobre todos los mensajes de un lote (ej: inferencia en batch).
+        Devuelve los (method, properties, body) a pasar al callback: puede reemplazar
+        cada body por el mensaje ya decodificado, para no decodificarlo dos veces
+        """
+        return messages
+
+    def finish_batch(self):
+        """Hook para liberar lo preparado en prepare_batch, aun si el lote falla"""
+        pass
+
     def save_state(self):
-        state = FileManager(f".data/{self.controller_name}_state.json")
-        state.save_state(json.dumps(self.clients_state, indent=2))
+        if self.processing_batch:
+            return  # Se persiste al terminar el lote
+        if self.rabbitmq_connection_handler is not None:
+            # Con publicacion en lotes el estado se persiste recien cuando el broker
+            # confirmo las publicaciones, asi un reinicio nunca descarta como duplicado
+            # un mensaje cuyas salidas se perdieron
+            self.rabbitmq_connection_handler.run_before_ack(self.__write_state)
+            if self.group_commit():
+                self.rabbitmq_connection_handler.run_on_flush(FileManager.sync_pending)
+        else:
+            self.__write_state()
+
+    def mark_state_keys(self, client_id, field, keys):
+        """Marca las claves modificadas de un campo incremental para el proximo delta"""
+        self.dirty_state_keys.setdefault((client_id, field), set()).update(keys)
+
+    def __write_state(self):
+        if self.state_store is None:
+            self.state_store = StateStore(f".data/{self.controller_name}", self.snapshot_every, self.snapshot_interval)
+        ops = self.__state_delta()
+        if ops:
+            # Aun si toca snapshot: si se cae antes de vaciar el WAL, el replay tiene que terminar en este estado
+            self.state_store.append(ops)
+        if self.state_store.should_snapshot(self.clients_state):
+            self.state_store.snapshot(self.clients_state, self.group_commit())
+
+    def __state_delta(self):
+        """
+        Operaciones que llevan el estado persistido al actual. Los campos chicos se
+        comparan por su JSON; los incrementales se escriben enteros solo cuando se
+        reemplaza el objeto, y si no, solo las claves marcadas.
+        """
+        ops = []
+        for client_id in [client_id for client_id in self.persisted_state if client_id not in self.clients_state]:
+            ops.append([DELETE_OP, [client_id]])
+            del self.persisted_state[client_id]
+        for client_id, client_state in self.clients_state.items():
+            persisted = self.persisted_state.setdefault(client_id, {})
+            for field in [field for field in persisted if field not in client_state]:
+                ops.append([DELETE_OP, [client_id, field]])
+                del persisted[field]
+            for field, value in client_state.items():
+                if field in self.incremental_state_fields:
+                    if persisted.get(field) is not value:
+                        ops.append([SET_OP, [client_id, field], value])
+                        persisted[field] = value
+                        self.dirty_state_keys.pop((client_id, field), None)
+                    continue
+                encoded = json.dumps(value)
+                if persisted.get(field) != encoded:
+                    ops.append([SET_OP, [client_id, field], value])
+                    persisted[field] = encoded
+        for (client_id, field), keys in self.dirty_state_keys.items():
+            values = self.clients_state.get(client_id, {}).get(field)
+            if values is None:
+                continue
+            for key in keys:
+                if key in values:
+                    ops.append([SET_OP, [client_id, field, key], values[key]])
+                else:
+                    ops.append([DELETE_OP, [client_id, field, key]])
+        self.dirty_state_keys = {}
+        return ops
 
     def set_signals(self):
         signal.signal(signal.SIGTERM, self.__signal_handler)
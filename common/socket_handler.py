@@ -1,5 +1,7 @@
+import asyncio
 import socket
 import logging
+from contextlib import contextmanager
 from common.message_protocol import MessageProtocol
 from typing import Optional, Tuple, Union
 
@@ -20,6 +22,8 @@ class SocketHandler:
         self._server_mode = server_mode
         self._connected = False
         self.timeout = None
+        # Buffer de recepcion de la conexion, se reusa y crece hasta el mensaje mas grande
+        self._recv_buffer = bytearray()
         
     def create_socket(self, port: int = 0, ip: str = '', listen_backlog: int = 5, timeout=None) -> bool:
         """
@@ -108,32 +112,42 @@ class SocketHandler:
             logging.error("action: receive_message | result: fail | error: Socket not connected")
             return None
             
-        return SocketHandler.receive_message_from(self._socket)
+        return SocketHandler.receive_message_from(self._socket, self._recv_buffer)
     
     @staticmethod
-    def receive_message_from(sock) -> Optional[MessageProtocol]:
+    def receive_message_from(sock, buffer: Optional[bytearray] = None) -> Optional[MessageProtocol]:
         """
         Recibe un mensaje desde un socket específico y lo decodifica
 
-        La función se bloquea hasta que se reciba un mensaje. Luego,
-        el mensaje es decodificado y retornado
+        La función se bloquea hasta que se reciba un mensaje. Los bytes se
+        reciben con recv_into directamente en buffer, sin concatenar pedazos,
+        y el mensaje se decodifica sobre el mismo buffer. Luego, el mensaje
+        es retornado
         
         Args:
             sock: Socket desde el cual se recibirá el mensaje
+            buffer: Buffer de la conexion a reusar entre mensajes. Si no se
+                indica, se usa uno nuevo del tamaño del mensaje
             
         Returns:
             Objeto MessageProtocol decodificado o None si ocurrió un error
         """
-        header = SocketHandler.__recv_all(sock, 4)
-        if not header:
-            logging.error(f"action: receive_message | result: fail | error: short-read")
-            return None
+        reuse_buffer = buffer is not None
+        if buffer is None:
+            buffer = bytearray(4)
+        with SocketHandler.__recv_all(sock, 4, buffer) as header:
+            if header is None:
+                logging.error(f"action: receive_message | result: fail | error: short-read")
+                return None
+            messageSize = int.from_bytes(header, byteorder='big')
 
-        messageSize = int.from_bytes(header, byteorder='big')
-        data = SocketHandler.__recv_all(sock, messageSize)
-        if not data:
-            return None
-        return MessageProtocol.decodeMessageBytes(data)
+        if not reuse_buffer:
+            buffer = bytearray(messageSize)
+        with SocketHandler.__recv_all(sock, messageSize, buffer) as data:
+            if data is None:
+                return None
+            # Si el buffer se reusa el payload no puede quedar apuntandolo
+            return MessageProtocol.decodeMessageBytes(data, copy_payload=reuse_buffer)
 
     def send_message(self, message) -> bool:
         """
@@ -171,15 +185,71 @@ class SocketHandler:
         Returns:
             True si el mensaje fue enviado exitosamente, False en caso contrario
         """
-        # Encode message
-        encoded_message = message.encodeMessageBytes()
-        # Get size of message
-        size = len(encoded_message)
-        # Send size of message
-        if not SocketHandler.__send_all(sock, size.to_bytes(4, byteorder='big')):
+        payload = message.payload_bytes
+        header = (len(payload) + 1).to_bytes(4, byteorder='big') + bytes([message.type_message.value])
+        return SocketHandler.__send_all(sock, header, payload)
+    
+    @staticmethod
+    async def receive_message_from_stream(reader: asyncio.StreamReader) -> Optional[MessageProtocol]:
+        """
+        Recibe un mensaje desde un asyncio.StreamReader y lo decodifica
+
+        La corrutina espera sin bloquear el event loop hasta que llegue el
+        mensaje completo. Luego, el mensaje es decodificado y retornado
+        
+        Args:
+            reader: Stream desde el cual se recibirá el mensaje
+            
+        Returns:
+            Objeto MessageProtocol decodificado o None si ocurrió un error
+        """
+        try:
+            header = await reader.readexactly(4)
+            messageSize = int.from_bytes(header, byteorder='big')
+            data = await reader.readexactly(messageSize)
+        except (asyncio.IncompleteReadError, OSError) as e:
+            logging.error(f"action: receive_message | result: fail | error: {e}")
+            return None
+        return MessageProtocol.decodeMessageBytes(data)
+
+    @staticmethod
+    async def send_message_to_stream(writer: asyncio.StreamWriter, message) -> bool:
+        """
+        Envía un mensaje a un asyncio.StreamWriter
+
+        La corrutina espera hasta que el buffer de escritura se vacíe por debajo
+        de su límite, así un cliente lento no acumula memoria sin cota
+        
+        Args:
+            writer: Stream al cual se enviará el mensaje
+            message: Objeto MessageProtocol a enviar
+            
+        Returns:
+            True si el mensaje fue enviado exitosamente, False en caso contrario
+        """
+        try:
+            SocketHandler.write_frame_to_stream(writer, message.type_message.value, message.payload_bytes)
+            await writer.drain()
+        except OSError as e:
+            logging.error(f"action: send_message | result: fail | error: {e}")
             return False
-        # Send message
-        return SocketHandler.__send_all(sock, encoded_message)
+        return True
+    
+    @staticmethod
+    def write_frame_to_stream(writer: asyncio.StreamWriter, type_message: int, payload: Union[bytes, memoryview]):
+        """
+        Escribe un mensaje ya codificado (tipo y payload en bytes) en el buffer de un
+        asyncio.StreamWriter, sin pasar por MessageProtocol ni copiar el payload a un str.
+        No espera el drain del writer
+        
+        Args:
+            writer: Stream al cual se enviará el mensaje
+            type_message: Valor de ClientCommunication del mensaje
+            payload: Payload del mensaje en bytes
+        """
+        writer.write((len(payload) + 1).to_bytes(4, byteorder='big') + bytes([type_message]))
+        if len(payload):
+            writer.write(payload)
     
     def get_socket(self) -> socket.socket:
         """
@@ -228,49 +298,67 @@ class SocketHandler:
             return None
             
     @staticmethod
-    def __recv_all(sock, size):
+    @contextmanager
+    def __recv_all(sock, size, buffer: bytearray):
         """
-        Recibe exactamente 'size' bytes desde el socket
+        Recibe exactamente 'size' bytes desde el socket al principio de buffer,
+        agrandándolo si hace falta
         
         Args:
             sock: Socket desde el cual recibir datos
             size: Cantidad exacta de bytes a recibir
+            buffer: Buffer donde se reciben los datos
             
         Returns:
-            Los datos recibidos o None si ocurrió un error
+            Context manager con una vista de los datos recibidos, o None si
+            ocurrió un error. La vista se libera al salir, para poder volver a
+            agrandar el buffer
         """
-        data = b''
-        while len(data) < size:
-            try:
-                chunk = sock.recv(size - len(data))
-                if not chunk:
-                    return None
-                data += chunk
-            except OSError as e:
-                logging.error(f"action: receive_message | result: fail | error: {e}")
-                return None
-        return data
+        if len(buffer) < size:
+            buffer.extend(bytes(size - len(buffer)))
+        with memoryview(buffer) as view:
+            received = 0
+            while received < size:
+                try:
+                    chunk_size = sock.recv_into(view[received:size], size - received)
+                except OSError as e:
+                    logging.error(f"action: receive_message | result: fail | error: {e}")
+                    chunk_size = 0
+                if not chunk_size:
+                    yield None
+                    return
+                received += chunk_size
+            with view[:size] as data:
+                yield data
     
     @staticmethod
-    def __send_all(sock, data):
+    def __send_all(sock, *parts):
         """
-        Envía todos los datos al socket
+        Envía todas las partes al socket con sendmsg (scatter-gather), sin
+        concatenarlas en un solo buffer
         
         Args:
             sock: Socket al cual enviar datos
-            data: Datos a enviar
+            parts: Datos a enviar, en orden
             
         Returns:
             True si todos los datos fueron enviados exitosamente, False en caso contrario
         """
-        totalSent = 0
-        while totalSent < len(data):
+        pending = [memoryview(part) for part in parts if len(part)]
+        while pending:
             try:
-                sent = sock.send(data[totalSent:])
+                sent = sock.sendmsg(pending)
                 if sent == 0:
                     return False
-                totalSent += sent
             except OSError as e:
                 logging.error(f"action: send_message | result: fail | error: {e}")
                 return False
-        return True
\ No newline at end of file
+            # Se descartan las partes enviadas completas y se recorta la primera pendiente
+            while sent:
+                if sent >= len(pending[0]):
+                    sent -= len(pending[0])
+                    pending.pop(0)
+                else:
+                    pending[0] = pending[0][sent:]
+                    sent = 0
+        return True
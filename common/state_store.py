@@ -0,0 +1,82 @@
+import json
+import logging
+import time
+from common.file_manager import FileManager
+
+DEFAULT_SNAPSHOT_EVERY = 1000     # mensajes entre snapshots
+DEFAULT_SNAPSHOT_INTERVAL = 30.0  # segundos entre snapshots
+
+SET_OP = "s"
+DELETE_OP = "d"
+
+
+def apply_delta(state, ops):
+    """
+    Aplica las operaciones de un delta sobre el estado. Cada operacion es
+    [SET_OP, path, value] o [DELETE_OP, path], con path la lista de claves desde
+    la raiz. Son idempotentes, asi reaplicar deltas ya incluidos en el snapshot
+    deja el mismo estado.
+    """
+    for op in ops:
+        path = op[1]
+        parent = state
+        for key in path[:-1]:
+            parent = parent.setdefault(key, {})
+        if op[0] == SET_OP:
+            parent[path[-1]] = op[2]
+        else:
+            parent.pop(path[-1], None)
+
+
+class StateStore:
+    """
+    Persistencia del clients_state de un nodo: un snapshot JSON compacto
+    ({name}_state.json) mas un write-ahead log de deltas ({name}_state.wal)
+    con los cambios posteriores. Cada mensaje agrega un registro chico al WAL;
+    el snapshot se reescribe cada snapshot_every deltas o snapshot_interval
+    segundos, y al reescribirlo se vacia el WAL.
+    """
+
+    def __init__(self, name, snapshot_every=DEFAULT_SNAPSHOT_EVERY, snapshot_interval=DEFAULT_SNAPSHOT_INTERVAL):
+        self.snapshot_path = f"{name}_state.json"
+        self.wal = FileManager(f"{name}_state.wal")
+        self.snapshot_every = snapshot_every
+        self.snapshot_interval = snapshot_interval
+        self.deltas_since_snapshot = 0
+        self.last_snapshot = time.monotonic()
+
+    def load(self):
+        state = FileManager.load_state(self.snapshot_path)
+        FileManager.recover(self.wal.path)
+        for record in self.wal.records():
+            apply_delta(state, json.loads(record))
+            self.deltas_since_snapshot += 1
+        return state
+
+    def append(self, ops):
+        self.wal.append_record(json.dumps(ops, separators=(',', ':')).encode('utf-8'), sync=False)
+        self.deltas_since_snapshot += 1
+
+    def should_snapshot(self, state) -> bool:
+        return (
+            not state
+            or self.deltas_since_snapshot >= self.snapshot_every
+            or time.monotonic() - self.last_snapshot >= self.snapshot_interval
+        )
+
+    def snapshot(self, state, sync=False):
+        """
+        Reescribe el snapshot y recien despues vacia el WAL. Con sync el snapshot se
+        hace durable antes de vaciar el WAL, si no una caida podria perder ambos.
+        """
+        FileManager(self.snapshot_path).save_state(json.dumps(state, separators=(',', ':')), sync)
+        if self.deltas_since_snapshot > 0:
+            if sync:
+                FileManager.sync_pending()
+            with open(self.wal.path, 'wb'):
+                pass
+            if sync:
+                FileManager.pending_syncs.add(self.wal.path)
+        logging.debug(f"action: state_snapshot | file: {self.snapshot_path} | deltas: {self.deltas_since_snapshot}")
+        self.deltas_since_snapshot = 0
+        self.last_snapshot = time.monotonic()
@@ -0,0 +1,46 @@
+"""
+Extraccion de los nombres de las columnas de TMDB que son listas de diccionarios
+escritas como literales de Python (genres, production_countries,
+spoken_languages, cast):
+
+    [{'id': 16, 'name': 'Animation'}, {'id': 35, 'name': 'Comedy'}]
+
+ast.literal_eval arma el AST de la celda entera para despues usar solo los
+name, y en cast son decenas de diccionarios por pelicula. extract_names hace lo
+mismo con expresiones regulares precompiladas, y solo usa literal_eval con las
+celdas que no tienen exactamente esa forma (malformadas, otros literales, dicts
+sin name), asi el resultado es siempre el de literal_names.
+"""
+import ast
+import re
+
+# Un salto de linea sin escapar no es valido dentro de un string: esa celda va a literal_eval
+STRING = r"""'[^'\\\n]*(?:\\.[^'\\\n]*)*'|"[^"\\\n]*(?:\\.[^"\\\n]*)*\""""
+STRING_LITERAL = re.compile(STRING, re.DOTALL)
+# Cada string de la celda se consume entero, asi un "'name': " dentro de otro
+# string (ej: un character) no se toma como clave. Solo las claves name capturan
+NAME_OR_STRING = re.compile(rf"""(?:'name'|"name"): ({STRING})|{STRING}""", re.DOTALL)
+# La celda con cada string reemplazado por s: solo numeros, None y booleanos fuera de strings
+VALUE = r"(?:s|-?\d+(?:\.\d+)?|None|True|False)"
+DICT = rf"\{{(?:s: {VALUE}(?:, s: {VALUE})*)?\}}"
+LIST_OF_DICTS = re.compile(rf"\[(?:{DICT}(?:, {DICT})*)?\]")
+
+
+def literal_names(value: str) -> list:
+    """Nombres de la celda con ast.literal_eval. [] si la celda no es un literal valido"""
+    try:
+        return [data['name'] for data in ast.literal_eval(value)]
+    except (ValueError, SyntaxError):
+        return []
+
+
+def extract_names(value: str) -> list:
+    """Mismo resultado que literal_names, sin armar el AST de la celda"""
+    skeleton = STRING_LITERAL.sub("s", value)
+    if not LIST_OF_DICTS.fullmatch(skeleton):
+        return literal_names(value)
+    names = [name for name in NAME_OR_STRING.findall(value) if name]
+    if len(names) != skeleton.count("{"):
+        # Algun dict sin name o con un name que no es un string (repr nunca repite claves)
+        return literal_names(value)
+    return [ast.literal_eval(name) if "\\" in name else name[1:-1] for name in names]
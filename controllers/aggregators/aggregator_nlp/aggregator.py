@@ -1,21 +1,25 @@
-from transformers import pipeline
 from common.middleware_message_protocol import MiddlewareMessage, MiddlewareMessageType
 from common.defines import QueryNumber
 from common.middleware_connection_handler import RabbitMQConnectionHandler
 from common.resilient_node import ResilientNode
+from common.columnar_batch import ColumnarBatch, ColumnType
+from sentiment import SentimentClassifier, load_backend, DEFAULT_INFERENCE_BATCH_SIZE, DEFAULT_BACKEND
+from sentiment_cache import SentimentCache, DEFAULT_CACHE_SIZE, CACHE_PATH
 import logging
-import torch
-
-torch.set_num_threads(1)  
 
 ID = "id"
-OVERVIEW = 4
-BUDGET = 7
-REVENUE = 8
+OVERVIEW = "overview"
+BUDGET = "budget"
+REVENUE = "revenue"
+RESULT_SCHEMA = [("sentiment", ColumnType.STRING), ("budget", ColumnType.FLOAT), ("revenue", ColumnType.FLOAT)]
 
 class AggregatorNlp(ResilientNode):
     data: object
-    def __init__(self, number_workers, worker_id):
+    def __init__(self, number_workers, worker_id, publisher_batch_size=1, prefetch_count=1, group_commit_size=1, consume_batch_size=1, inference_batch_size=DEFAULT_INFERENCE_BATCH_SIZE, cache_size=DEFAULT_CACHE_SIZE, sentiment_backend=DEFAULT_BACKEND, model_dir=None, nlp_processes=1):
+        # El pool de inferencia hace fork: se crea antes del proceso de health check y de la conexion a RabbitMQ
+        # Un cache por backend: los labels de int8/onnx pueden diferir de los del modelo original
+        self.sentiment_cache = SentimentCache(cache_size, f"{CACHE_PATH}_{sentiment_backend}")
+        self.sentiment_classifier = SentimentClassifier(load_backend(sentiment_backend, model_dir), inference_batch_size, self.sentiment_cache, nlp_processes)
         super().__init__()
         self.worker_id = worker_id
         self.number_workers = number_workers
@@ -27,9 +31,13 @@ class AggregatorNlp(ResilientNode):
             },
             consumer_exchange_name="movies_preprocessor_exchange",
             consumer_queues_to_recv_from=[f"cleaned_movies_queue_nlp_{self.worker_id}"],
+            publisher_batch_size=publisher_batch_size,
+            prefetch_count=prefetch_count,
+            group_commit_size=group_commit_size,
         )
-        self.rabbitmq_connection_handler.set_message_consumer_callback(f"cleaned_movies_queue_nlp_{self.worker_id}", self.callback)
-        self.sentiment_analyzer = pipeline('sentiment-analysis', model='distilbert-base-uncased-finetuned-sst-2-english')
+        self.set_consumer_callback(f"cleaned_movies_queue_nlp_{self.worker_id}", self.callback, consume_batch_size)
+        self.batch_sentiments = {}  # Sentimientos ya calculados para los overviews del lote en curso
+        self.batch_rows = {}  # {delivery_tag: filas elegibles} de los mensajes del lote en curso
         self.clients_state = {}  # Dictionary to store local state of clients
         self.controller_name = f"aggregator_nlp_{worker_id}"
         self.load_state()
@@ -40,9 +48,11 @@ class AggregatorNlp(ResilientNode):
             self.rabbitmq_connection_handler.start_consuming()
         except Exception as e:
             logging.info("Consuming stopped")
+        self.sentiment_classifier.close()
 
     def callback(self, ch, method, properties, body):
-        data = MiddlewareMessage.decode_from_bytes(body)
+        # En un lote, prepare_batch ya decodifico el mensaje
+        data = body if isinstance(body, MiddlewareMessage) else MiddlewareMessage.decode_from_bytes(body)
         if data.type == MiddlewareMessageType.ABORT:
             logging.info(f"Received ABORT message from client {data.client_id}. Stopping processing.")
             if data.client_id in self.clients_state:
@@ -58,7 +68,7 @@ class AggregatorNlp(ResilientNode):
                     # Send the ABORT message to all workers
                     self.rabbitmq_connection_handler.send_message(
                         routing_key=f"aggregated_nlp_data_queue_{id_worker}",
-                        msg_body=msg.encode_to_str()
+                        msg_body=msg.encode_to_bytes()
                     )
                 del self.clients_state[data.client_id]
                 self.save_state()
@@ -76,15 +86,18 @@ class AggregatorNlp(ResilientNode):
             return
             
         if data.type != MiddlewareMessageType.EOF_MOVIES:
-            lines = data.get_batch_iter_from_payload()
+            rows = self.batch_rows.get(method.delivery_tag)
+            if rows is None:
+                rows = self.eligible_rows(data.get_columnar_batch())
             seq_number = self.clients_state[data.client_id]["last_seq_number"]
-            self.handler_aggregator_query_5(lines, data.client_id, data.query_number, seq_number)
+            self.handler_aggregator_query_5(rows, data.client_id, data.query_number, seq_number)
             self.clients_state[data.client_id]["last_seq_number"] += 1
             self.clients_state[data.client_id][data.controller_name] = data.seq_number  # Update the last seq number for this controller
         else:
             seq_number = self.clients_state[data.client_id]["last_seq_number"]
             self.clients_state[data.client_id]["eof_amount"] += 1
             if self.clients_state[data.client_id]["eof_amount"] == self.number_workers:
+                logging.info(f"action: sentiment_cache | client_id: {data.client_id} | {self.sentiment_cache.stats()}")
                 msg = MiddlewareMessage(
                     query_number=data.query_number,
                     client_id=data.client_id,
@@ -97,58 +110,59 @@ class AggregatorNlp(ResilientNode):
                     # Send the EOF message to all workers
                     self.rabbitmq_connection_handler.send_message(
                         routing_key=f"aggregated_nlp_data_queue_{id_worker}",
-                        msg_body=msg.encode_to_str()
+                        msg_body=msg.encode_to_bytes()
                     )
                 del self.clients_state[data.client_id]
         self.save_state()
 
-    def aggregator_nlp(self, movie):
-        if (not movie[OVERVIEW]):
-            return False, 0
+    def prepare_batch(self, messages):
+        """
+        Antes de procesar un lote de mensajes consumidos, clasifica juntos los overviews
+        de todos sus batches de movies, asi el modelo corre sobre batches llenos
+        """
+        overviews = []
+        decoded = []
+        for method, properties, body in messages:
+            data = MiddlewareMessage.decode_from_bytes(body)
+            if data.type == MiddlewareMessageType.MOVIES_BATCH:
+                rows = self.batch_rows[method.delivery_tag] = self.eligible_rows(data.get_columnar_batch())
+                overviews += [overview for overview, _, _ in rows]
+            decoded.append((method, properties, data))
+        self.batch_sentiments = self.sentiment_classifier.classify(overviews)
+        return decoded
 
-        try:
-            budget = float(movie[BUDGET])
-            revenue = float(movie[REVENUE])
-            if budget <= 0 or revenue <= 0:
-                return False, 0
-        except (ValueError, TypeError):
-            return False, 0
+    def finish_batch(self):
+        self.batch_sentiments = {}
+        self.batch_rows = {}
 
-        text = movie[OVERVIEW]
-        
-        try:
-            truncated_text = text[:512]
-            
-            result = self.sentiment_analyzer(truncated_text)[0]  # Ej: {'label': 'POSITIVE', 'score': 0.998}
-            
-            return True, result['label']
-        except (IndexError, ValueError):
-            logging.error(f"Invalid release date format for movie: {movie}")
-            return False, 0
+    def eligible_rows(self, batch):
+        """Filas con overview, budget y revenue validos: (overview truncado, budget, revenue)"""
+        return [
+            (self.sentiment_classifier.truncate(overview), budget, revenue)
+            for overview, budget, revenue in batch.rows(OVERVIEW, BUDGET, REVENUE)
+            if overview and budget > 0 and revenue > 0
+        ]
 
-    def handler_aggregator_query_5(self, lines, client_id, query_number, seq_number):
-        filtered_lines = []
-        for line in lines:
-            could_aggregate, sentiment_value = self.aggregator_nlp(line)
-            if could_aggregate:
-                filtered_line = []
-                filtered_line.append(sentiment_value)
-                filtered_line.append(line[BUDGET])
-                filtered_line.append(line[REVENUE])
-                filtered_lines.append(filtered_line)
+    def handler_aggregator_query_5(self, rows, client_id, query_number, seq_number):
+        pending = [overview for overview, _, _ in rows if overview not in self.batch_sentiments]
+        sentiments = self.sentiment_classifier.classify(pending) if pending else {}
+        filtered_lines = [
+            [self.batch_sentiments.get(overview) or sentiments[overview], budget, revenue]
+            for overview, budget, revenue in rows
+        ]
 
-        result_csv = MiddlewareMessage.write_csv_batch(filtered_lines)            
+        result_batch = ColumnarBatch.from_rows(RESULT_SCHEMA, filtered_lines).to_bytes()
         msg = MiddlewareMessage(
             query_number=query_number,
             client_id=client_id,
             seq_number=seq_number,
             type=MiddlewareMessageType.MOVIES_BATCH,
-            payload=result_csv,
+            payload=result_batch,
             controller_name=self.controller_name
         )
         id_worker = seq_number % self.number_workers
         self.rabbitmq_connection_handler.send_message(
             routing_key=f"aggregated_nlp_data_queue_{id_worker}",
-            msg_body=msg.encode_to_str()
+            msg_body=msg.encode_to_bytes()
         )
 
@@ -0,0 +1,40 @@
+"""
+Descarga el modelo de sentimiento a un directorio local y lo exporta a ONNX,
+para que los backends de sentiment.py lo carguen sin acceso a la red.
+
+Uso (se corre al construir la imagen de aggregator_nlp):
+    python3 export_model.py <model_dir>
+"""
+import sys
+from transformers import AutoModelForSequenceClassification, AutoTokenizer
+import torch
+from sentiment import MODEL, ONNX_MODEL_FILE
+
+ONNX_OPSET = 14
+
+
+def export(model_dir):
+    tokenizer = AutoTokenizer.from_pretrained(MODEL)
+    model = AutoModelForSequenceClassification.from_pretrained(MODEL)
+    model.eval()
+    tokenizer.save_pretrained(model_dir)
+    model.save_pretrained(model_dir)
+
+    sample = tokenizer(["an example overview"], return_tensors='pt')
+    torch.onnx.export(
+        model,
+        (sample['input_ids'], sample['attention_mask']),
+        f"{model_dir}/{ONNX_MODEL_FILE}",
+        input_names=['input_ids', 'attention_mask'],
+        output_names=['logits'],
+        dynamic_axes={
+            'input_ids': {0: 'batch', 1: 'sequence'},
+            'attention_mask': {0: 'batch', 1: 'sequence'},
+            'logits': {0: 'batch'},
+        },
+        opset_version=ONNX_OPSET,
+    )
+
+
+if __name__ == "__main__":
+    export(sys.argv[1])
@@ -21,9 +21,18 @@ def initialize_log(logging_level):
 def main():
     number_workers = int(os.getenv("N_WORKERS"))
     id_worker = int(os.getenv("WORKER_ID"))
+    publisher_batch_size = int(os.getenv("PUBLISHER_BATCH_SIZE", "1"))
+    prefetch_count = int(os.getenv("PREFETCH_COUNT", "1"))
+    group_commit_size = int(os.getenv("GROUP_COMMIT_SIZE", "1"))
+    consume_batch_size = int(os.getenv("CONSUME_BATCH_SIZE", "1"))
+    inference_batch_size = int(os.getenv("NLP_BATCH_SIZE", "32"))
+    cache_size = int(os.getenv("NLP_CACHE_SIZE", "100000"))
+    sentiment_backend = os.getenv("NLP_BACKEND", "pytorch")
+    model_dir = os.getenv("NLP_MODEL_DIR") or None
+    nlp_processes = int(os.getenv("NLP_PROCESSES", "1")) or os.cpu_count()
     initialize_log("INFO")
 
-    aggregator = AggregatorNlp(number_workers, id_worker)
+    aggregator = AggregatorNlp(number_workers, id_worker, publisher_batch_size=publisher_batch_size, prefetch_count=prefetch_count, group_commit_size=group_commit_size, consume_batch_size=consume_batch_size, inference_batch_size=inference_batch_size, cache_size=cache_size, sentiment_backend=sentiment_backend, model_dir=model_dir, nlp_processes=nlp_processes)
     aggregator.start()
     
 if __name__ == "__main__":
@@ -0,0 +1,185 @@
+from transformers import AutoConfig, AutoModelForSequenceClassification, AutoTokenizer
+import abc
+import gc
+import logging
+import math
+import multiprocessing
+import signal
+import torch
+
+torch.set_num_threads(1)
+
+MODEL = 'distilbert-base-uncased-finetuned-sst-2-english'
+ONNX_MODEL_FILE = 'model.onnx'
+MAX_OVERVIEW_CHARS = 512
+DEFAULT_INFERENCE_BATCH_SIZE = 32
+DEFAULT_BACKEND = 'pytorch'
+POOL_TIMEOUT = 120  # segundos para clasificar un lote en el pool antes de darlo por perdido
+
+
+class SentimentBackend(abc.ABC):
+    """
+    Modelo que clasifica un batch de textos. Se carga del directorio local model_dir
+    (ver export_model.py) sin acceder a la red, o del hub de HuggingFace si no se indica.
+    """
+
+    def __init__(self, model_dir=None):
+        self.model_source = model_dir or MODEL
+        self.local_files_only = model_dir is not None
+        self.tokenizer = AutoTokenizer.from_pretrained(self.model_source, local_files_only=self.local_files_only)
+
+    @abc.abstractmethod
+    def predict(self, texts: list[str]) -> list[str]:
+        """Label de cada texto, en el mismo orden"""
+
+
+class PytorchBackend(SentimentBackend):
+    """El modelo original en float32"""
+
+    def __init__(self, model_dir=None):
+        super().__init__(model_dir)
+        self.model = AutoModelForSequenceClassification.from_pretrained(self.model_source, local_files_only=self.local_files_only)
+        self.model.eval()
+        self.labels = self.model.config.id2label
+
+    def predict(self, texts):
+        inputs = self.tokenizer(texts, padding=True, truncation=True, return_tensors='pt')
+        with torch.inference_mode():
+            predictions = self.model(**inputs).logits.argmax(dim=-1).tolist()
+        return [self.labels[prediction] for prediction in predictions]
+
+
+class QuantizedBackend(PytorchBackend):
+    """Las capas Linear cuantizadas dinamicamente a int8: menos memoria y mas rapido en CPU"""
+
+    def __init__(self, model_dir=None):
+        super().__init__(model_dir)
+        self.model = torch.quantization.quantize_dynamic(self.model, {torch.nn.Linear}, dtype=torch.qint8)
+
+
+class OnnxBackend(SentimentBackend):
+    """El modelo exportado a ONNX (model.onnx en model_dir), ejecutado con ONNX Runtime"""
+
+    def __init__(self, model_dir=None):
+        if model_dir is None:
+            raise ValueError("The onnx sentiment backend needs a local model directory")
+        try:
+            import onnxruntime
+        except ImportError as e:
+            raise ImportError("The onnx sentiment backend needs the onnxruntime package") from e
+        super().__init__(model_dir)
+        options = onnxruntime.SessionOptions()
+        options.intra_op_num_threads = 1
+        options.inter_op_num_threads = 1
+        self.session = onnxruntime.InferenceSession(f"{model_dir}/{ONNX_MODEL_FILE}", options, providers=['CPUExecutionProvider'])
+        self.labels = AutoConfig.from_pretrained(model_dir, local_files_only=True).id2label
+
+    def predict(self, texts):
+        inputs = self.tokenizer(texts, padding=True, truncation=True, return_tensors='np')
+        logits = self.session.run(['logits'], {
+            'input_ids': inputs['input_ids'].astype('int64'),
+            'attention_mask': inputs['attention_mask'].astype('int64'),
+        })[0]
+        return [self.labels[int(prediction)] for prediction in logits.argmax(axis=-1)]
+
+
+BACKENDS = {
+    'pytorch': PytorchBackend,
+    'int8': QuantizedBackend,
+    'onnx': OnnxBackend,
+}
+
+
+def load_backend(name=DEFAULT_BACKEND, model_dir=None) -> SentimentBackend:
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown sentiment backend {name}, expected one of {', '.join(BACKENDS)}")
+    return BACKENDS[name](model_dir or None)
+
+
+# Backend de los procesos del pool: lo heredan del proceso consumidor al hacer fork
+worker_backend: SentimentBackend | None = None
+
+
+def init_worker():
+    # Los workers no tienen que ejecutar el handler de señales del nodo (cierra la conexion a RabbitMQ)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+
+def predict_in_worker(texts):
+    return worker_backend.predict(texts)
+
+
+class SentimentClassifier:
+    """
+    Clasificador de sentimiento de los overviews. En lugar de pasar los textos de
+    a uno por el modelo, los agrupa en batches de inference_batch_size con padding
+    y corre el backend una vez por batch. Con un cache, solo pasan por el modelo
+    los textos que no estan cacheados.
+
+    Con processes > 1 los batches se reparten entre un pool de procesos creado con
+    fork despues de cargar el modelo: todos comparten la misma copia de los pesos
+    (copy-on-write) y cada uno usa un core. El proceso consumidor solo reparte los
+    batches y junta los labels, en el mismo orden. El pool se tiene que crear antes
+    de abrir la conexion a RabbitMQ y de iniciar otros procesos, para que los workers
+    no hereden sus sockets. Si un worker muere, Pool lo reemplaza pero su tarea no
+    vuelve nunca: pasado POOL_TIMEOUT se descarta el pool y se clasifica en el proceso.
+    """
+
+    def __init__(self, backend: SentimentBackend, inference_batch_size=DEFAULT_INFERENCE_BATCH_SIZE, cache=None, processes=1):
+        global worker_backend
+        self.backend = backend
+        self.inference_batch_size = max(1, inference_batch_size)
+        self.cache = cache
+        self.processes = processes
+        self.pool = None
+        if processes > 1:
+            worker_backend = backend
+            # Los objetos ya creados no se vuelven a tocar por el gc, asi sus paginas siguen compartidas
+            gc.freeze()
+            self.pool = multiprocessing.get_context('fork').Pool(processes, initializer=init_worker)
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.terminate()
+            self.pool.join()
+            self.pool = None
+
+    def predict_in_pool(self, chunks):
+        try:
+            return self.pool.map_async(predict_in_worker, chunks, chunksize=1).get(POOL_TIMEOUT)
+        except multiprocessing.TimeoutError:
+            logging.warning(f"action: sentiment_pool | result: fail | error: no result after {POOL_TIMEOUT}s, classifying in process")
+            self.close()
+            return [self.backend.predict(chunk) for chunk in chunks]
+
+    @staticmethod
+    def truncate(overview: str) -> str:
+        return overview[:MAX_OVERVIEW_CHARS]
+
+    def classify(self, texts) -> dict[str, str]:
+        """
+        Devuelve {texto: label} para los textos dados. Los textos repetidos se
+        clasifican una sola vez, y se ordenan por largo para que cada batch
+        tenga el menor padding posible.
+        """
+        unique_texts = set(texts)
+        sentiments = {}
+        if self.cache is not None:
+            cached, unique_texts = self.cache.get_many(unique_texts)
+        unique_texts = sorted(unique_texts, key=len)
+        batch_size = self.inference_batch_size
+        if self.pool is not None:
+            # Batches mas chicos si no alcanzan para ocupar a todos los procesos
+            batch_size = max(1, min(batch_size, math.ceil(len(unique_texts) / self.processes)))
+        chunks = [unique_texts[start:start + batch_size] for start in range(0, len(unique_texts), batch_size)]
+        if self.pool is not None and len(chunks) > 1:
+            predictions = self.predict_in_pool(chunks)
+        else:
+            predictions = [self.backend.predict(chunk) for chunk in chunks]
+        for chunk, labels in zip(chunks, predictions):
+            sentiments.update(zip(chunk, labels))
+        if self.cache is not None:
+            self.cache.put_many(sentiments)
+            sentiments.update(cached)
+        return sentiments
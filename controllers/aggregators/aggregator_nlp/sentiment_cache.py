@@ -0,0 +1,89 @@
+import hashlib
+import json
+import logging
+import os
+from collections import OrderedDict
+from common.file_manager import FileManager
+
+DEFAULT_CACHE_SIZE = 100000
+CACHE_PATH = ".data/sentiment_cache"
+
+
+class SentimentCache:
+    """
+    Cache LRU persistente de {hash del overview truncado: label}. Los clientes
+    reenvian el mismo dataset, asi que a partir del segundo casi no se corre el modelo.
+
+    Se guarda como un log de registros de FileManager en el volumen .data del
+    controller: cada classify agrega un registro con los labels nuevos, y al cargar
+    se reproduce el log en orden. Cuando el log supera el doble de la capacidad se
+    reescribe solo con las entradas vigentes.
+    """
+
+    def __init__(self, capacity=DEFAULT_CACHE_SIZE, path=CACHE_PATH):
+        self.capacity = capacity
+        self.log = FileManager(path)
+        self.entries = OrderedDict()
+        self.logged_entries = 0
+        self.hits = 0
+        self.misses = 0
+        self.load()
+
+    @staticmethod
+    def key(text: str) -> str:
+        return hashlib.blake2b(text.encode('utf-8'), digest_size=16).hexdigest()
+
+    def load(self):
+        if self.capacity <= 0:
+            return
+        FileManager.recover(self.log.path)
+        for record in self.log.records():
+            for key, label in json.loads(record):
+                self.entries[key] = label
+                self.entries.move_to_end(key)
+                self.logged_entries += 1
+        while len(self.entries) > self.capacity:
+            self.entries.popitem(last=False)
+        logging.info(f"action: load_sentiment_cache | entries: {len(self.entries)}")
+
+    def get_many(self, texts) -> tuple[dict[str, str], list[str]]:
+        """Devuelve ({texto: label} de los cacheados, textos que faltan)"""
+        found, missing = {}, []
+        for text in texts:
+            key = self.key(text)
+            label = self.entries.get(key)
+            if label is None:
+                missing.append(text)
+                self.misses += 1
+            else:
+                self.entries.move_to_end(key)
+                found[text] = label
+                self.hits += 1
+        return found, missing
+
+    def put_many(self, sentiments: dict[str, str]):
+        if self.capacity <= 0 or not sentiments:
+            return
+        new_entries = [(self.key(text), label) for text, label in sentiments.items()]
+        for key, label in new_entries:
+            self.entries[key] = label
+            self.entries.move_to_end(key)
+        while len(self.entries) > self.capacity:
+            self.entries.popitem(last=False)
+        # Es un cache: si se pierde lo ultimo escrito se vuelve a calcular, no hace falta fsync
+        self.log.append_record(json.dumps(new_entries).encode('utf-8'), sync=False)
+        self.logged_entries += len(new_entries)
+        if self.logged_entries > 2 * self.capacity:
+            self.compact()
+
+    def compact(self):
+        compacted = FileManager(self.log.tmp_path)
+        FileManager.clean_temp_files([compacted.path])
+        compacted.append_record(json.dumps(list(self.entries.items())).encode('utf-8'))
+        os.replace(compacted.path, self.log.path)
+        self.logged_entries = len(self.entries)
+
+    def stats(self) -> str:
+        total = self.hits + self.misses
+        hit_rate = self.hits / total if total else 0.0
+        return f"hits: {self.hits} | misses: {self.misses} | hit_rate: {hit_rate:.2f} | entries: {len(self.entries)}"
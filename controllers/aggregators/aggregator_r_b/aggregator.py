@@ -4,15 +4,18 @@ from common.middleware_message_protocol import MiddlewareMessage, MiddlewareMess
 from common.defines import QueryNumber
 from common.middleware_connection_handler import RabbitMQConnectionHandler
 from common.resilient_node import ResilientNode
+from common.columnar_batch import ColumnarBatch, ColumnType
 
-BUDGET = 1
-REVENUE = 2
+SENTIMENT = "sentiment"
+BUDGET = "budget"
+REVENUE = "revenue"
+RESULT_SCHEMA = [("sentiment", ColumnType.STRING), ("rate", ColumnType.FLOAT)]
 
 # Columns needed: ["id", "title", "overview", "budget", "revenue"]
 
 class AggregatorRB(ResilientNode):
     data: object
-    def __init__(self, number_workers, worker_id):
+    def __init__(self, number_workers, worker_id, publisher_batch_size=1, prefetch_count=1, group_commit_size=1, consume_batch_size=1):
         super().__init__()  # Call parent constructor
         self.worker_id = worker_id
         self.number_workers = number_workers
@@ -25,8 +28,11 @@ class AggregatorRB(ResilientNode):
             },
             consumer_exchange_name="aggregator_nlp_exchange",
             consumer_queues_to_recv_from=[f"aggregated_nlp_data_queue_{self.worker_id}"],
+            publisher_batch_size=publisher_batch_size,
+            prefetch_count=prefetch_count,
+            group_commit_size=group_commit_size,
         )
-        self.rabbitmq_connection_handler.set_message_consumer_callback(f"aggregated_nlp_data_queue_{self.worker_id}", self.callback)
+        self.set_consumer_callback(f"aggregated_nlp_data_queue_{self.worker_id}", self.callback, consume_batch_size)
         self.clients_state = {}  # Dictionary to store local state of clients
         self.load_state()
 
@@ -55,7 +61,7 @@ class AggregatorRB(ResilientNode):
                     # Send the ABORT message to all workers
                     self.rabbitmq_connection_handler.send_message(
                         routing_key=f"aggregated_r_b_data_queue_{id_worker}",
-                        msg_body=msg.encode_to_str()
+                        msg_body=msg.encode_to_bytes()
                     )
                 del self.clients_state[data.client_id]
                 self.save_state()
@@ -73,9 +79,9 @@ class AggregatorRB(ResilientNode):
             return
         
         if data.type != MiddlewareMessageType.EOF_MOVIES:
-            lines = data.get_batch_iter_from_payload()
+            batch = data.get_columnar_batch()
             seq_number = self.clients_state[data.client_id]["last_seq_number"]
-            self.handler_aggregator_query_5(lines, data.client_id, seq_number, data.query_number)
+            self.handler_aggregator_query_5(batch, data.client_id, seq_number, data.query_number)
 
             self.clients_state[data.client_id]["last_seq_number"] += 1
             self.clients_state[data.client_id][data.controller_name] = data.seq_number
@@ -94,47 +100,39 @@ class AggregatorRB(ResilientNode):
                 for id_worker in range(self.number_workers):
                     self.rabbitmq_connection_handler.send_message(
                         routing_key=f"aggregated_r_b_data_queue_{id_worker}",
-                        msg_body=msg.encode_to_str()
+                        msg_body=msg.encode_to_bytes()
                     )
                 del self.clients_state[data.client_id]
         self.save_state()
         
-    def aggregator_r_b(self, movie):
+    def aggregator_r_b(self, budget, revenue):
         try:
-            revenue = float(movie[REVENUE])
-            budget = float(movie[BUDGET])
             rate = revenue / budget
             
             return True, rate
-        except (IndexError, ValueError):
-            logging.error(f"Invalid release date format for movie: {movie}")
+        except ZeroDivisionError:
+            logging.error(f"Invalid budget for movie: {budget}")
             return False, 0
 
-    def handler_aggregator_query_5(self, lines, client_id, seq_number, query_number):
+    def handler_aggregator_query_5(self, batch, client_id, seq_number, query_number):
         filtered_lines = []
-        for line in lines:
-            could_aggregate, rate_value = self.aggregator_r_b(line)
+        for sentiment, budget, revenue in batch.rows(SENTIMENT, BUDGET, REVENUE):
+            could_aggregate, rate_value = self.aggregator_r_b(budget, revenue)
             if could_aggregate:
-                filtered_line = []
-                # Agregar el rate
-                filtered_line.append(line[0])
-                filtered_line.append(str(rate_value))
-                filtered_lines.append(filtered_line)
+                filtered_lines.append([sentiment, rate_value])
 
-        # if filtered_lines:
-            # Join all filtered lines into a single CSV string
-        result_csv = MiddlewareMessage.write_csv_batch(filtered_lines)
+        result_batch = ColumnarBatch.from_rows(RESULT_SCHEMA, filtered_lines).to_bytes()
         msg = MiddlewareMessage(
             query_number=query_number,
             client_id=client_id,
             seq_number=seq_number,
             type=MiddlewareMessageType.MOVIES_BATCH,
-            payload=result_csv, 
+            payload=result_batch,
             controller_name=self.controller_name
         )
         id_worker = seq_number % self.number_workers
         self.rabbitmq_connection_handler.send_message(
             routing_key=f"aggregated_r_b_data_queue_{id_worker}",
-            msg_body=msg.encode_to_str()
+            msg_body=msg.encode_to_bytes()
         )
         
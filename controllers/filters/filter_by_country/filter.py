@@ -3,20 +3,29 @@ from common.middleware_message_protocol import MiddlewareMessage, MiddlewareMess
 from common.defines import QueryNumber
 from common.middleware_connection_handler import RabbitMQConnectionHandler
 from common.resilient_node import ResilientNode
-import ast
+from common.dictionary import COUNTRIES
+from common.columnar_batch import ColumnType
+from common.query_plan import QUERIES, query_bit
 
-PROD_COUNTRIES = 5
-ID = 0
-TITLE = 1
-GENRES = 2
-YEAR = 3
+PROD_COUNTRIES = "production_countries"
+ID = "id"
+TITLE = "title"
+GENRES = "genres"
+YEAR = "release_date"
+QUERY_COLUMNS = {
+    QueryNumber.QUERY_1: (TITLE, GENRES, YEAR),
+    QueryNumber.QUERY_3: (ID, TITLE, YEAR),
+    QueryNumber.QUERY_4: (ID, YEAR),
+}
+# ALL_QUERYS: un solo mensaje con las columnas de las tres queries y la mascara QUERIES
+ALL_QUERYS_COLUMNS = (ID, TITLE, GENRES, YEAR)
 
 
 class FilterByCountry(ResilientNode):
     countries: list
     data: object
 
-    def __init__(self, id_worker, number_workers):
+    def __init__(self, id_worker, number_workers, publisher_batch_size=1, prefetch_count=1, group_commit_size=1, consume_batch_size=1):
         super().__init__()  # Call parent constructor
         self.id_worker = id_worker
         self.number_workers = number_workers
@@ -26,13 +35,22 @@ class FilterByCountry(ResilientNode):
                 **{f"country_queue_{i}": [f"country_queue_{i}"] for i in range(self.number_workers)}
             },
             consumer_exchange_name="movies_preprocessor_exchange",
-            consumer_queues_to_recv_from=[f"cleaned_movies_queue_country_{self.id_worker}"]
+            consumer_queues_to_recv_from=[f"cleaned_movies_queue_country_{self.id_worker}"],
+            publisher_batch_size=publisher_batch_size,
+            prefetch_count=prefetch_count,
+            group_commit_size=group_commit_size,
         )        
         # Configurar el callback para la cola específica
-        self.rabbitmq_connection_handler.set_message_consumer_callback(f"cleaned_movies_queue_country_{self.id_worker}", self.callback)
-        self.countries_query_1 = ["Argentina", "Spain"] 
-        self.countries_query_3 = ["Argentina"] 
-        self.countries_query_4 = ["Argentina"]
+        self.set_consumer_callback(f"cleaned_movies_queue_country_{self.id_worker}", self.callback, consume_batch_size)
+        # Paises de cada query como mascara de bits de sus codigos
+        self.countries_query_1 = COUNTRIES.mask_of(["Argentina", "Spain"])
+        self.countries_query_3 = COUNTRIES.mask_of(["Argentina"])
+        self.countries_query_4 = COUNTRIES.mask_of(["Argentina"])
+        self.countries_filters = [
+            (query_bit(QueryNumber.QUERY_1), self.countries_query_1),
+            (query_bit(QueryNumber.QUERY_3), self.countries_query_3),
+            (query_bit(QueryNumber.QUERY_4), self.countries_query_4),
+        ]
         self.clients_state = {}  # Dictionary to store local state of clients
         self.controller_name = f"filter_by_country_{id_worker}"
         self.load_state()
@@ -62,7 +80,7 @@ class FilterByCountry(ResilientNode):
                     # Send the ABORT message to all workers
                     self.rabbitmq_connection_handler.send_message(
                         routing_key=f"country_queue_{id_worker}",
-                        msg_body=msg.encode_to_str()
+                        msg_body=msg.encode_to_bytes()
                     )
                 del self.clients_state[data.client_id]
                 self.save_state()
@@ -80,16 +98,16 @@ class FilterByCountry(ResilientNode):
             return
         
         if data.type != MiddlewareMessageType.EOF_MOVIES:
-            lines = data.get_batch_iter_from_payload()
+            batch = data.get_columnar_batch()
             seq_number = self.clients_state[data.client_id]["last_seq_number"]
             if data.query_number == QueryNumber.ALL_QUERYS:
-                self.handler_all_query(lines, data.client_id, seq_number)
+                self.handler_all_query(batch, data.client_id, seq_number)
             elif data.query_number == QueryNumber.QUERY_1:
-                self.handler_country_filter(lines, self.countries_query_1, data.client_id, data.query_number, seq_number)
+                self.handler_country_filter(batch, self.countries_query_1, data.client_id, data.query_number, seq_number)
             elif data.query_number == QueryNumber.QUERY_3:
-                self.handler_country_filter(lines, self.countries_query_3, data.client_id, data.query_number, seq_number)
+                self.handler_country_filter(batch, self.countries_query_3, data.client_id, data.query_number, seq_number)
             elif data.query_number == QueryNumber.QUERY_4:
-                self.handler_country_filter(lines, self.countries_query_4, data.client_id, data.query_number, seq_number)
+                self.handler_country_filter(batch, self.countries_query_4, data.client_id, data.query_number, seq_number)
             self.clients_state[data.client_id]["last_seq_number"] += 1
             self.clients_state[data.client_id][data.controller_name] = data.seq_number
         else:
@@ -109,86 +127,72 @@ class FilterByCountry(ResilientNode):
                     )
                     self.rabbitmq_connection_handler.send_message(
                         routing_key=f"country_queue_{self.id_worker}",
-                        msg_body=msg.encode_to_str()
+                        msg_body=msg.encode_to_bytes()
                     )
                 del self.clients_state[data.client_id]
         self.save_state()
 
-    def filter_by_country(self, movie, country_filter):
-        countries_of_movie = ast.literal_eval(movie[PROD_COUNTRIES])#<- es un string
-        has_countries = all(country in countries_of_movie for country in country_filter)
-        return has_countries
+    def filter_by_country(self, countries_of_movie, country_filter):
+        return COUNTRIES.mask(countries_of_movie) & country_filter == country_filter
 
-    def handler_all_query(self, lines, id_client, seq_number):
-        lines_to_filter = []
-        for line in lines:
-            lines_to_filter.append(line)
+    def handler_all_query(self, batch, id_client, seq_number):
+        """
+        Una sola pasada por las filas para Q1, Q3 y Q4: cada fila que cumple el
+        filtro de alguna sale una vez, con la mascara de esas queries en QUERIES.
+        FilterByYear separa las filas de cada query
+        """
+        filtered_rows = []
+        queries_of_rows = []
+        for i, countries in enumerate(batch.column(PROD_COUNTRIES)):
+            countries_mask = COUNTRIES.mask(countries)
+            queries = 0
+            for bit, country_filter in self.countries_filters:
+                if countries_mask & country_filter == country_filter:
+                    queries |= bit
+            if queries:
+                filtered_rows.append(i)
+                queries_of_rows.append(queries)
+        if not filtered_rows:
+            return
 
-        self.handler_country_filter(lines_to_filter, self.countries_query_1, id_client, QueryNumber.QUERY_1, seq_number)
-        self.clients_state[id_client]["last_seq_number"] += 1
-        seq_number = self.clients_state[id_client]["last_seq_number"]
-        self.handler_country_filter(lines_to_filter, self.countries_query_3, id_client, QueryNumber.QUERY_3, seq_number)
-        self.clients_state[id_client]["last_seq_number"] += 1
-        seq_number = self.clients_state[id_client]["last_seq_number"]
-        self.handler_country_filter(lines_to_filter, self.countries_query_4, id_client, QueryNumber.QUERY_4, seq_number)
-        
+        query_result = batch.take(filtered_rows, *ALL_QUERYS_COLUMNS).add_column(QUERIES, ColumnType.INT, queries_of_rows)
+        msg = MiddlewareMessage(
+            query_number=QueryNumber.ALL_QUERYS,
+            client_id=id_client,
+            seq_number=seq_number,
+            type=MiddlewareMessageType.MOVIES_BATCH,
+            payload=query_result.to_bytes(),
+            controller_name=self.controller_name
+        )
+        id_worker = seq_number % self.number_workers
+        self.rabbitmq_connection_handler.send_message(
+            routing_key=f"country_queue_{id_worker}",
+            msg_body=msg.encode_to_bytes()
+        )
 
-    def handler_country_filter(self, lines, countries_filter, id_client, query_number, seq_number):
-        filtered_lines = []
-        for line in lines:
-            if self.filter_by_country(line, countries_filter):
-                filtered_lines.append(line)          
-        # Join all filtered lines into a single CSV string
-        # if filtered_lines:
-            # Q1: [title, genres, release_date]
-            # Q3: [id, title, release_date]
-            # Q4: [id, release_date]
-        result_csv = None
-        msg = None
-        if query_number == QueryNumber.QUERY_1:
-            query_result = []
-            for line in filtered_lines:
-                query_result.append([line[1], line[2], line[3]])
-            result_csv = MiddlewareMessage.write_csv_batch(query_result)
-            msg = MiddlewareMessage(
-                query_number=query_number,
-                client_id=id_client,
-                seq_number=seq_number,
-                type=MiddlewareMessageType.MOVIES_BATCH,
-                payload=result_csv,
-                controller_name=self.controller_name
-            )
-        elif query_number == QueryNumber.QUERY_3:
-            query_result = []
-            for line in filtered_lines:
-                query_result.append([line[0], line[1], line[3]])
-            result_csv = MiddlewareMessage.write_csv_batch(query_result)
-            msg = MiddlewareMessage(
-                query_number=query_number,
-                client_id=id_client,
-                seq_number=seq_number,
-                type=MiddlewareMessageType.MOVIES_BATCH,
-                payload=result_csv,
-                controller_name=self.controller_name
-            )
-        elif query_number == QueryNumber.QUERY_4:
-            query_result = []
-            for line in filtered_lines:
-                query_result.append([line[0], line[3]])
-            result_csv = MiddlewareMessage.write_csv_batch(query_result)
-            msg = MiddlewareMessage(
-                query_number=query_number,
-                client_id=id_client,
-                seq_number=seq_number,
-                type=MiddlewareMessageType.MOVIES_BATCH,
-                payload=result_csv,
-                controller_name=self.controller_name
-            )
+
+    def handler_country_filter(self, batch, countries_filter, id_client, query_number, seq_number):
+        filtered_rows = [
+            i for i, countries in enumerate(batch.column(PROD_COUNTRIES))
+            if self.filter_by_country(countries, countries_filter)
+        ]
+        # Q1: [title, genres, release_date]
+        # Q3: [id, title, release_date]
+        # Q4: [id, release_date]
+        query_result = batch.take(filtered_rows, *QUERY_COLUMNS[query_number])
+        msg = MiddlewareMessage(
+            query_number=query_number,
+            client_id=id_client,
+            seq_number=seq_number,
+            type=MiddlewareMessageType.MOVIES_BATCH,
+            payload=query_result.to_bytes(),
+            controller_name=self.controller_name
+        )
         
         id_worker = seq_number % self.number_workers
         self.rabbitmq_connection_handler.send_message(
             routing_key=f"country_queue_{id_worker}",
-            msg_body=msg.encode_to_str()
+            msg_body=msg.encode_to_bytes()
         )
 
     def handler_eof_all_querys(self, data, seq_number):
@@ -206,6 +210,6 @@ class FilterByCountry(ResilientNode):
                 # Send EOF message to all workers
                 self.rabbitmq_connection_handler.send_message(
                     routing_key=f"country_queue_{id_worker}",
-                    msg_body=msg.encode_to_str()
+                    msg_body=msg.encode_to_bytes()
                 )
                 initial_seq_number += 1
@@ -3,14 +3,14 @@ from common.middleware_message_protocol import MiddlewareMessage, MiddlewareMess
 from common.middleware_connection_handler import RabbitMQConnectionHandler
 from common.resilient_node import ResilientNode
 
-PROD_COUNTRIES = 5
-BUDGET = 7
+PROD_COUNTRIES = "production_countries"
+BUDGET = "budget"
 
 class FilterByCountryInvesment(ResilientNode):
     countries: list
     data: object
 
-    def __init__(self, id_worker, number_workers):
+    def __init__(self, id_worker, number_workers, publisher_batch_size=1, prefetch_count=1, group_commit_size=1, consume_batch_size=1):
         super().__init__()  # Call parent constructor
         self.id_worker = id_worker
         self.number_workers = number_workers
@@ -21,8 +21,11 @@ class FilterByCountryInvesment(ResilientNode):
             },
             consumer_exchange_name="movies_preprocessor_exchange",
             consumer_queues_to_recv_from=[f"cleaned_movies_queue_country_invesment_{self.id_worker}"],
+            publisher_batch_size=publisher_batch_size,
+            prefetch_count=prefetch_count,
+            group_commit_size=group_commit_size,
         )
-        self.rabbitmq_connection_handler.set_message_consumer_callback(f"cleaned_movies_queue_country_invesment_{self.id_worker}", self.callback)
+        self.set_consumer_callback(f"cleaned_movies_queue_country_invesment_{self.id_worker}", self.callback, consume_batch_size)
         self.controller_name = f"filter_by_country_invesment_{id_worker}"
         self.clients_state = {}  # Dictionary to store local state of clients
         self.load_state()  # Load the state of clients from file
@@ -52,7 +55,7 @@ class FilterByCountryInvesment(ResilientNode):
                     # Send the ABORT message to all workers
                     self.rabbitmq_connection_handler.send_message(
                         routing_key=f"filter_by_country_invesment_queue_{id_worker}",
-                        msg_body=msg.encode_to_str()
+                        msg_body=msg.encode_to_bytes()
                     )
                 
                 del self.clients_state[data.client_id]
@@ -71,9 +74,9 @@ class FilterByCountryInvesment(ResilientNode):
             return
         
         if data.type != MiddlewareMessageType.EOF_MOVIES:        
-            lines = data.get_batch_iter_from_payload()
+            batch = data.get_columnar_batch()
             seq_number = self.clients_state[data.client_id]["last_seq_number"]
-            self.handler_filter(lines, data.client_id, seq_number, data.query_number)
+            self.handler_filter(batch, data.client_id, seq_number, data.query_number)
 
             self.clients_state[data.client_id]["last_seq_number"] += 1
             self.clients_state[data.client_id][data.controller_name] = data.seq_number  # Update the last seq number for this controller
@@ -94,44 +97,32 @@ class FilterByCountryInvesment(ResilientNode):
                     # Send EOF message to all workers
                     self.rabbitmq_connection_handler.send_message(
                         routing_key=f"filter_by_country_invesment_queue_{id_worker}",
-                        msg_body=msg.encode_to_str()
+                        msg_body=msg.encode_to_bytes()
                     )
                 del self.clients_state[data.client_id]  # Clean up state for this client
         self.save_state()  # Save state after processing each message
 
-    def filter_by_country_invesment(self, movie):
-        raw_value = movie[PROD_COUNTRIES].strip()
+    def filter_by_country_invesment(self, countries_of_movie):
+        return len(countries_of_movie) == 1
 
-        if raw_value == "[]" or not raw_value:
-            return False
+    def handler_filter(self, batch, client_id, seq_number, query_number):
+        filtered_rows = [
+            i for i, countries in enumerate(batch.column(PROD_COUNTRIES))
+            if self.filter_by_country_invesment(countries)
+        ]
 
-        countries_of_movie = raw_value.strip("[]").replace("'", "").split(", ")
-        countries_of_movie = [c for c in countries_of_movie if c.strip()]
-
-        if len(countries_of_movie) == 1:
-            return True
-        return False
-
-    def handler_filter(self, lines, client_id, seq_number, query_number):
-        filtered_lines = []
-        for line in lines:
-            if self.filter_by_country_invesment(line):
-                result_data = [line[PROD_COUNTRIES], line[BUDGET]]
-                filtered_lines.append(result_data)
-
-        result_csv = MiddlewareMessage.write_csv_batch(filtered_lines)
+        result_batch = batch.take(filtered_rows, PROD_COUNTRIES, BUDGET)
         msg = MiddlewareMessage(
                 query_number=query_number,
                 client_id=client_id,
                 seq_number=seq_number,
                 type=MiddlewareMessageType.MOVIES_BATCH,
-                payload=result_csv,
+                payload=result_batch.to_bytes(),
                 controller_name=self.controller_name
             )
         
         id_worker = seq_number % self.number_workers
         self.rabbitmq_connection_handler.send_message(
             routing_key=f"filter_by_country_invesment_queue_{id_worker}",
-            msg_body=msg.encode_to_str()
+            msg_body=msg.encode_to_bytes()
         )
-        
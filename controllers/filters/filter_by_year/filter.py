@@ -1,33 +1,48 @@
 import logging
+from common.columnar_batch import year_of
 from common.resilient_node import ResilientNode
 from common.middleware_message_protocol import MiddlewareMessage, MiddlewareMessageType
 from common.defines import QueryNumber
 from common.middleware_connection_handler import RabbitMQConnectionHandler
+from common.partitioner import ConsistentHashRing, DEFAULT_VNODES
+from common.query_plan import QUERIES, query_bit
 
-YEAR_Q1 = 2 # release_date position
-YEAR_Q3 = 2 # release_date position for query 3
-YEAR_Q4 = 1 # release_date position for query 4
+ID = "id"
+TITLE = "title"
+GENRES = "genres"
+YEAR = "release_date" # YYYYMMDD
 class FilterByYear(ResilientNode):
     year: int
     data: object
 
-    def __init__(self, number_workers, number_sinkers, id_worker):
+    def __init__(self, number_workers, number_sinkers, id_worker, publisher_batch_size=1, prefetch_count=1, group_commit_size=1, consume_batch_size=1, number_joiners=None, vnodes=DEFAULT_VNODES):
         super().__init__()  # Call parent constructor
+        # Mismo anillo que los preprocessors de ratings y credits, para que cada pelicula
+        # llegue al mismo joiner que sus ratings y sus creditos
+        self.joiners_ring = ConsistentHashRing(range(number_joiners or number_workers), vnodes)
         self.id_worker = id_worker
         self.year_range_query_1 = (2000, 2009)
         self.year_range_query_3 = (2000, None)
         self.year_range_query_4 = (2000, None)
+        self.year_filters = {
+            QueryNumber.QUERY_1: self.year_range_query_1,
+            QueryNumber.QUERY_3: self.year_range_query_3,
+            QueryNumber.QUERY_4: self.year_range_query_4,
+        }
         self.rabbitmq_connection_handler = RabbitMQConnectionHandler(
             producer_exchange_name="filter_by_year_exchange",
             producer_queues_to_bind={
                 **{f"sink_query_1_queue_{i}": [f"sink_query_1_queue_{i}"] for i in range(number_sinkers)},
-                **{f"joiner_by_ratings_movies_queue_{i}": [f"joiner_by_ratings_movies_queue_{i}"] for i in range(number_workers)},
-                **{f"joiner_by_credits_movies_queue_{i}": [f"joiner_by_credits_movies_queue_{i}"] for i in range(number_workers)},
+                **{f"joiner_by_ratings_movies_queue_{i}": [f"joiner_by_ratings_movies_queue_{i}"] for i in self.joiners_ring.nodes},
+                **{f"joiner_by_credits_movies_queue_{i}": [f"joiner_by_credits_movies_queue_{i}"] for i in self.joiners_ring.nodes},
             },
             consumer_exchange_name="filter_by_country_exchange",
             consumer_queues_to_recv_from=[f"country_queue_{id_worker}"],
+            publisher_batch_size=publisher_batch_size,
+            prefetch_count=prefetch_count,
+            group_commit_size=group_commit_size,
         )
-        self.rabbitmq_connection_handler.set_message_consumer_callback(f"country_queue_{id_worker}", self.callback)
+        self.set_consumer_callback(f"country_queue_{id_worker}", self.callback, consume_batch_size)
         self.number_workers = number_workers
         self.number_sinkers = number_sinkers
         self.controller_name = f"filter_by_year_{id_worker}"
@@ -64,8 +79,9 @@ class FilterByYear(ResilientNode):
                         seq_number=data.seq_number,
                         typeMsg=MiddlewareMessageType.ABORT,
                     )
+                for id_joiner in self.joiners_ring.nodes:
                     self.send_message_queue(
-                        routing_key=f"joiner_by_ratings_movies_queue_{id_worker}",
+                        routing_key=f"joiner_by_ratings_movies_queue_{id_joiner}",
                         data="",
                         query_number=data.query_number,
                         client_id=data.client_id,
@@ -94,14 +110,16 @@ class FilterByYear(ResilientNode):
             return
         
         if data.type != MiddlewareMessageType.EOF_MOVIES:    
-            lines = data.get_batch_iter_from_payload()
+            batch = data.get_columnar_batch()
             seq_number = self.clients_state[data.client_id]["last_seq_number"]
-            if data.query_number == QueryNumber.QUERY_1:
-                self.handler_year_filter(lines, self.year_range_query_1, data.query_number, data.client_id, YEAR_Q1, seq_number)
+            if data.query_number == QueryNumber.ALL_QUERYS:
+                self.handler_all_querys(batch, data.client_id, seq_number)
+            elif data.query_number == QueryNumber.QUERY_1:
+                self.handler_year_filter(batch, self.year_range_query_1, data.query_number, data.client_id, seq_number)
             elif data.query_number == QueryNumber.QUERY_3:
-                self.handler_year_filter(lines, self.year_range_query_3, data.query_number, data.client_id, YEAR_Q3, seq_number)
+                self.handler_year_filter(batch, self.year_range_query_3, data.query_number, data.client_id, seq_number)
             elif data.query_number == QueryNumber.QUERY_4:
-                self.handler_year_filter(lines, self.year_range_query_4, data.query_number, data.client_id, YEAR_Q4, seq_number)
+                self.handler_year_filter(batch, self.year_range_query_4, data.query_number, data.client_id, seq_number)
             self.clients_state[data.client_id]["last_seq_number"] += 1
             self.clients_state[data.client_id][data.controller_name] = data.seq_number  # Update the last seq number for this controller
         else:
@@ -119,7 +137,8 @@ class FilterByYear(ResilientNode):
                         typeMsg=MiddlewareMessageType.EOF_MOVIES,
                     )    
                 elif data.query_number == QueryNumber.QUERY_3:
-                    for i in range(self.number_workers):
+                    logging.info(f"action: partition_load | client_id: {data.client_id} | {self.joiners_ring.load_stats()}")
+                    for i in self.joiners_ring.nodes:
                         self.send_message_queue(
                             routing_key=f"joiner_by_ratings_movies_queue_{i}",
                             data="",
@@ -129,7 +148,8 @@ class FilterByYear(ResilientNode):
                             typeMsg=MiddlewareMessageType.EOF_MOVIES,
                         )
                 elif data.query_number == QueryNumber.QUERY_4:
-                    for i in range(self.number_workers):
+                    logging.info(f"action: partition_load | client_id: {data.client_id} | {self.joiners_ring.load_stats()}")
+                    for i in self.joiners_ring.nodes:
                         self.send_message_queue(
                             routing_key=f"joiner_by_credits_movies_queue_{i}",
                             data="",
@@ -143,38 +163,53 @@ class FilterByYear(ResilientNode):
                 del self.clients_state[data.client_id]
         self.save_state()  # Save the state of the clients after processing the message
     
-    def filter_by_year(self, movie, year_filter, year_pos):
-        if not movie[year_pos]:
+    def filter_by_year(self, release_date, year_filter):
+        if not release_date:
             return False
-        
-        year_of_movie = movie[year_pos]
-        try:
-            release_year = int(year_of_movie.split('-')[0])
-            if isinstance(year_filter, tuple):
-                start, end = year_filter
 
-                if start is not None and end is not None:
-                    return start <= release_year <= end
-                elif start is not None:
-                    return release_year >= start
-                elif end is not None:
-                    return release_year <= end
-                else:
-                    return True  # (None, None) → no filtro
+        release_year = year_of(release_date)
+        if isinstance(year_filter, tuple):
+            start, end = year_filter
+
+            if start is not None and end is not None:
+                return start <= release_year <= end
+            elif start is not None:
+                return release_year >= start
+            elif end is not None:
+                return release_year <= end
             else:
-                return release_year == year_filter
-        except (IndexError, ValueError):
-            logging.error(f"Invalid release date format for movie: {movie}")
-            return False
+                return True  # (None, None) → no filtro
+        else:
+            return release_year == year_filter
+
+    def handler_all_querys(self, batch, client_id, seq_number):
+        """
+        Batch combinado de FilterByCountry: cada fila trae en QUERIES las queries
+        cuyo filtro de paises cumple. Se separan las filas de cada query con su
+        filtro de años y se envian como en handler_year_filter, con el mismo seq_number
+        """
+        rows_by_query = {query_number: [] for query_number in self.year_filters}
+        filters = [(query_bit(query_number), year_filter, rows_by_query[query_number]) for query_number, year_filter in self.year_filters.items()]
+        for i, (queries, release_date) in enumerate(zip(batch.column(QUERIES), batch.column(YEAR))):
+            passes = {}  # Q3 y Q4 tienen el mismo rango: se evalua una vez por fila
+            for bit, year_filter, rows in filters:
+                if queries & bit:
+                    if year_filter not in passes:
+                        passes[year_filter] = self.filter_by_year(release_date, year_filter)
+                    if passes[year_filter]:
+                        rows.append(i)
+        for query_number, rows in rows_by_query.items():
+            if rows:
+                self.send_query_rows(batch, rows, query_number, client_id, seq_number)
+
+    def handler_year_filter(self, batch, year_filter, query_number, client_id, seq_number):
+        filtered_rows = [
+            i for i, release_date in enumerate(batch.column(YEAR))
+            if self.filter_by_year(release_date, year_filter)
+        ]
+        self.send_query_rows(batch, filtered_rows, query_number, client_id, seq_number)
 
-    def handler_year_filter(self, lines, year_filter, query_number, client_id, year_pos, seq_number):
-        filtered_lines = []
-        for line in lines:
-            if self.filter_by_year(line, year_filter, year_pos):
-                filtered_lines.append(line)
-                
-        query_result = []
-        result_csv = None
+    def send_query_rows(self, batch, filtered_rows, query_number, client_id, seq_number):
         # Entradas
         # Q1: [title, genres, release_date]
         # Q3: [id, title, release_date]
@@ -184,51 +219,37 @@ class FilterByYear(ResilientNode):
         # Q3: [id, title]
         # Q4: [id]
         if query_number == QueryNumber.QUERY_1:
-            for line in filtered_lines:
-                query_result.append([line[0], line[1]])
             sinker_id = client_id % self.number_sinkers
-            result_csv = MiddlewareMessage.write_csv_batch(query_result) 
+            query_result = batch.take(filtered_rows, TITLE, GENRES)
             self.send_message_queue(
                 routing_key=f"sink_query_1_queue_{sinker_id}",
-                data=result_csv,
+                data=query_result.to_bytes(),
                 seq_number=seq_number,
                 query_number=query_number,
                 client_id=client_id
             )
         elif query_number == QueryNumber.QUERY_3:
-            sharding_data = {}
-            for line in filtered_lines:
-                sharding_key = int(line[0]) % self.number_workers
-                if sharding_key not in sharding_data:
-                    sharding_data[sharding_key] = []
-                sharding_data[sharding_key].append([line[0], line[1]])
-
-            for key, value in sharding_data.items():
-                result_csv = MiddlewareMessage.write_csv_batch([value])
-                self.send_message_queue(
-                    routing_key=f"joiner_by_ratings_movies_queue_{key}",
-                    data=result_csv,
-                    seq_number=seq_number,
-                    query_number=query_number,
-                    client_id=client_id
-                )
+            self.send_sharded(batch, filtered_rows, (ID, TITLE), "joiner_by_ratings_movies_queue", query_number, client_id, seq_number)
         elif query_number == QueryNumber.QUERY_4:
-            sharding_data = {}
-            for line in filtered_lines:
-                sharding_key = int(line[0]) % self.number_workers
-                if sharding_key not in sharding_data:
-                    sharding_data[sharding_key] = []
-                sharding_data[sharding_key].append(line[0])
+            self.send_sharded(batch, filtered_rows, (ID,), "joiner_by_credits_movies_queue", query_number, client_id, seq_number)
+
+    def send_sharded(self, batch, rows, columns, queue_prefix, query_number, client_id, seq_number):
+        ids = batch.column(ID)
+        sharding_data = {}
+        for i in rows:
+            sharding_key = self.joiners_ring.owner(ids[i])
+            if sharding_key not in sharding_data:
+                sharding_data[sharding_key] = []
+            sharding_data[sharding_key].append(i)
 
-            for key, value in sharding_data.items():
-                result_csv = MiddlewareMessage.write_csv_batch([value])
-                self.send_message_queue(
-                    routing_key=f"joiner_by_credits_movies_queue_{key}",
-                    data=result_csv,
-                    seq_number=seq_number,
-                    query_number=query_number,
-                    client_id=client_id
-                )
+        for key, shard_rows in sharding_data.items():
+            self.send_message_queue(
+                routing_key=f"{queue_prefix}_{key}",
+                data=batch.take(shard_rows, *columns).to_bytes(),
+                seq_number=seq_number,
+                query_number=query_number,
+                client_id=client_id
+            )
 
     def send_message_queue(self, routing_key, data, query_number, client_id, seq_number, typeMsg=MiddlewareMessageType.MOVIES_BATCH):
         msg = MiddlewareMessage(
@@ -241,5 +262,5 @@ class FilterByYear(ResilientNode):
         )
         self.rabbitmq_connection_handler.send_message(
             routing_key=routing_key,
-            msg_body=msg.encode_to_str()
+            msg_body=msg.encode_to_bytes()
         )
\ No newline at end of file
@@ -3,19 +3,19 @@ from common.middleware_message_protocol import MiddlewareMessage, MiddlewareMess
 from common.defines import QueryNumber
 from common.middleware_connection_handler import RabbitMQConnectionHandler
 from common.resilient_node import ResilientNode
+from common.columnar_batch import ColumnarBatch, ColumnType
+from common.dictionary import COUNTRIES
 
-PROD_COUNTRIES = 5
-ID = 0
-TITLE = 1
-GENRES = 2
-YEAR = 3
+PROD_COUNTRIES = "production_countries"
+BUDGET = "budget"
+RESULT_SCHEMA = [("country", ColumnType.CODE, COUNTRIES), ("budget", ColumnType.INT)]
 
 
 class GroupByCountry(ResilientNode):
     countries: list
     data: object
 
-    def __init__(self, number_sinkers, id_worker, number_workers):
+    def __init__(self, number_sinkers, id_worker, number_workers, publisher_batch_size=1, prefetch_count=1, group_commit_size=1, consume_batch_size=1):
         super().__init__()
         self.id_worker = id_worker
         self.number_workers = number_workers
@@ -26,9 +26,12 @@ class GroupByCountry(ResilientNode):
             },
             consumer_exchange_name="filter_by_country_invesment_exchange",
             consumer_queues_to_recv_from=[f"filter_by_country_invesment_queue_{self.id_worker}"],
+            publisher_batch_size=publisher_batch_size,
+            prefetch_count=prefetch_count,
+            group_commit_size=group_commit_size,
         )
         # Configurar el callback para la cola específica
-        self.rabbitmq_connection_handler.set_message_consumer_callback(f"filter_by_country_invesment_queue_{self.id_worker}", self.callback)
+        self.set_consumer_callback(f"filter_by_country_invesment_queue_{self.id_worker}", self.callback, consume_batch_size)
         self.number_sinkers = number_sinkers
         self.clients_state = {}  # Diccionario para almacenar el estado local de los clientes
         self.controller_name = f"group_by_country_{id_worker}"
@@ -59,7 +62,7 @@ class GroupByCountry(ResilientNode):
                     # Send the ABORT message to all sinkers
                     self.rabbitmq_connection_handler.send_message(
                         routing_key=f"group_by_country_queue_{id_sinker}",
-                        msg_body=msg.encode_to_str()
+                        msg_body=msg.encode_to_bytes()
                     )
                 del self.clients_state[data.client_id]
                 self.save_state()
@@ -77,9 +80,9 @@ class GroupByCountry(ResilientNode):
             return
         
         if data.type != MiddlewareMessageType.EOF_MOVIES:         
-            lines = data.get_batch_iter_from_payload()
+            batch = data.get_columnar_batch()
             seq_number = self.clients_state[data.client_id]["last_seq_number"]
-            self.handler_country_group_by(lines, data.client_id, data.query_number, seq_number)
+            self.handler_country_group_by(batch, data.client_id, data.query_number, seq_number)
             self.clients_state[data.client_id]["last_seq_number"] += 1
             self.clients_state[data.client_id][data.controller_name] = data.seq_number
         else:
@@ -97,33 +100,33 @@ class GroupByCountry(ResilientNode):
                 )
                 self.rabbitmq_connection_handler.send_message(
                     routing_key=f"group_by_country_queue_{sinker_number}",
-                    msg_body=msg.encode_to_str()
+                    msg_body=msg.encode_to_bytes()
                 )
                 del self.clients_state[data.client_id]  # Remove the controller state
         self.save_state()  # Save the state of clients to file
 
-    def handler_country_group_by(self, lines, id_client, query_number, seq_number):
-        agrouped_lines = []
-        country_group_by = {}
-        for line in lines:
-            country = line[0].strip("[]").replace("'", "")
-            if country not in country_group_by:
-                country_group_by[country] = 0
-            country_group_by[country] += int(line[1])
-        
-        [agrouped_lines.append([country, country_group_by[country]]) for country in country_group_by]
-        result_csv = MiddlewareMessage.write_csv_batch(agrouped_lines)
+    def handler_country_group_by(self, batch, id_client, query_number, seq_number):
+        # Acumuladores indexados por codigo de pais. None: el pais no aparecio en el batch
+        country_group_by = [None] * len(COUNTRIES)
+        for countries, budget in batch.rows(PROD_COUNTRIES, BUDGET):
+            code = countries[0]
+            if code >= len(country_group_by):
+                country_group_by.extend([None] * (len(COUNTRIES) - len(country_group_by)))
+            country_group_by[code] = (country_group_by[code] or 0) + int(budget)
+
+        totals = [(code, total) for code, total in enumerate(country_group_by) if total is not None]
+        result_batch = ColumnarBatch.from_rows(RESULT_SCHEMA, totals).to_bytes()
         msg = MiddlewareMessage(
             query_number=query_number,
             client_id=id_client,
             seq_number=seq_number,
             type=MiddlewareMessageType.MOVIES_BATCH,
-            payload=result_csv,
+            payload=result_batch,
             controller_name=self.controller_name
         )
        
         sinker_number = id_client % self.number_sinkers
         self.rabbitmq_connection_handler.send_message(
             routing_key=f"group_by_country_queue_{sinker_number}",
-            msg_body=msg.encode_to_str()
+            msg_body=msg.encode_to_bytes()
         )
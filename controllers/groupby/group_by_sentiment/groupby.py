@@ -3,16 +3,15 @@ from common.middleware_message_protocol import MiddlewareMessage, MiddlewareMess
 from common.defines import QueryNumber
 from common.middleware_connection_handler import RabbitMQConnectionHandler
 from common.resilient_node import ResilientNode
+from common.columnar_batch import ColumnarBatch, ColumnType
 
-PROD_COUNTRIES = 5
-ID = 0
-TITLE = 1
-GENRES = 2
-YEAR = 3
+SENTIMENT = "sentiment"
+RATE = "rate"
+RESULT_SCHEMA = [("sentiment", ColumnType.STRING), ("rate_sum", ColumnType.FLOAT), ("count", ColumnType.INT)]
 
 
 class GroupBySentiment(ResilientNode):
-    def __init__(self, number_sinkers, id_worker):
+    def __init__(self, number_sinkers, id_worker, publisher_batch_size=1, prefetch_count=1, group_commit_size=1, consume_batch_size=1):
         super().__init__()
         self.controller_name = f"group_by_sentiment_{id_worker}"
         self.id_worker = id_worker
@@ -23,10 +22,13 @@ class GroupBySentiment(ResilientNode):
                 **{f"group_by_sentiment_queue_{i}": [f"group_by_sentiment_queue_{i}"] for i in range(number_sinkers)}
             },
             consumer_exchange_name="aggregator_r_b_exchange",
-            consumer_queues_to_recv_from=[f"aggregated_r_b_data_queue_{id_worker}"]
+            consumer_queues_to_recv_from=[f"aggregated_r_b_data_queue_{id_worker}"],
+            publisher_batch_size=publisher_batch_size,
+            prefetch_count=prefetch_count,
+            group_commit_size=group_commit_size,
         )        
         # Configurar el callback para la cola específica
-        self.rabbitmq_connection_handler.set_message_consumer_callback(f"aggregated_r_b_data_queue_{id_worker}", self.callback)
+        self.set_consumer_callback(f"aggregated_r_b_data_queue_{id_worker}", self.callback, consume_batch_size)
         self.clients_state = {}  # Diccionario para almacenar el estado local de los clientes
         self.load_state()  # Cargar el estado de los clientes desde el archivo
 
@@ -55,7 +57,7 @@ class GroupBySentiment(ResilientNode):
                     # Send the ABORT message to all sinkers
                     self.rabbitmq_connection_handler.send_message(
                         routing_key=f"group_by_sentiment_queue_{id_sinker}",
-                        msg_body=msg.encode_to_str()
+                        msg_body=msg.encode_to_bytes()
                     )
                 del self.clients_state[data.client_id]
                 self.save_state()
@@ -73,9 +75,9 @@ class GroupBySentiment(ResilientNode):
             return
             
         if data.type != MiddlewareMessageType.EOF_MOVIES:        
-            lines = data.get_batch_iter_from_payload()
+            batch = data.get_columnar_batch()
             seq_number = self.clients_state[data.client_id]["last_seq_number"]
-            self.handler_group_by_sentiment(lines, data.client_id, data.query_number, seq_number)
+            self.handler_group_by_sentiment(batch, data.client_id, data.query_number, seq_number)
             self.clients_state[data.client_id]["last_seq_number"] += 1
             self.clients_state[data.client_id][data.controller_name] = data.seq_number
         else:
@@ -93,19 +95,18 @@ class GroupBySentiment(ResilientNode):
                 )
                 self.rabbitmq_connection_handler.send_message(
                     routing_key=f"group_by_sentiment_queue_{id_sinker}",
-                    msg_body=msg.encode_to_str()
+                    msg_body=msg.encode_to_bytes()
                 )
                 del self.clients_state[data.client_id]
         self.save_state()  
 
-    def handler_group_by_sentiment(self, lines, id_client, query_number, seq_number):
+    def handler_group_by_sentiment(self, batch, id_client, query_number, seq_number):
         agrouped_lines = []
         sentiment_group_by = {}
-        for line in lines:
-            sentiment = line[0]
+        for sentiment, rate in batch.rows(SENTIMENT, RATE):
             if sentiment not in sentiment_group_by:
                 sentiment_group_by[sentiment] = []
-            sentiment_group_by[sentiment].append(float(line[1]))
+            sentiment_group_by[sentiment].append(rate)
        
         
         [agrouped_lines.append([
@@ -114,17 +115,17 @@ class GroupBySentiment(ResilientNode):
             len(sentiment_group_by[sentiment])]
         ) for sentiment in sentiment_group_by]
         
-        result_csv = MiddlewareMessage.write_csv_batch(agrouped_lines)
+        result_batch = ColumnarBatch.from_rows(RESULT_SCHEMA, agrouped_lines).to_bytes()
         msg = MiddlewareMessage(
             query_number=query_number,
             client_id=id_client,
             seq_number=seq_number,
             type=MiddlewareMessageType.MOVIES_BATCH,
-            payload=result_csv,
+            payload=result_batch,
             controller_name=self.controller_name
         )
         id_sinker = id_client % self.number_sinkers
         self.rabbitmq_connection_handler.send_message(
             routing_key=f"group_by_sentiment_queue_{id_sinker}",
-            msg_body=msg.encode_to_str()
+            msg_body=msg.encode_to_bytes()
         )
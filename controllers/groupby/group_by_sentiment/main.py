@@ -21,9 +21,13 @@ def initialize_log(logging_level):
 def main():
     number_sinkers = int(os.getenv("N_SINKERS"))
     id_worker = int(os.getenv("WORKER_ID"))
+    publisher_batch_size = int(os.getenv("PUBLISHER_BATCH_SIZE", "1"))
+    prefetch_count = int(os.getenv("PREFETCH_COUNT", "1"))
+    group_commit_size = int(os.getenv("GROUP_COMMIT_SIZE", "1"))
+    consume_batch_size = int(os.getenv("CONSUME_BATCH_SIZE", "1"))
     initialize_log("INFO")
 
-    groupby = GroupBySentiment(number_sinkers=number_sinkers, id_worker=id_worker)
+    groupby = GroupBySentiment(number_sinkers=number_sinkers, id_worker=id_worker, publisher_batch_size=publisher_batch_size, prefetch_count=prefetch_count, group_commit_size=group_commit_size, consume_batch_size=consume_batch_size)
     groupby.start()
     
 if __name__ == "__main__":
@@ -5,34 +5,50 @@ from common.defines import QueryNumber
 from common.middleware_connection_handler import RabbitMQConnectionHandler
 from common.resilient_node import ResilientNode
 from common.file_manager import FileManager
+from common.state_store import DEFAULT_SNAPSHOT_EVERY, DEFAULT_SNAPSHOT_INTERVAL
+from common.columnar_batch import ColumnarBatch, ColumnType
+from common.partitioner import DEFAULT_VNODES
+from common.rebalance import RebalancingNode
+from common.movie_filter import MovieFilterPublisher
+from common.bloom_filter import DEFAULT_ERROR_RATE
 import time
 
-YEAR = 3  # release_date position
-class JoinerByCreditId(ResilientNode):
+ID = "id"
+CAST = "cast"
+RESULT_SCHEMA = [("actor", ColumnType.STRING), ("count", ColumnType.INT)]
+class JoinerByCreditId(ResilientNode, RebalancingNode, MovieFilterPublisher):
     year: int
     data: object
+    handoff_query_number = QueryNumber.QUERY_4
+    progress_fields = ("movies_eof", "credits_eof")
+    movie_filter_routing_key = "credits_movie_filter"
 
-    def __init__(self, id_worker, number_sinkers, number_workers):
-        super().__init__()  # Call parent constructor
+    def __init__(self, id_worker, number_sinkers, number_workers, prefetch_count=1, snapshot_every=DEFAULT_SNAPSHOT_EVERY, snapshot_interval=DEFAULT_SNAPSHOT_INTERVAL, number_joiners=None, vnodes=DEFAULT_VNODES, movie_filter_error_rate=DEFAULT_ERROR_RATE):
+        super().__init__(snapshot_every, snapshot_interval)  # Call parent constructor
         self.rabbitmq_connection_handler = RabbitMQConnectionHandler(
             producer_exchange_name="joiner_by_credit_id_exchange",
             producer_queues_to_bind={
-                **{f"average_credit_aggregated_{i}": [f"average_credit_aggregated_{i}"] for i in range(number_sinkers)}
+                **{f"average_credit_aggregated_{i}": [f"average_credit_aggregated_{i}"] for i in range(number_sinkers)},
+                **self.movie_filter_queues(self.movie_filter_routing_key, number_workers),
             },
             consumer_exchange_name="filter_by_year_exchange",
             consumer_queues_to_recv_from=[f"joiner_by_credits_movies_queue_{id_worker}", f"joiner_credits_by_id_queue_{id_worker}"],
             secondary_consumer_exchange_name="credits_preprocessor_exchange",
+            prefetch_count=prefetch_count,
         )
         
         # Diccionario para almacenar el estado por cliente
         self.clients_state = {}  # {client_id: {"movies_eof": bool, "credits_eof": bool}}     
         self.number_sinkers = number_sinkers
-        self.number_workers = number_workers  # Asumiendo que id_worker empieza en 0   
+        self.number_workers = number_workers  # Productores de cada cola, que envian un EOF cada uno
         self.controller_name = f"joiner_by_credit_id_{id_worker}"
+        self.incremental_state_fields = ("movies_per_actor",)
         # Configurar callbacks para ambas colas
         self.rabbitmq_connection_handler.set_message_consumer_callback(f"joiner_by_credits_movies_queue_{id_worker}", self.movies_callback)
         self.rabbitmq_connection_handler.set_message_consumer_callback(f"joiner_credits_by_id_queue_{id_worker}", self.credits_callback)
+        self.init_movie_filter(movie_filter_error_rate)
         self.load_state(self.check_files_state)  # Cargar el estado de los clientes desde el archivo
+        self.init_partitioning(id_worker, number_joiners or number_workers, vnodes)
 
     def start(self):
         logging.info("action: start | result: success | code: joiner_credit_by_id")
@@ -67,6 +83,10 @@ class JoinerByCreditId(ResilientNode):
             }
         # Chequear archivos al iniciar la carga del estado
 
+    @staticmethod
+    def input_queue(node):
+        return f"joiner_credits_by_id_queue_{node}"
+
     def movies_callback(self, ch, method, properties, body):
         """Callback para procesar mensajes de la cola de movies"""
         data = MiddlewareMessage.decode_from_bytes(body)
@@ -91,7 +111,7 @@ class JoinerByCreditId(ResilientNode):
             return
         
         if data.type != MiddlewareMessageType.EOF_MOVIES:
-            lines = list(data.get_batch_iter_from_payload())
+            lines = list(data.get_columnar_batch().rows(ID))
             filename = f".data/movies-client-{client_id}"
             self.clients_state[client_id]["hash_file"]["movies"] = self.save_data(filename, lines) # csv y .tmp
             self.clients_state[client_id][data.controller_name] = data.seq_number
@@ -105,6 +125,8 @@ class JoinerByCreditId(ResilientNode):
     def credits_callback(self, ch, method, properties, body):
         """Callback para procesar mensajes de la cola de credits"""
         data = MiddlewareMessage.decode_from_bytes(body)
+        if self.handle_rebalance_message(data):
+            return
 
         if data.type == MiddlewareMessageType.ABORT:
             logging.info(f"Received ABORT message from client {data.client_id}. Stopping processing.")
@@ -126,10 +148,11 @@ class JoinerByCreditId(ResilientNode):
             return
          
         if data.type != MiddlewareMessageType.EOF_CREDITS:
-            lines = list(data.get_batch_iter_from_payload())
+            lines = list(data.get_columnar_batch().rows(ID, CAST))
             if self.clients_state[client_id]["movies_eof"] < self.number_workers:
                 filename = f".data/credits-client-{client_id}"   
-                self.clients_state[client_id]["hash_file"]["credits"] = self.save_data(filename, lines)
+                # Una fila por pelicula: [id, actor_1, actor_2, ...]
+                self.clients_state[client_id]["hash_file"]["credits"] = self.save_data(filename, [(movie_id, *actors) for movie_id, actors in lines])
             else:
                 self.process_credits(lines, client_id)
             self.clients_state[client_id][data.controller_name] = data.seq_number
@@ -137,8 +160,7 @@ class JoinerByCreditId(ResilientNode):
             # Recibimos EOF de credits para este cliente
             self.clients_state[client_id]["credits_eof"] += 1
             if self.clients_state[client_id]["credits_eof"] == self.number_workers:
-                # Depuración: Mostrar estado actual
-                self.send_results(client_id, data.query_number)
+                self.finish_client(client_id, data.query_number)
         self.save_state()  # Guardar el estado de los clientes en el archivo
 
     def handle_abort_message(self, data):
@@ -157,7 +179,7 @@ class JoinerByCreditId(ResilientNode):
             # Enviar el mensaje de ABORT a todos los sinkers
             self.rabbitmq_connection_handler.send_message(
                 routing_key=f"average_rating_aggregated_{id_sinker}",
-                msg_body=msg.encode_to_str()
+                msg_body=msg.encode_to_bytes()
             )
             files_to_remove = [
                 f".data/movies-client-{data.client_id}",
@@ -170,16 +192,16 @@ class JoinerByCreditId(ResilientNode):
     def process_credits(self, lines, client_id):
         """Process the credit data for a client"""
         movies_per_actor = self.clients_state[client_id]["movies_per_actor"]
-        for line in lines:
-            # Assuming line is a list with the structure [credit_id, actor_names]
-            movie_id = line[0]  # credit_id
+        updated_movies = []
+        for movie_id, actor_names in lines:
+            movie_id = str(movie_id)  # las claves del estado persistido son strings
             if movie_id in movies_per_actor:
-                actor_names = line[1].strip("[]").replace("'", "").split(", ")  # Clean and split actor names
                 movies_per_actor[movie_id] += actor_names
+                updated_movies.append(movie_id)
                             
             #logging.info(f"Processing credit data for client {client_id}: {line}")
 
-        self.clients_state[client_id]["movies_per_actor"] = movies_per_actor
+        self.mark_state_keys(client_id, "movies_per_actor", updated_movies)
 
     def send_results(self, client_id, query_number):
         """Send the results to the appropriate sinker"""
@@ -195,23 +217,20 @@ class JoinerByCreditId(ResilientNode):
                     movies_per_actor[actor] = 0
                 movies_per_actor[actor] += 1
         
-        result = []
-        [result.append([actor, count]) for actor, count in movies_per_actor.items()]
-
-        result_csv = MiddlewareMessage.write_csv_batch(result) # TODO: Enviar en batches
+        result_batch = ColumnarBatch.from_rows(RESULT_SCHEMA, movies_per_actor.items()).to_bytes() # TODO: Enviar en batches
         seq_number = self.clients_state[client_id]["last_seq_number"]
         msg = MiddlewareMessage(
             query_number=query_number,
             client_id=client_id,
             type=MiddlewareMessageType.MOVIES_BATCH,
             seq_number=seq_number,
-            payload=result_csv,
+            payload=result_batch,
             controller_name=self.controller_name
         )
         sinker_id = client_id % self.number_sinkers
         self.rabbitmq_connection_handler.send_message(
             routing_key=f"average_credit_aggregated_{sinker_id}",
-            msg_body=msg.encode_to_str()
+            msg_body=msg.encode_to_bytes()
         )
     
         msg_eof = MiddlewareMessage(
@@ -224,7 +243,7 @@ class JoinerByCreditId(ResilientNode):
         )
         self.rabbitmq_connection_handler.send_message(
             routing_key=f"average_credit_aggregated_{sinker_id}",
-            msg_body=msg_eof.encode_to_str()
+            msg_body=msg_eof.encode_to_bytes()
         )
 
         # Limpiar los archivos temporales
@@ -251,28 +270,29 @@ class JoinerByCreditId(ResilientNode):
         joined_data = self.join_data(movies_filename, credits_filename)
         
         self.clients_state[client_id]["movies_per_actor"] = joined_data
-                
+        # Los preprocessors de credits ya pueden descartar los credits de otras peliculas
+        self.publish_movie_filter(client_id)
+
+    def joined_movie_ids(self, client_id):
+        return list(self.clients_state[client_id]["movies_per_actor"])
+
+    def on_rebalance_complete(self):
+        self.publish_movie_filters()
+
     def join_data(self, movies_file, credits_file):     
         movies_with_actors = {}
         credits = {} # diccionario de clave:valor -> id_pelicula: actores
         for credit in self.read_data(credits_file):
             credit_id = credit[0]
-            actor_names = credit[1]           
-            if credit_id not in credits:
-                credits[credit_id] = ""
-            credits[credit_id] = actor_names
+            credits[credit_id] = credit[1:]
         
-        for movies in self.read_data(movies_file):
-            for movie in movies:
-                movie_id = movie
-                if movie_id not in movies_with_actors:
-                    movies_with_actors[movie_id] = [] 
+        for movie_id, *_ in self.read_data(movies_file):
+            if movie_id not in movies_with_actors:
+                movies_with_actors[movie_id] = [] 
                     
         for movie_id, _ in movies_with_actors.items():
             if movie_id in credits:
-                actors = credits[movie_id]
-                actors_list = actors.strip("[]").replace("'", "").split(", ") # separo los actores por comas
-                movies_with_actors[movie_id] += actors_list # actores y cantidad de apariciones
+                movies_with_actors[movie_id] += credits[movie_id] # actores y cantidad de apariciones
 
         return movies_with_actors
 
@@ -282,4 +302,65 @@ class JoinerByCreditId(ResilientNode):
 
     def read_data(self, filename):
         reader = FileManager(filename)
-        return reader.read()
\ No newline at end of file
+        return reader.read()
+
+    def extract_handoff(self, client_id):
+        """
+        Claves del cliente que ahora son de otro joiner, agrupadas por su nuevo dueño:
+        {nodo: {movie_id: [si se recibio la pelicula, actores o None]}}
+        """
+        state = self.clients_state[client_id]
+        entries = {}
+        if state["movies_eof"] == self.number_workers:
+            # Ya se hizo el join, los archivos estan incluidos en movies_per_actor
+            for movie_id, actors in state["movies_per_actor"].items():
+                if not self.owns(movie_id):
+                    entries[movie_id] = [True, actors]
+        else:
+            for movie_id, *_ in self.read_data(f".data/movies-client-{client_id}"):
+                if not self.owns(movie_id):
+                    entries.setdefault(movie_id, [False, None])[0] = True
+            for movie_id, *actors in self.read_data(f".data/credits-client-{client_id}"):
+                if not self.owns(movie_id):
+                    entries.setdefault(movie_id, [False, None])[1] = actors
+        slices = {}
+        for movie_id, entry in entries.items():
+            slices.setdefault(self.ring.node_for(movie_id), {})[movie_id] = entry
+        return slices
+
+    def drop_handoff(self, client_id):
+        """Descarta del estado del cliente las claves que ya se entregaron a su nuevo dueño"""
+        state = self.clients_state[client_id]
+        if state["movies_eof"] == self.number_workers:
+            movies_per_actor = state["movies_per_actor"]
+            moved = [movie_id for movie_id in movies_per_actor if not self.owns(movie_id)]
+            for movie_id in moved:
+                del movies_per_actor[movie_id]
+            self.mark_state_keys(client_id, "movies_per_actor", moved)
+            return
+        for file_type in ("movies", "credits"):
+            filename = f".data/{file_type}-client-{client_id}"
+            rows = [row for row in self.read_data(filename) if self.owns(row[0])]
+            state["hash_file"][file_type] = FileManager(filename).replace_data(filename, rows)
+
+    def merge_handoff(self, client_id, entries):
+        state = self.clients_state[client_id]
+        if state["movies_eof"] < self.number_workers:
+            # Se agregan a los archivos como si hubieran llegado de los productores
+            movies = [(movie_id,) for movie_id, (is_movie, _) in entries.items() if is_movie]
+            credits = [(movie_id, *actors) for movie_id, (_, actors) in entries.items() if actors is not None]
+            if movies:
+                state["hash_file"]["movies"] = self.save_data(f".data/movies-client-{client_id}", movies)
+            if credits:
+                state["hash_file"]["credits"] = self.save_data(f".data/credits-client-{client_id}", credits)
+            return
+        movies_per_actor = state["movies_per_actor"]
+        updated_movies = []
+        for movie_id, (is_movie, actors) in entries.items():
+            if is_movie:
+                movies_per_actor.setdefault(movie_id, [])
+            if actors and movie_id in movies_per_actor:
+                movies_per_actor[movie_id] += actors
+            if movie_id in movies_per_actor:
+                updated_movies.append(movie_id)
+        self.mark_state_keys(client_id, "movies_per_actor", updated_movies)
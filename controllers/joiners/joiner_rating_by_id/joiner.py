@@ -5,35 +5,62 @@ from common.middleware_message_protocol import MiddlewareMessage, MiddlewareMess
 from common.defines import QueryNumber
 from common.middleware_connection_handler import RabbitMQConnectionHandler
 from common.resilient_node import ResilientNode
-import ast
+from common.columnar_batch import ColumnarBatch, ColumnType
 from common.file_manager import FileManager
+from common.state_store import DEFAULT_SNAPSHOT_EVERY, DEFAULT_SNAPSHOT_INTERVAL
+from common.partitioner import DEFAULT_VNODES
+from common.rebalance import RebalancingNode
+from common.movie_filter import MovieFilterPublisher
+from common.bloom_filter import DEFAULT_ERROR_RATE
 
-YEAR = 3  # release_date position
-class JoinerByRatingId(ResilientNode):
+ID = "id"
+TITLE = "title"
+MOVIE_ID = "movieId"
+RATING = "rating"
+RESULT_SCHEMA = [("title", ColumnType.STRING), ("rating", ColumnType.FLOAT)]
+# Ratings que llegan antes que todas las peliculas del cliente:
+#   incremental: se acumulan (suma, cantidad) por pelicula en el estado
+#   buffered: se guardan fila por fila en .data/ratings-client-{id} y se leen en el join
+INCREMENTAL_JOIN = "incremental"
+BUFFERED_JOIN = "buffered"
+JOIN_MODES = (INCREMENTAL_JOIN, BUFFERED_JOIN)
+
+class JoinerByRatingId(ResilientNode, RebalancingNode, MovieFilterPublisher):
     year: int
     data: object
+    handoff_query_number = QueryNumber.QUERY_3
+    progress_fields = ("movies_eof", "ratings_eof")
+    movie_filter_routing_key = "ratings_movie_filter"
 
-    def __init__(self, id_worker, number_sinkers, number_workers):
-        super().__init__()  # Call parent constructor
+    def __init__(self, id_worker, number_sinkers, number_workers, prefetch_count=1, snapshot_every=DEFAULT_SNAPSHOT_EVERY, snapshot_interval=DEFAULT_SNAPSHOT_INTERVAL, number_joiners=None, vnodes=DEFAULT_VNODES, join_mode=INCREMENTAL_JOIN, movie_filter_error_rate=DEFAULT_ERROR_RATE):
+        super().__init__(snapshot_every, snapshot_interval)  # Call parent constructor
+        if join_mode not in JOIN_MODES:
+            raise ValueError(f"Unknown join mode: {join_mode}. Expected one of {JOIN_MODES}")
+        self.join_mode = join_mode
         self.rabbitmq_connection_handler = RabbitMQConnectionHandler(
             producer_exchange_name="joiner_by_rating_id_exchange",
             producer_queues_to_bind={
                 **{f"average_rating_aggregated_{i}": [f"average_rating_aggregated_{i}"] for i in range(number_sinkers)},
+                **self.movie_filter_queues(self.movie_filter_routing_key, number_workers),
             },
             consumer_exchange_name="filter_by_year_exchange",
             consumer_queues_to_recv_from=[f"joiner_by_ratings_movies_queue_{id_worker}", f"joiner_ratings_by_id_queue_{id_worker}"],
             secondary_consumer_exchange_name="ratings_preprocessor_exchange",
+            prefetch_count=prefetch_count,
         )
         
         # Diccionario para almacenar el estado por cliente
         self.clients_state = {}  # {client_id: {"movies_eof": bool, "ratings_eof": bool}}
         self.number_sinkers = number_sinkers
-        self.number_workers = number_workers  # Asumiendo que id_worker empieza en 0
+        self.number_workers = number_workers  # Productores de cada cola, que envian un EOF cada uno
         self.controller_name = f"joiner_rating_by_id_{id_worker}"
+        self.incremental_state_fields = ("movies_with_ratings", "ratings_partial")
         # Configurar callbacks para ambas colas
         self.rabbitmq_connection_handler.set_message_consumer_callback(f"joiner_by_ratings_movies_queue_{id_worker}", self.movies_callback)
         self.rabbitmq_connection_handler.set_message_consumer_callback(f"joiner_ratings_by_id_queue_{id_worker}", self.ratings_callback)
+        self.init_movie_filter(movie_filter_error_rate)
         self.load_state(self.check_files_state)  # Cargar el estado desde el archivo JSON
+        self.init_partitioning(id_worker, number_joiners or number_workers, vnodes)
 
     def start(self):
         logging.info("action: start | result: success | code: joiner_rating_by_id")
@@ -56,6 +83,7 @@ class JoinerByRatingId(ResilientNode):
                 "movies_eof": 0,
                 "ratings_eof": 0,
                 "movies_with_ratings": {},
+                "ratings_partial": {},  # {movie_id: [suma, cantidad]} hasta tener todas las peliculas
                 "last_seq_number": 0,  # Este es el último seq number que propagamos
                 "hash_file": {
                     "movies": None,  # Hash del archivo de movies
@@ -67,6 +95,10 @@ class JoinerByRatingId(ResilientNode):
                 },
             }
 
+    @staticmethod
+    def input_queue(node):
+        return f"joiner_ratings_by_id_queue_{node}"
+
     def movies_callback(self, ch, method, properties, body):
         """Callback para procesar mensajes de la cola de movies"""
         data = MiddlewareMessage.decode_from_bytes(body)
@@ -91,7 +123,7 @@ class JoinerByRatingId(ResilientNode):
         
         if data.type != MiddlewareMessageType.EOF_MOVIES:
             # Procesamos el mensaje de movies
-            lines = list(data.get_batch_iter_from_payload())
+            lines = list(data.get_columnar_batch().rows(ID, TITLE))
             filename = f".data/movies-client-{client_id}"
             self.clients_state[client_id]["hash_file"]["movies"] = self.save_data(filename, lines)
             self.clients_state[client_id][data.controller_name] = data.seq_number
@@ -101,11 +133,16 @@ class JoinerByRatingId(ResilientNode):
             if self.clients_state[client_id]["movies_eof"] == self.number_workers:
                 # Si hemos recibido EOF de movies de todos los workers, procedemos a cargar los datos
                 self.loading_data(client_id)
+                if self.clients_state[client_id]["ratings_eof"] == self.number_workers:
+                    # Los ratings terminaron antes que las peliculas
+                    self.finish_client(client_id, data.query_number)
         self.save_state()  # Guardar el estado de los clientes en el archivo
 
     def ratings_callback(self, ch, method, properties, body):
         """Callback para procesar mensajes de la cola de ratings"""
         data = MiddlewareMessage.decode_from_bytes(body)
+        if self.handle_rebalance_message(data):
+            return
 
         if data.type == MiddlewareMessageType.ABORT:
             logging.info(f"Received ABORT message from client {data.client_id}. Stopping processing.")
@@ -126,19 +163,21 @@ class JoinerByRatingId(ResilientNode):
             return
          
         if data.type != MiddlewareMessageType.EOF_RATINGS:
-            lines = list(data.get_batch_iter_from_payload())
+            lines = list(data.get_columnar_batch().rows(MOVIE_ID, RATING))
             if self.clients_state[client_id]["movies_eof"] < self.number_workers:
-                filename = f".data/ratings-client-{client_id}"
-                self.clients_state[client_id]["hash_file"]["ratings"] = self.save_data(filename, lines)
+                if self.join_mode == INCREMENTAL_JOIN:
+                    self.accumulate_ratings(client_id, lines)
+                else:
+                    filename = f".data/ratings-client-{client_id}"
+                    self.clients_state[client_id]["hash_file"]["ratings"] = self.save_data(filename, lines)
             else:
                 self.process_ratings(client_id, lines)
             self.clients_state[client_id][data.controller_name] = data.seq_number
         else:
             # Recibimos EOF de ratings para este cliente
             self.clients_state[client_id]["ratings_eof"] += 1
-            if self.clients_state[client_id]["ratings_eof"] == self.number_workers:
-                # Depuración: Mostrar estado actual
-                self.send_results(client_id, data.query_number)
+            if self.clients_state[client_id]["ratings_eof"] == self.number_workers and self.clients_state[client_id]["movies_eof"] == self.number_workers:
+                self.finish_client(client_id, data.query_number)
         self.save_state()  # Guardar el estado de los clientes en el archivo
 
     def loading_data(self, client_id):
@@ -149,9 +188,19 @@ class JoinerByRatingId(ResilientNode):
         movies_filename = f".data/movies-client-{client_id}"
         ratings_filename = f".data/ratings-client-{client_id}"
             
-        joined_data = self.join_data(movies_filename, ratings_filename)
+        partial_ratings = self.clients_state[client_id].pop("ratings_partial", {})
+        joined_data = self.join_data(movies_filename, ratings_filename, self.clients_state[client_id].pop("handoff", {}), partial_ratings)
+        logging.info(f"action: join | result: success | client_id: {client_id} | movies: {len(joined_data)} | partial_ratings_keys: {len(partial_ratings)}")
 
         self.clients_state[client_id]["movies_with_ratings"] = joined_data
+        # Los preprocessors de ratings ya pueden descartar los ratings de otras peliculas
+        self.publish_movie_filter(client_id)
+
+    def joined_movie_ids(self, client_id):
+        return list(self.clients_state[client_id]["movies_with_ratings"])
+
+    def on_rebalance_complete(self):
+        self.publish_movie_filters()
 
     def handle_abort_message(self, data):
         """Maneja el mensaje de aborto recibido"""
@@ -169,7 +218,7 @@ class JoinerByRatingId(ResilientNode):
             # Enviar el mensaje de ABORT a todos los sinkers
             self.rabbitmq_connection_handler.send_message(
                 routing_key=f"average_rating_aggregated_{id_sinker}",
-                msg_body=msg.encode_to_str()
+                msg_body=msg.encode_to_bytes()
             )
             files_to_remove = [
                 f".data/movies-client-{data.client_id}",
@@ -193,23 +242,20 @@ class JoinerByRatingId(ResilientNode):
                     joined_data[movie_info["title"]] = 0.0
                 joined_data[movie_info["title"]] = movie_info["ratings_accumulator"] / movie_info["ratings_amount"]
                 
-        result = []
-        [result.append([title, rating]) for title, rating in joined_data.items()]
-
-        result_csv = MiddlewareMessage.write_csv_batch(result) # TODO: Enviar en batches
+        result_batch = ColumnarBatch.from_rows(RESULT_SCHEMA, joined_data.items()).to_bytes() # TODO: Enviar en batches
         seq_number = self.clients_state[client_id]["last_seq_number"]
         msg = MiddlewareMessage(
             query_number=query_number,
             client_id=client_id,
             seq_number=seq_number,
             type=MiddlewareMessageType.MOVIES_BATCH,
-            payload=result_csv,
+            payload=result_batch,
             controller_name=self.controller_name
         )
         sinker_id = client_id % self.number_sinkers
         self.rabbitmq_connection_handler.send_message(
             routing_key=f"average_rating_aggregated_{sinker_id}",
-            msg_body=msg.encode_to_str()
+            msg_body=msg.encode_to_bytes()
         )
     
         msg_eof = MiddlewareMessage(
@@ -222,7 +268,7 @@ class JoinerByRatingId(ResilientNode):
         )
         self.rabbitmq_connection_handler.send_message(
             routing_key=f"average_rating_aggregated_{sinker_id}",
-            msg_body=msg_eof.encode_to_str()
+            msg_body=msg_eof.encode_to_bytes()
         )
                 
         files_to_remove = [
@@ -237,19 +283,44 @@ class JoinerByRatingId(ResilientNode):
     
     def process_ratings(self, client_id, lines):
         movies_ratings = self.clients_state[client_id]["movies_with_ratings"]
-        for line in lines:
-            movie_id = line[0]
-            rating = float(line[1])
+        updated_movies = []
+        for movie_id, rating in lines:
+            movie_id = str(movie_id)  # las claves del estado persistido son strings
             if movie_id in movies_ratings:
                 movies_ratings[movie_id]["ratings_accumulator"] += rating
                 movies_ratings[movie_id]["ratings_amount"] += 1
+                updated_movies.append(movie_id)
+
+        self.mark_state_keys(client_id, "movies_with_ratings", updated_movies)
 
-        self.clients_state[client_id]["movies_with_ratings"] = movies_ratings
+    def accumulate_ratings(self, client_id, lines):
+        """
+        Agrega los ratings a la suma y cantidad parciales de cada pelicula. El estado
+        crece con las peliculas distintas, no con los ratings, y solo se persisten
+        las peliculas que tocó el batch (ver mark_state_keys)
+        """
+        partial_ratings = self.clients_state[client_id].setdefault("ratings_partial", {})
+        updated_movies = set()
+        for movie_id, rating in lines:
+            movie_id = str(movie_id)  # las claves del estado persistido son strings
+            entry = partial_ratings.get(movie_id)
+            if entry is None:
+                partial_ratings[movie_id] = [rating, 1]
+            else:
+                entry[0] += rating
+                entry[1] += 1
+            updated_movies.add(movie_id)
+        self.mark_state_keys(client_id, "ratings_partial", updated_movies)
 
-    def join_data(self, movies_file, ratings_file):
+    def join_data(self, movies_file, ratings_file, handed_off=None, partial_ratings=None):
         joined_results = []
-        # leo el archivo de ratings
+        # leo el archivo de ratings (solo tiene filas en modo buffered)
         ratings = {}
+        for movie_id, (accumulator, amount) in (partial_ratings or {}).items():
+            ratings[movie_id] = {
+                "ratings_accumulator": accumulator,
+                "ratings_amount": amount,
+            }
         for rating in self.read_data(ratings_file):
             if rating[0] not in ratings:
                 ratings[rating[0]] = {
@@ -260,24 +331,110 @@ class JoinerByRatingId(ResilientNode):
             ratings[rating[0]]["ratings_amount"] += 1
 
         movies_per_rating = {}
-        for movies in self.read_data(movies_file):
-            for movie in movies:
-                movie_str = ast.literal_eval(movie)
-                movie_id = movie_str[0]
-                if movie_id not in movies_per_rating:
-                    movies_per_rating[movie_id] = {
-                        "title": "",
-                        "ratings_accumulator": 0.0,
-                        "ratings_amount": 0.0,
-                    }
-                movies_per_rating[movie_id]["title"] = movie_str[1]  # Agrego el año y el género
+        for movie_id, title in self.read_data(movies_file):
+            if movie_id not in movies_per_rating:
+                movies_per_rating[movie_id] = {
+                    "title": "",
+                    "ratings_accumulator": 0.0,
+                    "ratings_amount": 0.0,
+                }
+            movies_per_rating[movie_id]["title"] = title
+        # Peliculas y ratings recibidos de otro joiner al migrar el anillo
+        handed_off = handed_off or {}
+        for movie_id, (title, _, _) in handed_off.items():
+            if title is not None:
+                movies_per_rating.setdefault(movie_id, {"title": title, "ratings_accumulator": 0.0, "ratings_amount": 0.0})
                              
         for movie_id, _ in movies_per_rating.items():      
             if movie_id in ratings:
                 movies_per_rating[movie_id]["ratings_accumulator"] += ratings[movie_id]["ratings_accumulator"]
                 movies_per_rating[movie_id]["ratings_amount"] += ratings[movie_id]["ratings_amount"]
+            if movie_id in handed_off:
+                movies_per_rating[movie_id]["ratings_accumulator"] += handed_off[movie_id][1]
+                movies_per_rating[movie_id]["ratings_amount"] += handed_off[movie_id][2]
  
         return movies_per_rating
+
+    def extract_handoff(self, client_id):
+        """
+        Claves del cliente que ahora son de otro joiner, agrupadas por su nuevo dueño:
+        {nodo: {movie_id: [title o None, suma de ratings, cantidad de ratings]}}
+        """
+        state = self.clients_state[client_id]
+        entries = {}
+        if state["movies_eof"] == self.number_workers:
+            # Ya se hizo el join, los archivos estan incluidos en movies_with_ratings
+            for movie_id, info in state["movies_with_ratings"].items():
+                if not self.owns(movie_id):
+                    entries[movie_id] = [info["title"], info["ratings_accumulator"], info["ratings_amount"]]
+        else:
+            for movie_id, title in self.read_data(f".data/movies-client-{client_id}"):
+                if not self.owns(movie_id):
+                    entries.setdefault(movie_id, [None, 0.0, 0])[0] = title
+            for movie_id, rating in self.read_data(f".data/ratings-client-{client_id}"):
+                if not self.owns(movie_id):
+                    entry = entries.setdefault(movie_id, [None, 0.0, 0])
+                    entry[1] += float(rating)
+                    entry[2] += 1
+            for movie_id, (accumulator, amount) in state.get("ratings_partial", {}).items():
+                if not self.owns(movie_id):
+                    self.merge_entry(entries, movie_id, None, accumulator, amount)
+            for movie_id, (title, accumulator, amount) in state.get("handoff", {}).items():
+                if not self.owns(movie_id):
+                    self.merge_entry(entries, movie_id, title, accumulator, amount)
+        slices = {}
+        for movie_id, entry in entries.items():
+            slices.setdefault(self.ring.node_for(movie_id), {})[movie_id] = entry
+        return slices
+
+    def drop_handoff(self, client_id):
+        """Descarta del estado del cliente las claves que ya se entregaron a su nuevo dueño"""
+        state = self.clients_state[client_id]
+        if state["movies_eof"] == self.number_workers:
+            movies_ratings = state["movies_with_ratings"]
+            moved = [movie_id for movie_id in movies_ratings if not self.owns(movie_id)]
+            for movie_id in moved:
+                del movies_ratings[movie_id]
+            self.mark_state_keys(client_id, "movies_with_ratings", moved)
+            return
+        for file_type in ("movies", "ratings"):
+            filename = f".data/{file_type}-client-{client_id}"
+            rows = [row for row in self.read_data(filename) if self.owns(row[0])]
+            state["hash_file"][file_type] = FileManager(filename).replace_data(filename, rows)
+        partial_ratings = state.get("ratings_partial", {})
+        moved = [movie_id for movie_id in partial_ratings if not self.owns(movie_id)]
+        for movie_id in moved:
+            del partial_ratings[movie_id]
+        self.mark_state_keys(client_id, "ratings_partial", moved)
+        if "handoff" in state:
+            state["handoff"] = {movie_id: entry for movie_id, entry in state["handoff"].items() if self.owns(movie_id)}
+
+    def merge_handoff(self, client_id, entries):
+        state = self.clients_state[client_id]
+        if state["movies_eof"] < self.number_workers:
+            # Se suman al join cuando lleguen todas las peliculas (ver loading_data)
+            handed_off = state.setdefault("handoff", {})
+            for movie_id, (title, accumulator, amount) in entries.items():
+                self.merge_entry(handed_off, movie_id, title, accumulator, amount)
+            return
+        movies_ratings = state["movies_with_ratings"]
+        updated_movies = []
+        for movie_id, (title, accumulator, amount) in entries.items():
+            if title is not None:
+                movies_ratings.setdefault(movie_id, {"title": title, "ratings_accumulator": 0.0, "ratings_amount": 0.0})
+            if movie_id in movies_ratings:
+                movies_ratings[movie_id]["ratings_accumulator"] += accumulator
+                movies_ratings[movie_id]["ratings_amount"] += amount
+                updated_movies.append(movie_id)
+        self.mark_state_keys(client_id, "movies_with_ratings", updated_movies)
+
+    @staticmethod
+    def merge_entry(entries, movie_id, title, accumulator, amount):
+        entry = entries.setdefault(movie_id, [None, 0.0, 0])
+        if title is not None:
+            entry[0] = title
+        entry[1] += accumulator
+        entry[2] += amount
               
     def save_data(self, filename, lines) -> None:
         writer = FileManager(filename)
@@ -21,10 +21,17 @@ def initialize_log(logging_level):
 def main():
     n_sinkers = int(os.getenv("N_SINKERS"))
     n_workers = int(os.getenv("N_WORKERS"))
+    number_joiners = int(os.getenv("N_JOINERS", str(n_workers)))
+    vnodes = int(os.getenv("JOINER_VNODES", "64"))
+    movie_filter_error_rate = float(os.getenv("MOVIE_FILTER_ERROR_RATE", "0.01"))
+    join_mode = os.getenv("RATINGS_JOIN_MODE", "incremental")
     id_worker = int(os.getenv("WORKER_ID"))
+    prefetch_count = int(os.getenv("PREFETCH_COUNT", "1"))
+    snapshot_every = int(os.getenv("STATE_SNAPSHOT_EVERY", "1000"))
+    snapshot_interval = float(os.getenv("STATE_SNAPSHOT_INTERVAL", "30"))
     initialize_log("INFO")
 
-    joinerRating = JoinerByRatingId(id_worker, n_sinkers, n_workers)
+    joinerRating = JoinerByRatingId(id_worker, n_sinkers, n_workers, prefetch_count=prefetch_count, snapshot_every=snapshot_every, snapshot_interval=snapshot_interval, number_joiners=number_joiners, vnodes=vnodes, join_mode=join_mode, movie_filter_error_rate=movie_filter_error_rate)
     joinerRating.start()
     
 if __name__ == "__main__":
@@ -1,31 +1,43 @@
-import ast
 import logging
+from common.columnar_batch import ColumnarBatch, ColumnType
 from common.defines import QueryNumber
 from common.middleware_connection_handler import RabbitMQConnectionHandler
 from common.middleware_message_protocol import MiddlewareMessage, MiddlewareMessageType
 from common.resilient_node import ResilientNode
+from common.tmdb_format import extract_names
+from common.partitioner import ConsistentHashRing, DEFAULT_VNODES
+from common.movie_filter import MovieFilters
 
 ID = 0
 COLUMNS = ["id", "cast"]
 COLUMNS_CREDITS =["cast", "crew", "id"]
+SCHEMA = [("id", ColumnType.INT), ("cast", ColumnType.STRING_LIST)]
 
 class CreditsPreprocessor(ResilientNode):
     countries: list
     data: object
 
-    def __init__(self, number_workers, id_worker):
+    def __init__(self, number_workers, id_worker, publisher_batch_size=1, prefetch_count=1, group_commit_size=1, consume_batch_size=1, number_joiners=None, vnodes=DEFAULT_VNODES):
         super().__init__()  # Call parent constructor
+        # Los joiners se eligen por id de pelicula con el mismo anillo que usa filter_by_year
+        self.joiners_ring = ConsistentHashRing(range(number_joiners or number_workers), vnodes)
+        # Peliculas de cada cliente que tiene cada joiner, publicadas por los joiners
+        self.movie_filters = MovieFilters(self.joiners_ring)
         self.rabbitmq_connection_handler = RabbitMQConnectionHandler(
             producer_exchange_name="ratings_preprocessor_exchange",
             producer_queues_to_bind={
-                **{f"joiner_credits_by_id_queue_{i}": [f"joiner_credits_by_id_queue_{i}"] for i in range(number_workers)},
+                **{f"joiner_credits_by_id_queue_{i}": [f"joiner_credits_by_id_queue_{i}"] for i in self.joiners_ring.nodes},
                 # "joiner_credits_by_id_queue": ["joiner_credits_by_id_queue"],
             },
             consumer_exchange_name="gateway_exchange",
-            consumer_queues_to_recv_from=[f"credits_queue_{id_worker}"],
+            consumer_queues_to_recv_from=[f"credits_queue_{id_worker}", f"credits_movie_filter_queue_{id_worker}"],
+            publisher_batch_size=publisher_batch_size,
+            prefetch_count=prefetch_count,
+            group_commit_size=group_commit_size,
         )        
         # Configurar el callback para la cola específica
-        self.rabbitmq_connection_handler.set_message_consumer_callback(f"credits_queue_{id_worker}", self.callback)
+        self.set_consumer_callback(f"credits_queue_{id_worker}", self.callback, consume_batch_size)
+        self.rabbitmq_connection_handler.set_message_consumer_callback(f"credits_movie_filter_queue_{id_worker}", self.movie_filter_callback)
         self.number_workers = number_workers
         self.id_worker = id_worker
         self.controller_name = f"credits_preprocessor_{id_worker}"
@@ -54,14 +66,15 @@ class CreditsPreprocessor(ResilientNode):
                         payload="",
                         controller_name=self.controller_name
                     )
-                    for id_worker in range(self.number_workers):
+                    for id_worker in self.joiners_ring.nodes:
                         # Send the ABORT message to all workers
                         self.rabbitmq_connection_handler.send_message(
                             routing_key=f"joiner_credits_by_id_queue_{id_worker}",
-                            msg_body=msg.encode_to_str()
+                            msg_body=msg.encode_to_bytes()
                         )
                     del self.clients_state[data.client_id]
                     self.save_state()
+                self.movie_filters.discard(data.client_id)
                 return
 
             if data.client_id not in self.clients_state:
@@ -76,26 +89,26 @@ class CreditsPreprocessor(ResilientNode):
         
             if data.type != MiddlewareMessageType.EOF_CREDITS:
                 lines = data.get_batch_iter_from_payload()
-                clean_lines = self.clean_csv(lines)
+                clean_lines = self.clean_csv(lines, data.client_id)
                 seq_number = self.clients_state[data.client_id]["last_seq_number"]
                 for sharding_id, data_shard in clean_lines.items():
-                    data_csv = MiddlewareMessage.write_csv_batch(data_shard)
+                    data_batch = ColumnarBatch.from_rows(SCHEMA, data_shard).to_bytes()
                     msg = MiddlewareMessage(
                         query_number=data.query_number,
                         client_id=data.client_id,
                         seq_number=seq_number,
                         type=MiddlewareMessageType.CREDITS_BATCH,
-                        payload=data_csv,
+                        payload=data_batch,
                         controller_name=self.controller_name
                     )
                     self.rabbitmq_connection_handler.send_message(
                         routing_key=f"joiner_credits_by_id_queue_{sharding_id}",
-                        msg_body=msg.encode_to_str()
+                        msg_body=msg.encode_to_bytes()
                     )
                 self.clients_state[data.client_id]["last_seq_number"] += 1
                 self.clients_state[data.client_id][data.controller_name] = data.seq_number
             else:
-                for i in range(self.number_workers):
+                for i in self.joiners_ring.nodes:
                     msg = MiddlewareMessage(
                         query_number=data.query_number,
                         client_id=data.client_id,
@@ -106,27 +119,36 @@ class CreditsPreprocessor(ResilientNode):
                     )
                     self.rabbitmq_connection_handler.send_message(
                         routing_key=f"joiner_credits_by_id_queue_{i}",
-                        msg_body=msg.encode_to_str()
+                        msg_body=msg.encode_to_bytes()
                     )
+                logging.info(f"action: partition_load | client_id: {data.client_id} | {self.joiners_ring.load_stats()}")
+                logging.info(f"action: movie_filter | client_id: {data.client_id} | dropped_credits: {self.movie_filters.discard(data.client_id)}")
                 del self.clients_state[data.client_id]
             # Actualizar el estado local del cliente
             self.save_state()  # Guardar el estado después de procesar el mensaje
         except Exception as e:
             logging.error(f"Error en el callback: {e}")
 
-    def clean_csv(self, reader):
+    def movie_filter_callback(self, ch, method, properties, body):
+        self.movie_filters.update(MiddlewareMessage.decode_from_bytes(body))
+
+    def clean_csv(self, reader, client_id):
         col_indices = {col: i for i, col in enumerate(COLUMNS_CREDITS) if col in COLUMNS}
         result = {}
         for row in reader:
             # Crear un diccionario con los valores de las columnas necesarias
             row_dict = {col: row[col_indices[col]] for col in col_indices}            
+            movie_id = int(row_dict['id'])
+            if not self.movie_filters.admits(client_id, movie_id, self.joiners_ring.node_for(movie_id)):
+                continue  # pelicula que el joiner no tiene: no hace falta parsear el cast
 
             for key in ['cast']:
                 row_dict[key] = self.dictionary_to_list(row_dict[key])   
             # Agregar los valores en el orden definido en COLUMNS
             filtered_row = [row_dict.get(col, '') for col in COLUMNS]
+            filtered_row[ID] = movie_id
 
-            sharding_key = int(filtered_row[ID]) % self.number_workers
+            sharding_key = self.joiners_ring.owner(filtered_row[ID])
             if sharding_key not in result:
                 result[sharding_key] = []
             if filtered_row[1]:
@@ -135,8 +157,4 @@ class CreditsPreprocessor(ResilientNode):
         return result
 
     def dictionary_to_list(self, dictionary_str):
-        try:
-            dictionary_list = ast.literal_eval(dictionary_str)  
-            return [data['name'] for data in dictionary_list]  
-        except (ValueError, SyntaxError):
-            return [] 
\ No newline at end of file
+        return extract_names(dictionary_str) 
\ No newline at end of file
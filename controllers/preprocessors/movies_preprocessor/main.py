@@ -22,12 +22,22 @@ def main():
     n_workers = int(os.getenv("N_WORKERS"))
     worker_id = int(os.getenv("WORKER_ID"))
     nlp_workers = int(os.getenv("NLP_WORKERS"))
+    publisher_batch_size = int(os.getenv("PUBLISHER_BATCH_SIZE", "1"))
+    prefetch_count = int(os.getenv("PREFETCH_COUNT", "1"))
+    group_commit_size = int(os.getenv("GROUP_COMMIT_SIZE", "1"))
+    consume_batch_size = int(os.getenv("CONSUME_BATCH_SIZE", "1"))
+    pushdown = os.getenv("MOVIES_PUSHDOWN", "on")
     initialize_log("INFO")
 
     preprocessorMovie = MoviesPreprocessor(
         number_workers=n_workers,
         worker_id=worker_id,
         nlp_workers=nlp_workers,
+        publisher_batch_size=publisher_batch_size,
+        prefetch_count=prefetch_count,
+        group_commit_size=group_commit_size,
+        consume_batch_size=consume_batch_size,
+        pushdown=pushdown
     )
     preprocessorMovie.start()
     
@@ -1,15 +1,35 @@
-import ast
 import logging
+from common.columnar_batch import ColumnarBatch, ColumnType, date_to_int
+from common.dictionary import COUNTRIES, GENRES, LANGUAGES
 from common.defines import QueryNumber
 from common.middleware_connection_handler import RabbitMQConnectionHandler
 from common.middleware_message_protocol import MiddlewareMessage, MiddlewareMessageType
+from common.query_plan import apply_plan
 from common.resilient_node import ResilientNode
+from common.tmdb_format import extract_names
 
 ID = "id"
 COLUMNS = [
     "id", "title", "genres", "release_date", "overview",
     "production_countries", "spoken_languages", "budget", "revenue"
 ]
+SCHEMA = [
+    ("id", ColumnType.INT),
+    ("title", ColumnType.STRING),
+    ("genres", ColumnType.CODE_LIST, GENRES),
+    ("release_date", ColumnType.INT),
+    ("overview", ColumnType.STRING),
+    ("production_countries", ColumnType.CODE_LIST, COUNTRIES),
+    ("spoken_languages", ColumnType.CODE_LIST, LANGUAGES),
+    ("budget", ColumnType.FLOAT),
+    ("revenue", ColumnType.FLOAT),
+]
+# Las listas de nombres viajan como codigos de su diccionario
+DICTIONARY_COLUMNS = {
+    "genres": GENRES,
+    "production_countries": COUNTRIES,
+    "spoken_languages": LANGUAGES,
+}
 COLUMNS_MOVIES =[
     "adult","belongs_to_collection","budget","genres","homepage","id","imdb_id",
     "original_language","original_title","overview","popularity","poster_path",
@@ -17,40 +37,73 @@ COLUMNS_MOVIES =[
     "spoken_languages","status","tagline","title","video","vote_average","vote_count"
 ]
 
+COUNTRY_QUERIES = (QueryNumber.QUERY_1, QueryNumber.QUERY_3, QueryNumber.QUERY_4)
+# off: cada rama recibe todas las peliculas con todas las columnas
+# on: cada rama recibe solo las filas y columnas que pide el plan de sus queries (common/query_plan.py)
+# bypass: como on, y la rama de Q2 va directo a GroupByCountry (FilterByCountryInvesment no se despliega)
+PUSHDOWN_OFF = "off"
+PUSHDOWN_ON = "on"
+PUSHDOWN_BYPASS = "bypass"
+PUSHDOWN_MODES = (PUSHDOWN_OFF, PUSHDOWN_ON, PUSHDOWN_BYPASS)
+
 
 class MoviesPreprocessor(ResilientNode):
     countries: list
     data: object
 
-    def __init__(self, number_workers, worker_id, nlp_workers):
+    def __init__(self, number_workers, worker_id, nlp_workers, publisher_batch_size=1, prefetch_count=1, group_commit_size=1, consume_batch_size=1, pushdown=PUSHDOWN_ON):
         super().__init__()  # Call parent constructor
+        if pushdown not in PUSHDOWN_MODES:
+            raise ValueError(f"Unknown pushdown mode {pushdown}, expected one of {PUSHDOWN_MODES}")
         self.worker_id = worker_id
         self.number_workers = number_workers
         self.nlp_workers = nlp_workers
+        self.pushdown = pushdown
+        # Con bypass el plan cubre todo FilterByCountryInvesment: se publica directo en las colas de GroupByCountry
+        self.investment_queue = "filter_by_country_invesment_queue" if pushdown == PUSHDOWN_BYPASS else "cleaned_movies_queue_country_invesment"
         self.rabbitmq_connection_handler = RabbitMQConnectionHandler(
             producer_exchange_name="movies_preprocessor_exchange",
             producer_queues_to_bind={
-                #"cleaned_movies_queue_country": ["cleaned_movies_queue_country" ],
-                **{f"cleaned_movies_queue_country_{i}": [f"cleaned_movies_queue_country_{i}"] for i in range(nlp_workers)},
+                **{f"cleaned_movies_queue_country_{i}": [f"cleaned_movies_queue_country_{i}"] for i in range(number_workers)},
                 **{f"cleaned_movies_queue_nlp_{i}": [f"cleaned_movies_queue_nlp_{i}"] for i in range(nlp_workers)},
-                **{f"cleaned_movies_queue_country_invesment_{i}": [f"cleaned_movies_queue_country_invesment_{i}"] for i in range(number_workers)},
+                **{f"{self.investment_queue}_{i}": [f"{self.investment_queue}_{i}"] for i in range(number_workers)},
             },
             consumer_exchange_name="gateway_exchange",
             consumer_queues_to_recv_from=[f"movies_queue_{self.worker_id}"],
+            publisher_batch_size=publisher_batch_size,
+            prefetch_count=prefetch_count,
+            group_commit_size=group_commit_size,
         )
         # Configurar el callback para la cola específica
-        self.rabbitmq_connection_handler.set_message_consumer_callback(f"movies_queue_{self.worker_id}", self.callback)
+        self.set_consumer_callback(f"movies_queue_{self.worker_id}", self.callback, consume_batch_size)
         self.clients_state = {}  # Diccionario para almacenar el estado local de los clientes
         self.controller_name = f"movies_preprocessor_{worker_id}"
         self.load_state()
 
     def start(self):
-        logging.info("action: start | result: success | code: movies_preprocessor")
+        logging.info(f"action: start | result: success | code: movies_preprocessor | pushdown: {self.pushdown}")
         try:
             self.rabbitmq_connection_handler.start_consuming()
         except Exception as e:
             logging.info("Consuming stopped")
 
+    def branches(self, query_number):
+        """(prefijo de cola, cantidad de colas, queries) de cada rama que recibe las peliculas de la query"""
+        branches = []
+        if query_number in (QueryNumber.ALL_QUERYS, QueryNumber.QUERY_1, QueryNumber.QUERY_3, QueryNumber.QUERY_4):
+            queries = COUNTRY_QUERIES if query_number == QueryNumber.ALL_QUERYS else (query_number,)
+            branches.append(("cleaned_movies_queue_country", self.number_workers, queries))
+        if query_number in (QueryNumber.ALL_QUERYS, QueryNumber.QUERY_2):
+            branches.append((self.investment_queue, self.number_workers, (QueryNumber.QUERY_2,)))
+        if query_number in (QueryNumber.ALL_QUERYS, QueryNumber.QUERY_5):
+            branches.append(("cleaned_movies_queue_nlp", self.nlp_workers, (QueryNumber.QUERY_5,)))
+        return branches
+
+    def send_to_all(self, msg, query_number):
+        for queue_prefix, number_queues, _ in self.branches(query_number):
+            for i in range(number_queues):
+                self.rabbitmq_connection_handler.send_message(routing_key=f"{queue_prefix}_{i}", msg_body=msg.encode_to_bytes())
+
     def callback(self, ch, method, properties, body):
         data = MiddlewareMessage.decode_from_bytes(body)
         if data.type == MiddlewareMessageType.ABORT:
@@ -65,12 +118,7 @@ class MoviesPreprocessor(ResilientNode):
                     payload="",
                     controller_name=self.controller_name
                 )
-                for id_worker in range(self.number_workers):
-                    self.rabbitmq_connection_handler.send_message(routing_key=f"cleaned_movies_queue_country_{id_worker}", msg_body=msg.encode_to_str())
-                    self.rabbitmq_connection_handler.send_message(routing_key=f"cleaned_movies_queue_country_invesment_{id_worker}", msg_body=msg.encode_to_str())
-                for nlp_id in range(self.nlp_workers):
-                    self.rabbitmq_connection_handler.send_message(routing_key=f"cleaned_movies_queue_nlp_{nlp_id}", msg_body=msg.encode_to_str())
-                
+                self.send_to_all(msg, QueryNumber.ALL_QUERYS)
                 del self.clients_state[data.client_id]  # Eliminar el estado del cliente para este controlador
                 self.save_state()
             return  
@@ -89,50 +137,32 @@ class MoviesPreprocessor(ResilientNode):
         
         if data.type != MiddlewareMessageType.EOF_MOVIES:    
             lines = data.get_batch_iter_from_payload()
-            clean_lines = self.clean_csv(lines)
-            # logging.info(f" LINEAS LIMPIASSSS -> {clean_lines}")
-            msg = MiddlewareMessage(
-                query_number=data.query_number,
-                client_id=data.client_id,
-                type=MiddlewareMessageType.MOVIES_BATCH,
-                payload=clean_lines,
-                seq_number=self.clients_state[data.client_id]["last_seq_number"], 
-                controller_name=self.controller_name
-            )
-                
-            # Round robin para enviar a los workers
-            id_worker = self.clients_state[data.client_id]["last_seq_number"] % self.number_workers
-            nlp_id = self.clients_state[data.client_id]["last_seq_number"] % self.nlp_workers
-            if data.query_number == QueryNumber.ALL_QUERYS:
-                self.rabbitmq_connection_handler.send_message(routing_key=f"cleaned_movies_queue_country_{id_worker}", msg_body=msg.encode_to_str())
-                self.rabbitmq_connection_handler.send_message(routing_key=f"cleaned_movies_queue_country_invesment_{id_worker}", msg_body=msg.encode_to_str())
-                self.rabbitmq_connection_handler.send_message(routing_key=f"cleaned_movies_queue_nlp_{nlp_id}", msg_body=msg.encode_to_str())
-            elif data.query_number == QueryNumber.QUERY_1 or data.query_number == QueryNumber.QUERY_3 or data.query_number == QueryNumber.QUERY_4:
-                self.rabbitmq_connection_handler.send_message(routing_key=f"cleaned_movies_queue_country_{id_worker}", msg_body=msg.encode_to_str())
-            elif data.query_number == QueryNumber.QUERY_2:
-                self.rabbitmq_connection_handler.send_message(routing_key=f"cleaned_movies_queue_country_invesment_{id_worker}", msg_body=msg.encode_to_str())
-            elif data.query_number == QueryNumber.QUERY_5:
-                self.rabbitmq_connection_handler.send_message(routing_key=f"cleaned_movies_queue_nlp_{nlp_id}", msg_body=msg.encode_to_str())
+            batch = self.clean_csv(lines)
+            seq_number = self.clients_state[data.client_id]["last_seq_number"]
+            full_payload = None
+            for queue_prefix, number_queues, queries in self.branches(data.query_number):
+                if self.pushdown == PUSHDOWN_OFF:
+                    full_payload = full_payload or batch.to_bytes()
+                    payload = full_payload
+                else:
+                    branch_batch = apply_plan(batch, queries)
+                    if not branch_batch.num_rows:
+                        continue  # Los seq numbers no tienen que ser consecutivos, solo crecientes
+                    payload = branch_batch.to_bytes()
+                msg = MiddlewareMessage(
+                    query_number=data.query_number,
+                    client_id=data.client_id,
+                    type=MiddlewareMessageType.MOVIES_BATCH,
+                    payload=payload,
+                    seq_number=seq_number,
+                    controller_name=self.controller_name
+                )
+                # Round robin para enviar a los workers
+                self.rabbitmq_connection_handler.send_message(routing_key=f"{queue_prefix}_{seq_number % number_queues}", msg_body=msg.encode_to_bytes())
 
             # Actualizar el estado local del cliente
             self.clients_state[data.client_id]["last_seq_number"] += 1
             self.clients_state[data.client_id][data.controller_name] = data.seq_number
-        # elif data.type == MiddlewareMessageType.ABORT:
-        #     logging.warning(f"action: abort | result: success | code: movies_preprocessor | client_id: {data.client_id} | seq_number: {data.seq_number}")
-        #     # Enviar un mensaje de abortar a todos los workers
-        #     msg = MiddlewareMessage(
-        #         query_number=data.query_number,
-        #         client_id=data.client_id,
-        #         type=MiddlewareMessageType.ABORT,
-        #         seq_number=self.clients_state[data.client_id]["last_seq_number"],
-        #         payload="",
-        #         controller_name=self.controller_name
-        #     )
-        #     # for id_worker in range(self.number_workers):
-        #     #     self.rabbitmq_connection_handler.send_message(routing_key=f"cleaned_movies_queue_country_{id_worker}", msg_body=msg.encode_to_str())
-        #     #     self.rabbitmq_connection_handler.send_message(routing_key=f"cleaned_movies_queue_country_invesment_{id_worker}", msg_body=msg.encode_to_str())
-        #     for nlp_id in range(self.nlp_workers):
-        #         self.rabbitmq_connection_handler.send_message(routing_key=f"cleaned_movies_queue_nlp_{nlp_id}", msg_body=msg.encode_to_str())
         else:
             seq_number = self.clients_state[data.client_id]["last_seq_number"]
             msg = MiddlewareMessage(
@@ -143,40 +173,11 @@ class MoviesPreprocessor(ResilientNode):
                         payload="",
                         controller_name=self.controller_name
                     )
-            if data.query_number == QueryNumber.ALL_QUERYS:
-                self.handler_oef_all_querys(msg)
-            elif data.query_number == QueryNumber.QUERY_1 or data.query_number == QueryNumber.QUERY_3 or data.query_number == QueryNumber.QUERY_4:
-                self.handler_oef_query_1_3_4(msg)
-            elif data.query_number == QueryNumber.QUERY_2:
-                self.handler_oef_query_2(msg)
-            elif data.query_number == QueryNumber.QUERY_5:
-                self.handler_oef_query_5(msg)
-            
+            self.send_to_all(msg, data.query_number)
             del self.clients_state[data.client_id]  # Eliminar el estado del cliente para este controlador
             
         self.save_state()
 
-    def handler_oef_all_querys(self, msg):
-        for nlp_id in range(self.nlp_workers):
-            self.rabbitmq_connection_handler.send_message(routing_key=f"cleaned_movies_queue_nlp_{nlp_id}", msg_body=msg.encode_to_str())
-
-        for id_worker in range(self.number_workers):
-            self.rabbitmq_connection_handler.send_message(routing_key=f"cleaned_movies_queue_country_invesment_{id_worker}", msg_body=msg.encode_to_str())
-            self.rabbitmq_connection_handler.send_message(routing_key=f"cleaned_movies_queue_country_{id_worker}", msg_body=msg.encode_to_str())
-    
-    def handler_oef_query_1_3_4(self, msg):
-        for id_worker in range(self.number_workers):
-            self.rabbitmq_connection_handler.send_message(routing_key=f"cleaned_movies_queue_country_{id_worker}", msg_body=msg.encode_to_str())
-
-    def handler_oef_query_2(self, msg):
-        for id_worker in range(self.number_workers):
-            self.rabbitmq_connection_handler.send_message(routing_key=f"cleaned_movies_queue_country_invesment_{id_worker}", msg_body=msg.encode_to_str())
-     
-    def handler_oef_query_5(self, msg):
-        for nlp_id in range(self.nlp_workers):
-            # Enviar el mensaje EOF a la cola de NLP
-            self.rabbitmq_connection_handler.send_message(routing_key=f"cleaned_movies_queue_nlp_{nlp_id}", msg_body=msg.encode_to_str())
-    
     def clean_csv(self, reader):
         col_indices = {col: i for i, col in enumerate(COLUMNS_MOVIES) if col in COLUMNS}
 
@@ -193,18 +194,23 @@ class MoviesPreprocessor(ResilientNode):
             if any(row_dict[col] in (None, '', 'null') for col in col_indices):
                 continue
 
-            for key in ['genres', 'production_countries', 'spoken_languages']:
-                row_dict[key] = self.dictionary_to_list(row_dict[key])
+            for key, dictionary in DICTIONARY_COLUMNS.items():
+                row_dict[key] = dictionary.encode(self.dictionary_to_list(row_dict[key]))
+
+            # Los tipos se parsean una sola vez aca, el resto del pipeline recibe columnas tipadas
+            try:
+                row_dict['id'] = int(row_dict['id'])
+                row_dict['budget'] = float(row_dict['budget'])
+                row_dict['revenue'] = float(row_dict['revenue'])
+            except ValueError:
+                continue
+            row_dict['release_date'] = date_to_int(row_dict['release_date'])
 
             # Agregar los valores en el orden definido en COLUMNS
             filtered_row = [row_dict.get(col, '') for col in COLUMNS]
             result.append(filtered_row)
 
-        return MiddlewareMessage.write_csv_batch(result)
+        return ColumnarBatch.from_rows(SCHEMA, result)
 
     def dictionary_to_list(self, dictionary_str):
-        try:
-            dictionary_list = ast.literal_eval(dictionary_str)  
-            return [data['name'] for data in dictionary_list]  
-        except (ValueError, SyntaxError):
-            return [] 
\ No newline at end of file
+        return extract_names(dictionary_str) 
\ No newline at end of file
@@ -1,29 +1,42 @@
 import ast
 import logging
+from common.columnar_batch import ColumnarBatch, ColumnType
 from common.defines import QueryNumber
 from common.middleware_connection_handler import RabbitMQConnectionHandler
 from common.middleware_message_protocol import MiddlewareMessage, MiddlewareMessageType
 from common.resilient_node import ResilientNode
+from common.partitioner import ConsistentHashRing, DEFAULT_VNODES
+from common.movie_filter import MovieFilters
 
 ID = 0
+RATING = 1
 COLUMNS = ["movieId", "rating"]
 COLUMNS_RATINGS =["userId", "movieId", "rating", "timestamp"]
+SCHEMA = [("movieId", ColumnType.INT), ("rating", ColumnType.FLOAT)]
 
 class RatingsPreprocessor(ResilientNode):
 
-    def __init__(self, number_workers, id_worker):
+    def __init__(self, number_workers, id_worker, publisher_batch_size=1, prefetch_count=1, group_commit_size=1, consume_batch_size=1, number_joiners=None, vnodes=DEFAULT_VNODES):
         super().__init__()  # Call parent constructor
+        # Los joiners se eligen por id de pelicula con el mismo anillo que usa filter_by_year
+        self.joiners_ring = ConsistentHashRing(range(number_joiners or number_workers), vnodes)
+        # Peliculas de cada cliente que tiene cada joiner, publicadas por los joiners
+        self.movie_filters = MovieFilters(self.joiners_ring)
         self.id_worker = id_worker
         self.rabbitmq_connection_handler = RabbitMQConnectionHandler(
             producer_exchange_name="ratings_preprocessor_exchange",
             producer_queues_to_bind={
-                **{f"joiner_ratings_by_id_queue_{i}": [f"joiner_ratings_by_id_queue_{i}"] for i in range(number_workers)},
+                **{f"joiner_ratings_by_id_queue_{i}": [f"joiner_ratings_by_id_queue_{i}"] for i in self.joiners_ring.nodes},
             },
             consumer_exchange_name="gateway_exchange",
-            consumer_queues_to_recv_from=[f"ratings_queue_{id_worker}"]
+            consumer_queues_to_recv_from=[f"ratings_queue_{id_worker}", f"ratings_movie_filter_queue_{id_worker}"],
+            publisher_batch_size=publisher_batch_size,
+            prefetch_count=prefetch_count,
+            group_commit_size=group_commit_size,
         )
         # Configurar el callback para la cola específica
-        self.rabbitmq_connection_handler.set_message_consumer_callback(f"ratings_queue_{id_worker}", self.callback)
+        self.set_consumer_callback(f"ratings_queue_{id_worker}", self.callback, consume_batch_size)
+        self.rabbitmq_connection_handler.set_message_consumer_callback(f"ratings_movie_filter_queue_{id_worker}", self.movie_filter_callback)
         self.number_workers = number_workers
         self.controller_name = f"ratings_preprocessor_{id_worker}"
         self.clients_state = {}  # Diccionario para almacenar el estado local de los clientes
@@ -50,15 +63,16 @@ class RatingsPreprocessor(ResilientNode):
                     payload="",
                     controller_name=self.controller_name
                 )
-                for id_worker in range(self.number_workers):
+                for id_worker in self.joiners_ring.nodes:
                     # Send the ABORT message to all workers
                     self.rabbitmq_connection_handler.send_message(
                         routing_key=f"joiner_ratings_by_id_queue_{id_worker}",
-                        msg_body=msg.encode_to_str()
+                        msg_body=msg.encode_to_bytes()
                     )
                 
                 del self.clients_state[data.client_id]
                 self.save_state()
+            self.movie_filters.discard(data.client_id)
             return
 
         if data.client_id not in self.clients_state:
@@ -73,27 +87,27 @@ class RatingsPreprocessor(ResilientNode):
     
         if data.type != MiddlewareMessageType.EOF_RATINGS:
             lines = data.get_batch_iter_from_payload()
-            clean_lines = self.clean_csv(lines)
+            clean_lines = self.clean_csv(lines, data.client_id)
             seq_number = self.clients_state[data.client_id]["last_seq_number"]
             for sharding_id, data_shard in clean_lines.items():
-                data_csv = MiddlewareMessage.write_csv_batch(data_shard)
+                data_batch = ColumnarBatch.from_rows(SCHEMA, data_shard).to_bytes()
                 msg = MiddlewareMessage(
                     query_number=data.query_number,
                     client_id=data.client_id,
                     seq_number=seq_number,
                     type=MiddlewareMessageType.RATINGS_BATCH,
-                    payload=data_csv,
+                    payload=data_batch,
                     controller_name=self.controller_name
                 )
                 self.rabbitmq_connection_handler.send_message(
                     routing_key=f"joiner_ratings_by_id_queue_{sharding_id}",
-                    msg_body=msg.encode_to_str()
+                    msg_body=msg.encode_to_bytes()
                 )
             self.clients_state[data.client_id]["last_seq_number"] += 1
             self.clients_state[data.client_id][data.controller_name] = data.seq_number
         else:
             seq_number = self.clients_state[data.client_id]["last_seq_number"]
-            for i in range(self.number_workers):
+            for i in self.joiners_ring.nodes:
                 msg = MiddlewareMessage(
                     query_number=data.query_number,
                     client_id=data.client_id,
@@ -104,12 +118,17 @@ class RatingsPreprocessor(ResilientNode):
                 )
                 self.rabbitmq_connection_handler.send_message(
                     routing_key=f"joiner_ratings_by_id_queue_{i}",
-                    msg_body=msg.encode_to_str()
+                    msg_body=msg.encode_to_bytes()
                 )
+            logging.info(f"action: partition_load | client_id: {data.client_id} | {self.joiners_ring.load_stats()}")
+            logging.info(f"action: movie_filter | client_id: {data.client_id} | dropped_ratings: {self.movie_filters.discard(data.client_id)}")
             del self.clients_state[data.client_id]
         self.save_state()
                  
-    def clean_csv(self, reader):
+    def movie_filter_callback(self, ch, method, properties, body):
+        self.movie_filters.update(MiddlewareMessage.decode_from_bytes(body))
+
+    def clean_csv(self, reader, client_id):
         col_indices = {col: i for i, col in enumerate(COLUMNS_RATINGS) if col in COLUMNS}
 
         result = {}
@@ -121,8 +140,14 @@ class RatingsPreprocessor(ResilientNode):
             row_dict = {col: row[col_indices[col]] for col in col_indices}
             
             filtered_row = [row_dict.get(col, '') for col in COLUMNS]
+            try:
+                filtered_row = [int(filtered_row[ID]), float(filtered_row[RATING])]
+            except ValueError:
+                continue  # omitir filas con valores no numericos
 
-            sharding_key = int(filtered_row[ID]) % self.number_workers
+            if not self.movie_filters.admits(client_id, filtered_row[ID], self.joiners_ring.node_for(filtered_row[ID])):
+                continue  # pelicula que el joiner no tiene
+            sharding_key = self.joiners_ring.owner(filtered_row[ID])
             if sharding_key not in result:
                 result[sharding_key] = []
             result[sharding_key].append(filtered_row)
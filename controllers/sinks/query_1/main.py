@@ -22,9 +22,10 @@ def initialize_log(logging_level):
 def main():
     id_sinker = int(os.getenv("SINKER_ID"))
     n_workers = int(os.getenv("N_WORKERS"))
+    prefetch_count = int(os.getenv("PREFETCH_COUNT", "1"))
     initialize_log("INFO")
 
-    sinker = Query1(id_sinker, n_workers)
+    sinker = Query1(id_sinker, n_workers, prefetch_count=prefetch_count)
     sinker.start()
     
 if __name__ == "__main__":
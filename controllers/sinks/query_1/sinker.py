@@ -2,13 +2,14 @@ import logging
 from common.middleware_message_protocol import MiddlewareMessage, MiddlewareMessageType
 from common.middleware_connection_handler import RabbitMQConnectionHandler
 from common.resilient_node import ResilientNode
+from common.dictionary import GENRES as GENRES_DICTIONARY
 
-TITLE = 0
-GENRES = 1
+TITLE = "title"
+GENRES = "genres"
 
 class Query1(ResilientNode):
 
-    def __init__(self, id_sinker, number_workers):
+    def __init__(self, id_sinker, number_workers, prefetch_count=1):
         super().__init__()
         self.number_workers = number_workers
         self.rabbitmq_connection_handler = RabbitMQConnectionHandler(
@@ -16,6 +17,7 @@ class Query1(ResilientNode):
             producer_queues_to_bind={"reports_queue": ["reports_queue"]},
             consumer_exchange_name="filter_by_year_exchange",
             consumer_queues_to_recv_from=[f"sink_query_1_queue_{id_sinker}"],
+            prefetch_count=prefetch_count,
         )
         self.rabbitmq_connection_handler.set_message_consumer_callback(f"sink_query_1_queue_{id_sinker}", self.callback)
         self.clients_state = {}
@@ -52,9 +54,9 @@ class Query1(ResilientNode):
             return
         
         if data.type != MiddlewareMessageType.EOF_MOVIES:    
-            lines = data.get_batch_iter_from_payload()
+            batch = data.get_columnar_batch()
             seq_number = self.clients_state[data.client_id]["last_seq_number"]
-            self.handler_query_1(lines, data.client_id, data.query_number, seq_number)
+            self.handler_query_1(batch, data.client_id, data.query_number, seq_number)
             self.clients_state[data.client_id]["last_seq_number"] += 1
             self.clients_state[data.client_id][data.controller_name] = data.seq_number  # Update the last seq number for this controller
         else:
@@ -71,15 +73,16 @@ class Query1(ResilientNode):
                 )
                 self.rabbitmq_connection_handler.send_message(
                     routing_key="reports_queue",
-                    msg_body=msg.encode_to_str()
+                    msg_body=msg.encode_to_bytes()
                 )
                 del self.clients_state[data.client_id]
         self.save_state()  # Save the state of clients to file
 
-    def handler_query_1(self, lines, client_id, query_number, seq_number):
+    def handler_query_1(self, batch, client_id, query_number, seq_number):
         filtered_lines = []
-        for line in lines:
-            filtered_lines.append([line[TITLE], line[GENRES]])
+        for title, genres in batch.rows(TITLE, GENRES):
+            # El reporte al cliente mantiene el formato de lista de python
+            filtered_lines.append([title, str(list(GENRES_DICTIONARY.decode(genres)))])
         
         if filtered_lines:
             # Join all filtered lines into a single CSV string
@@ -97,6 +100,6 @@ class Query1(ResilientNode):
             # Send all filtered results in a single message
             self.rabbitmq_connection_handler.send_message(
                 routing_key="reports_queue",
-                msg_body=msg.encode_to_str()
+                msg_body=msg.encode_to_bytes()
             )
      
@@ -21,9 +21,10 @@ def initialize_log(logging_level):
 def main():
     n_workers = int(os.getenv("N_WORKERS"))
     id_sinker = int(os.getenv("SINKER_ID"))
+    prefetch_count = int(os.getenv("PREFETCH_COUNT", "1"))
     initialize_log("INFO")
 
-    sinker = Query2(id_sinker, n_workers)
+    sinker = Query2(id_sinker, n_workers, prefetch_count=prefetch_count)
     sinker.start()
     
 if __name__ == "__main__":
@@ -3,12 +3,13 @@ from common.middleware_message_protocol import MiddlewareMessage, MiddlewareMess
 from common.middleware_connection_handler import RabbitMQConnectionHandler
 from common.resilient_node import ResilientNode
 from common.file_manager import FileManager
+from common.dictionary import COUNTRIES
 
 QUERY_NUMBER = 2
 
 class Query2(ResilientNode):
 
-    def __init__(self, id_worker, number_workers):
+    def __init__(self, id_worker, number_workers, prefetch_count=1):
         super().__init__()
         self.number_workers = number_workers
         self.rabbitmq_connection_handler = RabbitMQConnectionHandler(
@@ -16,6 +17,7 @@ class Query2(ResilientNode):
             producer_queues_to_bind={"reports_queue": ["reports_queue"]},
             consumer_exchange_name="group_by_country_exchange",
             consumer_queues_to_recv_from=[f"group_by_country_queue_{id_worker}"],
+            prefetch_count=prefetch_count,
         )
         self.rabbitmq_connection_handler.set_message_consumer_callback(f"group_by_country_queue_{id_worker}", self.callback)
         self.clients_state ={}
@@ -72,7 +74,8 @@ class Query2(ResilientNode):
             return
         
         if data.type != MiddlewareMessageType.EOF_MOVIES:  
-            lines = data.get_batch_iter_from_payload()
+            # Los codigos fuera de la lista compartida son locales al proceso: al archivo van los nombres
+            lines = ((COUNTRIES.name(code), budget) for code, budget in data.get_columnar_batch().rows())
             filename = f".data/query_2-client-{data.client_id}"
             self.clients_state[data.client_id]["hash_file"]["query_2"] = self.save_data(filename, lines)
             self.clients_state[data.client_id][data.controller_name] = data.seq_number
@@ -91,7 +94,7 @@ class Query2(ResilientNode):
                 )
                 self.rabbitmq_connection_handler.send_message(
                     routing_key="reports_queue",
-                    msg_body=msg.encode_to_str()
+                    msg_body=msg.encode_to_bytes()
                 )
                 files_to_remove = [
                     f".data/query_2-client-{data.client_id}",
@@ -127,7 +130,7 @@ class Query2(ResilientNode):
         # Send all filtered results in a single message
         self.rabbitmq_connection_handler.send_message(
             routing_key="reports_queue",
-            msg_body=msg.encode_to_str()
+            msg_body=msg.encode_to_bytes()
         )
                 
     def save_data(self, filename, lines) -> None:
@@ -6,13 +6,14 @@ from common.file_manager import FileManager
 
 class Query3(ResilientNode):
 
-    def __init__(self, id_sinker, number_workers):
+    def __init__(self, id_sinker, number_workers, prefetch_count=1):
         super().__init__()  # Call parent constructor
         self.rabbitmq_connection_handler = RabbitMQConnectionHandler(
             producer_exchange_name="reports_exchange",
             producer_queues_to_bind={"reports_queue": ["reports_queue"]},
             consumer_exchange_name="joiner_by_rating_id_exchange",
             consumer_queues_to_recv_from=[f"average_rating_aggregated_{id_sinker}"],
+            prefetch_count=prefetch_count,
         )
         self.rabbitmq_connection_handler.set_message_consumer_callback(f"average_rating_aggregated_{id_sinker}", self.callback)
         self.number_workers = number_workers
@@ -70,7 +71,7 @@ class Query3(ResilientNode):
             return
         
         if data.type != MiddlewareMessageType.EOF_JOINER:    
-            lines = data.get_batch_iter_from_payload()
+            lines = data.get_columnar_batch().rows()
             filename = f".data/query_3-client-{data.client_id}"
             self.clients_state[data.client_id]["hash_file"]["query_3"] = self.save_data(filename, lines)
             self.clients_state[data.client_id][data.controller_name] = data.seq_number
@@ -91,7 +92,7 @@ class Query3(ResilientNode):
                 )
                 self.rabbitmq_connection_handler.send_message(
                     routing_key="reports_queue",
-                    msg_body=msg.encode_to_str()
+                    msg_body=msg.encode_to_bytes()
                 )
                 files_to_remove = [
                     f".data/query_3-client-{data.client_id}",
@@ -129,7 +130,7 @@ class Query3(ResilientNode):
         # Send all filtered results in a single message
         self.rabbitmq_connection_handler.send_message(
             routing_key="reports_queue",
-            msg_body=msg.encode_to_str()
+            msg_body=msg.encode_to_bytes()
         )
     
     def save_data(self, filename, lines) -> None:
@@ -20,10 +20,12 @@ def initialize_log(logging_level):
 
 def main():
     id_sinker = int(os.getenv("SINKER_ID"))
-    n_workers = int(os.getenv("N_WORKERS"))
+    # Cada joiner envia su EOF_JOINER
+    n_workers = int(os.getenv("N_JOINERS", os.getenv("N_WORKERS")))
+    prefetch_count = int(os.getenv("PREFETCH_COUNT", "1"))
     initialize_log("INFO")
 
-    sinker = Query4(id_sinker, n_workers)
+    sinker = Query4(id_sinker, n_workers, prefetch_count=prefetch_count)
     sinker.start()
     
 if __name__ == "__main__":
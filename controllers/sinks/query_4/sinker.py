@@ -6,13 +6,14 @@ from common.file_manager import FileManager
 
 class Query4(ResilientNode):
 
-    def __init__(self, id_sinker, number_workers):
+    def __init__(self, id_sinker, number_workers, prefetch_count=1):
         super().__init__()
         self.rabbitmq_connection_handler = RabbitMQConnectionHandler(
             producer_exchange_name="reports_exchange",
             producer_queues_to_bind={"reports_queue": ["reports_queue"]},
             consumer_exchange_name="joiner_by_credit_id_exchange",
             consumer_queues_to_recv_from=[f"average_credit_aggregated_{id_sinker}"],
+            prefetch_count=prefetch_count,
         )
         self.rabbitmq_connection_handler.set_message_consumer_callback(f"average_credit_aggregated_{id_sinker}", self.callback)
         self.number_workers = number_workers
@@ -71,7 +72,7 @@ class Query4(ResilientNode):
             return
         
         if data.type != MiddlewareMessageType.EOF_JOINER: 
-            lines = data.get_batch_iter_from_payload()
+            lines = data.get_columnar_batch().rows()
             filename = f".data/query_4-client-{data.client_id}"
             self.clients_state[data.client_id]["hash_file"]["query_4"] = self.save_data(filename, lines)
             self.clients_state[data.client_id][data.controller_name] = data.seq_number  # Update
@@ -91,7 +92,7 @@ class Query4(ResilientNode):
                 )
                 self.rabbitmq_connection_handler.send_message(
                     routing_key="reports_queue",
-                    msg_body=msg.encode_to_str()
+                    msg_body=msg.encode_to_bytes()
                 )
 
                 files_to_remove = [
@@ -130,7 +131,7 @@ class Query4(ResilientNode):
         # Send all filtered results in a single message
         self.rabbitmq_connection_handler.send_message(
             routing_key="reports_queue",
-            msg_body=msg.encode_to_str()
+            msg_body=msg.encode_to_bytes()
         )
 
     def save_data(self, filename, lines) -> None:
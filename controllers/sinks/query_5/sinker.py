@@ -10,13 +10,14 @@ AMOUNT_POS = 2
 
 class Query5(ResilientNode):
 
-    def __init__(self, id_sinker, number_workers):
+    def __init__(self, id_sinker, number_workers, prefetch_count=1):
         super().__init__()  # Call parent constructor
         self.rabbitmq_connection_handler = RabbitMQConnectionHandler(
             producer_exchange_name="reports_exchange",
             producer_queues_to_bind={"reports_queue": ["reports_queue"]},
             consumer_exchange_name="group_by_sentiment_exchange",
-            consumer_queues_to_recv_from=[f"group_by_sentiment_queue_{id_sinker}"]
+            consumer_queues_to_recv_from=[f"group_by_sentiment_queue_{id_sinker}"],
+            prefetch_count=prefetch_count,
         )
         self.rabbitmq_connection_handler.set_message_consumer_callback(f"group_by_sentiment_queue_{id_sinker}", self.callback)
         self.number_workers = number_workers
@@ -75,7 +76,7 @@ class Query5(ResilientNode):
             return
         
         if data.type != MiddlewareMessageType.EOF_MOVIES:
-            lines = data.get_batch_iter_from_payload()
+            lines = data.get_columnar_batch().rows()
             filename = f".data/query_5-client-{data.client_id}"
             self.clients_state[data.client_id]["hash_file"]["query_5"] = self.save_data(filename, lines)
             self.clients_state[data.client_id][data.controller_name] = data.seq_number  # Update the last seq number for this controller
@@ -94,7 +95,7 @@ class Query5(ResilientNode):
                 )
                 self.rabbitmq_connection_handler.send_message(
                     routing_key="reports_queue",
-                    msg_body=msg.encode_to_str()
+                    msg_body=msg.encode_to_bytes()
                 )
                 files_to_remove = [
                     f".data/query_5-client-{data.client_id}",
@@ -153,7 +154,7 @@ class Query5(ResilientNode):
         # Send all filtered results in a single message
         self.rabbitmq_connection_handler.send_message(
             routing_key="reports_queue",
-            msg_body=msg.encode_to_str()
+            msg_body=msg.encode_to_bytes()
         )
 
     def save_data(self, filename, lines) -> None:
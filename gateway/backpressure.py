@@ -0,0 +1,105 @@
+import asyncio
+import logging
+import time
+import pika
+from concurrent.futures import ThreadPoolExecutor
+from common.middleware_connection_handler import RabbitMQConnectionHandler
+
+DEFAULT_HIGH_WATERMARK = 2000  # mensajes por cola
+DEFAULT_LOW_WATERMARK = 1000   # mensajes por cola
+DEFAULT_INTERVAL = 1.0         # segundos entre mediciones
+
+
+class Backpressure:
+    """
+    Control de flujo por creditos entre el pipeline y el gateway. Cada cola vigilada
+    tiene credito para high_watermark mensajes: su profundidad se mide cada interval
+    segundos con un queue_declare pasivo, y entre mediciones cada batch que el gateway
+    publica en ella consume un credito. Cuando alguna cola se queda sin credito se
+    dejan de leer los sockets de los clientes (que quedan bloqueados por TCP) hasta
+    que todas las colas bajen de low_watermark, asi el broker no acumula mensajes sin
+    cota cuando el pipeline va mas lento que los clientes.
+    """
+
+    def __init__(self, queues, high_watermark=DEFAULT_HIGH_WATERMARK, low_watermark=DEFAULT_LOW_WATERMARK, interval=DEFAULT_INTERVAL):
+        self.high_watermark = high_watermark
+        self.low_watermark = min(low_watermark, high_watermark)
+        self.interval = interval
+        self.depths = {queue: 0 for queue in queues}
+        self.resumed = asyncio.Event()
+        self.resumed.set()
+        self.throttled_since = None
+        self.throttled_seconds = 0.0
+        # Conexion propia para medir las colas, usada siempre desde el mismo thread
+        self.connection = None
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="backpressure")
+
+    def enabled(self) -> bool:
+        return self.high_watermark > 0 and bool(self.depths)
+
+    async def acquire(self) -> float:
+        """Espera a que haya credito para seguir leyendo de un cliente. Devuelve los segundos esperados"""
+        if self.resumed.is_set():
+            return 0.0
+        start = time.monotonic()
+        await self.resumed.wait()
+        return time.monotonic() - start
+
+    def on_publish(self, queue):
+        if not self.enabled() or queue not in self.depths:
+            return
+        self.depths[queue] += 1
+        if self.depths[queue] >= self.high_watermark:
+            self.__throttle(queue)
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            depths = await loop.run_in_executor(self.executor, self.measure_depths)
+            if depths is not None:
+                self.update(depths)
+            await asyncio.sleep(self.interval)
+
+    def measure_depths(self) -> dict[str, int] | None:
+        try:
+            if self.connection is None:
+                self.connection = RabbitMQConnectionHandler(
+                    producer_exchange_name=None,
+                    producer_queues_to_bind=None,
+                    consumer_exchange_name=None,
+                    consumer_queues_to_recv_from=None
+                )
+            return {queue: self.connection.queue_depth(queue) for queue in self.depths}
+        except pika.exceptions.AMQPError as e:
+            # Se reconecta en la proxima medicion, mientras tanto se mantiene el estado actual
+            logging.warning(f"action: measure_queue_depths | result: fail | error: {e!r}")
+            self.connection = None
+            return None
+
+    def update(self, depths: dict[str, int]):
+        self.depths.update(depths)
+        if not self.resumed.is_set():
+            if all(depth <= self.low_watermark for depth in self.depths.values()):
+                self.__resume()
+            return
+        for queue, depth in self.depths.items():
+            if depth >= self.high_watermark:
+                self.__throttle(queue)
+                return
+
+    def __throttle(self, queue):
+        if not self.resumed.is_set():
+            return
+        self.resumed.clear()
+        self.throttled_since = time.monotonic()
+        logging.info(f"action: backpressure | result: throttle | queue: {queue} | depth: {self.depths[queue]}")
+
+    def __resume(self):
+        throttled = time.monotonic() - self.throttled_since
+        self.throttled_seconds += throttled
+        self.throttled_since = None
+        self.resumed.set()
+        logging.info(f"action: backpressure | result: resume | throttled_seconds: {throttled:.2f} | throttled_seconds_total: {self.throttled_seconds:.2f}")
+
+    def close(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
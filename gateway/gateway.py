@@ -1,14 +1,19 @@
-import socket
+import asyncio
 import logging
 import signal
-import multiprocessing
+import threading
 import uuid
+import time
+import pika
+from concurrent.futures import ThreadPoolExecutor
 from common.middleware_message_protocol import MiddlewareMessage, MiddlewareMessageType
 from common.message_protocol import MessageProtocol
 from common.defines import ClientCommunication
 from common.middleware_connection_handler import RabbitMQConnectionHandler
 from common.socket_handler import SocketHandler
 from common.defines import QueryNumber
+from common.compression import CODECS, NO_COMPRESSION, negotiate
+from backpressure import Backpressure, DEFAULT_HIGH_WATERMARK, DEFAULT_LOW_WATERMARK, DEFAULT_INTERVAL
 
 CODE_ALL_QUERYS = 0
 CODE_BATCH = 6
@@ -26,15 +31,55 @@ BATCH_RATINGS = 7
 BATCH_CREDITS = 8
 BATCH_END = 9
 
+PUBLISH_RETRIES = 3
+PUBLISH_RETRY_DELAY = 1  # segundos
+DEFAULT_PUBLISHER_CONNECTIONS = 4
+DEFAULT_MAX_CLIENTS = 1000
+DEFAULT_OUTBOX_SIZE = 1000  # Resultados encolados por cliente sin escribir
+DEFAULT_COMPRESSION = "zlib,lz4,zstd"
+
+# Mensaje al cliente para cada resultado que llega de reports_queue
+RESULT_TYPES = {
+    MiddlewareMessageType.RESULT_Q1: ClientCommunication.RESULT_QUERY_1,
+    MiddlewareMessageType.RESULT_Q2: ClientCommunication.RESULT_QUERY_2,
+    MiddlewareMessageType.RESULT_Q3: ClientCommunication.RESULT_QUERY_3,
+    MiddlewareMessageType.RESULT_Q4: ClientCommunication.RESULT_QUERY_4,
+    MiddlewareMessageType.RESULT_Q5: ClientCommunication.RESULT_QUERY_5,
+}
+EOF_RESULT_TYPES = {
+    MiddlewareMessageType.EOF_RESULT_Q1: ClientCommunication.EOF_QUERY_1,
+    MiddlewareMessageType.EOF_RESULT_Q2: ClientCommunication.EOF_QUERY_2,
+    MiddlewareMessageType.EOF_RESULT_Q3: ClientCommunication.EOF_QUERY_3,
+    MiddlewareMessageType.EOF_RESULT_Q4: ClientCommunication.EOF_QUERY_4,
+    MiddlewareMessageType.EOF_RESULT_Q5: ClientCommunication.EOF_QUERY_5,
+}
+
 class Gateway:
-    def __init__(self, port, listen_backlog, num_workers):
-        # Initialize server socket
-        self._socket_handler = SocketHandler(server_mode=True)
-        self._socket_handler.create_socket(port=port, listen_backlog=listen_backlog)
+    """
+    Gateway de un solo proceso sobre asyncio. Cada cliente es una corrutina que
+    lee su socket sin bloquear; las publicaciones a RabbitMQ (pika es bloqueante)
+    se hacen en un pool chico de threads con una conexion persistente cada uno,
+    y los resultados de reports_queue se consumen en otro thread y se encolan,
+    sin parsearlos, en la cola de salida del cliente (un diccionario en memoria
+    por client_id), que escribe una tarea propia de cada cliente. Si las colas
+    del pipeline se llenan se deja de leer a los clientes (ver Backpressure).
+    """
+
+    def __init__(self, port, listen_backlog, num_workers,
+                 publisher_connections=DEFAULT_PUBLISHER_CONNECTIONS,
+                 max_clients=DEFAULT_MAX_CLIENTS,
+                 compression=DEFAULT_COMPRESSION,
+                 backpressure_queues=(),
+                 high_watermark=DEFAULT_HIGH_WATERMARK,
+                 low_watermark=DEFAULT_LOW_WATERMARK,
+                 backpressure_interval=DEFAULT_INTERVAL,
+                 outbox_size=DEFAULT_OUTBOX_SIZE):
+        self.port = port
+        self.listen_backlog = listen_backlog
         self.serverIsAlive = True
-        self.manager = multiprocessing.Manager()
-        self.clients = self.manager.dict()
-        self.clients_lock = multiprocessing.Lock()
+        # client_id -> cola de salida de resultados del cliente, solo se accede desde el event loop
+        self.clients = {}
+        self.clients_writers = {}  # client_id -> StreamWriter del socket, para desconectar a un cliente lento
 
         self.consumer_exchange_name = "reports_exchange"
         self.consumer_queue = "reports_queue"
@@ -42,106 +87,141 @@ class Gateway:
         self.producer_queue_of_movies = "movies_queue"
         self.producer_queue_of_ratings = "ratings_queue"
         self.producer_queue_of_credits = "credits_queue"
-        self.publisher_connection = None
         self.clients_batch_received = {}
         self.n_workers = num_workers
+        # Codecs que se aceptan al negociar la compresion con el cliente en TYPE_INIT,
+        # y el codec negociado por client_id (los batches llegan y se publican comprimidos)
+        self.compression_codecs = [name.strip() for name in compression.split(",") if name.strip() in CODECS]
+        self.clients_compression = {}
+
+        # Se vigilan las colas que llena el gateway y las que se indiquen de mas
+        # adelante en el pipeline; por client_id, segundos que no se leyo su socket
+        gateway_queues = [queue + f"_{i}" for queue in (self.producer_queue_of_movies, self.producer_queue_of_ratings, self.producer_queue_of_credits)
+                          for i in range(self.n_workers)]
+        self.backpressure = Backpressure(gateway_queues + list(backpressure_queues), high_watermark, low_watermark, backpressure_interval)
+        self.backpressure_monitor = None
+        self.clients_throttled = {}
+
+        # Cada thread del pool de publicacion tiene su propia conexion (pika no es thread-safe)
+        self.publisher_connections = max(1, publisher_connections)
+        self.publishers = None
+        self.publisher_local = threading.local()
+        # Clientes atendidos a la vez: cada uno tiene a lo sumo un batch en memoria,
+        # los que exceden el limite esperan sin que se lea su socket
+        self.max_clients = max(1, max_clients)
+        self.client_slots = None
+        # Una cola de salida llena frena al thread que consume reports_queue: los
+        # resultados esperan en el broker y no en la memoria del gateway
+        self.outbox_size = max(1, outbox_size)
+        self.loop = None
+        self.server = None
+        self.stopped = None
+        self.rabbit_mq_report_connection = None
 
     def set_signals(self):
-        signal.signal(signal.SIGTERM, self.__signal_handler)
-        signal.signal(signal.SIGINT, self.__signal_handler)
-
-    def clients_connections(self):
-        processor_clients = []
-        while self.serverIsAlive:
-            try:
-                client_sock = self.__accept_new_connection()
-                if client_sock:
-                    client_process = multiprocessing.Process(target=self.__handle_client_connection, args=(client_sock,))
-                    processor_clients.append(client_process)
-                    client_process.daemon = True
-                    client_process.start()
-                    client_sock.close()
-            except OSError as e:
-                logging.error(f"action: accept_connections | result: fail | error: {e}")
-                break
-
-        for client in processor_clients:
-            client.join()
-
-        self.__close_server()
+        self.loop.add_signal_handler(signal.SIGTERM, self.__signal_handler, signal.SIGTERM)
+        self.loop.add_signal_handler(signal.SIGINT, self.__signal_handler, signal.SIGINT)
 
     def run(self):
         """
-        Dummy Server loop
+        Server loop
 
-        Server that accept a new connections and establishes a
-        communication with a client. After client with communucation
-        finishes, servers starts to accept new connections again
+        Accepts connections in the event loop and serves every client
+        concurrently in the same process until a signal stops the server
         """
+        asyncio.run(self.serve())
+
+    async def serve(self):
+        self.loop = asyncio.get_running_loop()
+        self.stopped = asyncio.Event()
+        self.client_slots = asyncio.Semaphore(self.max_clients)
         self.set_signals()
-        report_service = multiprocessing.Process(target=self.__handler_reports)
-        report_service.daemon = True
+        self.publishers = ThreadPoolExecutor(max_workers=self.publisher_connections, thread_name_prefix="publisher")
+        if self.backpressure.enabled():
+            self.backpressure_monitor = asyncio.create_task(self.backpressure.run())
+        report_service = threading.Thread(target=self.__handler_reports, daemon=True)
         report_service.start()
-        self.clients_connections()
-        report_service.join()
+        self.server = await asyncio.start_server(
+            self.__handle_client_connection,
+            port=self.port,
+            backlog=self.listen_backlog,
+            reuse_address=True
+        )
+        logging.info('action: accept_connections | result: in_progress')
+        await self.stopped.wait()
+        await self.__close_server()
 
-    def __handle_client_connection(self, client_sock):
+    async def __handle_client_connection(self, reader, writer):
         """
-        Read message from a specific client socket and closes the socket
+        Read messages from a specific client connection and closes it
 
         If a problem arises in the communication with the client, the
-        client socket will also be closed
+        client connection will also be closed
         """
         client_id = None
-        try:
-            addr = client_sock.getpeername()
-            logging.info(f"action: handle_client_connection | result: start | addr: {addr}")
-            
-            client_id = uuid.uuid4().int
-            with self.clients_lock:
-                if client_id not in self.clients:
-                    logging.info(f"action: add_client | result: success | client_id: {client_id}")
-                    self.clients[client_id] = client_sock
-            
-            while True:
-                dto_message = self.receive_message(client_sock)
-                if not dto_message:
-                    logging.warning(f"action: handle_client_connection | result: fail | error: invalid message received")
-                    raise ConnectionResetError()
-
-                if dto_message.type_message == ClientCommunication.TYPE_FINISH_COMMUNICATION:
-                    logging.info(f"action: client_finish | result: success | client_id: {client_id}")
-                    break
-                    
-                self.handle_client_connection(client_sock, dto_message, client_id)
-                
-        except Exception as e:
-            logging.error(f"action: handle_client_connection | result: fail | error: {e}")
-            self.__handle_abort(client_id)
-        finally:
-            # Ensure client is removed from dictionary when connection closes
-            if client_id is not None:
-                with self.clients_lock:
-                    if client_id in self.clients:
-                        logging.info(f"action: remove_client | result: success | client_id: {client_id}")
-                        del self.clients[client_id]
-            
-            client_sock.close()
-            logging.info(f"action: handle_client_connection | result: socket_closed | addr: {addr if 'addr' in locals() else 'unknown'}")
-
-    def __handle_abort(self, client_id):
+        results_writer = None
+        addr = writer.get_extra_info('peername')
+        async with self.client_slots:
+            try:
+                logging.info(f"action: handle_client_connection | result: start | addr: {addr}")
+
+                client_id = uuid.uuid4().int
+                logging.info(f"action: add_client | result: success | client_id: {client_id}")
+                outbox = asyncio.Queue(self.outbox_size)
+                self.clients[client_id] = outbox
+                self.clients_writers[client_id] = writer
+                results_writer = asyncio.create_task(self.__write_results(writer, outbox, client_id))
+
+                while True:
+                    dto_message = await self.receive_message(reader)
+                    if not dto_message:
+                        logging.warning(f"action: handle_client_connection | result: fail | error: invalid message received")
+                        raise ConnectionResetError()
+
+                    if dto_message.type_message == ClientCommunication.TYPE_FINISH_COMMUNICATION:
+                        logging.info(f"action: client_finish | result: success | client_id: {client_id} | "
+                                     f"throttled_seconds: {self.clients_throttled.get(client_id, 0.0):.2f}")
+                        break
+
+                    await self.handle_client_connection(reader, writer, dto_message, client_id)
+
+            except asyncio.CancelledError:
+                # El server se esta cerrando
+                logging.info(f"action: handle_client_connection | result: cancelled | client_id: {client_id}")
+            except Exception as e:
+                logging.error(f"action: handle_client_connection | result: fail | error: {e}")
+                try:
+                    await self.__handle_abort(client_id)
+                except asyncio.CancelledError:
+                    logging.info(f"action: handle_abort | result: cancelled | client_id: {client_id}")
+            finally:
+                if results_writer is not None:
+                    results_writer.cancel()
+                if client_id is not None:
+                    logging.info(f"action: remove_client | result: success | client_id: {client_id}")
+                    self.clients.pop(client_id, None)
+                    self.clients_writers.pop(client_id, None)
+                    self.clients_batch_received.pop(client_id, None)
+                    self.clients_compression.pop(client_id, None)
+                    self.clients_throttled.pop(client_id, None)
+                writer.close()
+                logging.info(f"action: handle_client_connection | result: socket_closed | addr: {addr}")
+
+    async def __handle_abort(self, client_id):
         """
         Handle abort from client
 
-        Function blocks until an abort is received. Then the
-        function is executed and the result is sent to the client
+        Sends an abort to every preprocessor worker so they discard
+        everything received from the client
         """
+        if client_id not in self.clients_batch_received:
+            return
         logging.info(f"action: handle_abort | result: success | client_id: {client_id}")
-        self.__handle_abort_message(client_id, ClientCommunication.BATCH_MOVIES, self.producer_queue_of_movies)
-        self.__handle_abort_message(client_id, ClientCommunication.BATCH_RATINGS, self.producer_queue_of_ratings)
-        self.__handle_abort_message(client_id, ClientCommunication.BATCH_CREDITS, self.producer_queue_of_credits)
+        await self.__handle_abort_message(client_id, ClientCommunication.BATCH_MOVIES, self.producer_queue_of_movies)
+        await self.__handle_abort_message(client_id, ClientCommunication.BATCH_RATINGS, self.producer_queue_of_ratings)
+        await self.__handle_abort_message(client_id, ClientCommunication.BATCH_CREDITS, self.producer_queue_of_credits)
 
-    def __handle_abort_message(self, client_id, type_batch, producer_queue):
+    async def __handle_abort_message(self, client_id, type_batch, producer_queue):
         abort_message = MiddlewareMessage(
             query_number=QueryNumber.QUERY_ABORT.value,
             client_id=client_id,
@@ -151,9 +231,9 @@ class Gateway:
             controller_name="gateway"
         )
         for i in range(self.n_workers):
-            self.publisher_connection.send_message(
+            await self.publish(
                 routing_key=producer_queue + f"_{i}",
-                msg_body=abort_message.encode_to_str()
+                msg_body=abort_message.encode_to_bytes()
             )
 
     def __handler_reports(self):
@@ -168,92 +248,112 @@ class Gateway:
 
     def callback(self, ch, method, properties, body):
         data = MiddlewareMessage.decode_from_bytes(body)
-        lines = data.get_batch_iter_from_payload()
-        result_query = []
-        if data.type == MiddlewareMessageType.RESULT_Q1:
-            for line in lines:
-                logging.info(f"action: response_query_1 | client: {data.client_id} | line: {line}")
-                result_query.append(line)
-            self.send_result_query(MiddlewareMessage.write_csv_batch(result_query), ClientCommunication.RESULT_QUERY_1 , data.client_id)
-        elif data.type == MiddlewareMessageType.RESULT_Q2:            
-            for line in lines:
-                logging.info(f"action: response_query_2 | client: {data.client_id} | line: {line}")
-                result_query.append(line)
-            self.send_result_query(MiddlewareMessage.write_csv_batch(result_query), ClientCommunication.RESULT_QUERY_2 , data.client_id)
-        elif data.type == MiddlewareMessageType.RESULT_Q3:            
-            for line in lines:
-                logging.info(f"action: response_query_3 | client: {data.client_id} | line: {line}")
-                result_query.append(line)
-            self.send_result_query(MiddlewareMessage.write_csv_batch(result_query), ClientCommunication.RESULT_QUERY_3 , data.client_id)
-        elif data.type == MiddlewareMessageType.RESULT_Q4:            
-            for line in lines:
-                logging.info(f"action: response_query_4 | client: {data.client_id} | line: {line}")
-                result_query.append(line)
-            self.send_result_query(MiddlewareMessage.write_csv_batch(result_query), ClientCommunication.RESULT_QUERY_4 , data.client_id)
-        elif data.type == MiddlewareMessageType.RESULT_Q5:
-            for line in lines:
-                logging.info(f"action: response_query_5 | client: {data.client_id} | line: {line}")
-                result_query.append(line)
-            self.send_result_query(MiddlewareMessage.write_csv_batch(result_query), ClientCommunication.RESULT_QUERY_5 , data.client_id)
-        elif data.type == MiddlewareMessageType.EOF_RESULT_Q1:
-            logging.info(f"EOF_RESULT_Q1")
-            self.send_result_query(MiddlewareMessage.write_csv_batch(result_query), ClientCommunication.EOF_QUERY_1 , data.client_id)
-        elif data.type == MiddlewareMessageType.EOF_RESULT_Q2:
-            logging.info(f"EOF_RESULT_Q2")
-            self.send_result_query(MiddlewareMessage.write_csv_batch(result_query), ClientCommunication.EOF_QUERY_2 , data.client_id)
-        elif data.type == MiddlewareMessageType.EOF_RESULT_Q3:
-            logging.info(f"EOF_RESULT_Q3")
-            self.send_result_query(MiddlewareMessage.write_csv_batch(result_query), ClientCommunication.EOF_QUERY_3 , data.client_id)   
-        elif data.type == MiddlewareMessageType.EOF_RESULT_Q4:
-            logging.info(f"EOF_RESULT_Q4")
-            self.send_result_query(MiddlewareMessage.write_csv_batch(result_query), ClientCommunication.EOF_QUERY_4 , data.client_id)
-        elif data.type == MiddlewareMessageType.EOF_RESULT_Q5:
-            logging.info(f"EOF_RESULT_Q5")
-            self.send_result_query(MiddlewareMessage.write_csv_batch(result_query), ClientCommunication.EOF_QUERY_5 , data.client_id)
-
-    def handle_client_connection(self, client_sock, msg_type, client_id):
-        self.publisher_connection = RabbitMQConnectionHandler(
-            producer_exchange_name=self.producer_exchange_name,
-            producer_queues_to_bind={
-                **{self.producer_queue_of_movies + f"_{i}": [self.producer_queue_of_movies + f"_{i}"] for i in range(self.n_workers)},
-                **{self.producer_queue_of_ratings + f"_{i}": [self.producer_queue_of_ratings + f"_{i}"] for i in range(self.n_workers)},
-                **{self.producer_queue_of_credits + f"_{i}": [self.producer_queue_of_credits + f"_{i}"] for i in range(self.n_workers)}
-            },
-            consumer_exchange_name=None,
-            consumer_queues_to_recv_from=None
-        )
+        if data.type in RESULT_TYPES:
+            # El payload ya viene en el formato del cliente, se reenvia sin parsearlo
+            if logging.getLogger().isEnabledFor(logging.DEBUG):
+                for line in data.get_batch_iter_from_payload():
+                    logging.debug(f"action: response_query | type: {data.type.name} | client: {data.client_id} | line: {line}")
+            self.send_result_query(data.payload_bytes, RESULT_TYPES[data.type], data.client_id)
+        elif data.type in EOF_RESULT_TYPES:
+            logging.info(f"action: response_query | type: {data.type.name} | client: {data.client_id}")
+            self.send_result_query(b"", EOF_RESULT_TYPES[data.type], data.client_id)
+
+    def get_publisher_connection(self) -> RabbitMQConnectionHandler:
+        """
+        Conexion a RabbitMQ del thread de publicacion actual. Se crea en el primer
+        uso del thread y se reusa para todos los clientes, en lugar de abrir una
+        conexion y declarar todas las colas por mensaje.
+        """
+        if getattr(self.publisher_local, "connection", None) is None:
+            self.publisher_local.connection = RabbitMQConnectionHandler(
+                producer_exchange_name=self.producer_exchange_name,
+                producer_queues_to_bind={
+                    **{self.producer_queue_of_movies + f"_{i}": [self.producer_queue_of_movies + f"_{i}"] for i in range(self.n_workers)},
+                    **{self.producer_queue_of_ratings + f"_{i}": [self.producer_queue_of_ratings + f"_{i}"] for i in range(self.n_workers)},
+                    **{self.producer_queue_of_credits + f"_{i}": [self.producer_queue_of_credits + f"_{i}"] for i in range(self.n_workers)}
+                },
+                consumer_exchange_name=None,
+                consumer_queues_to_recv_from=None
+            )
+        return self.publisher_local.connection
+
+    def close_publisher_connection(self):
+        connection = getattr(self.publisher_local, "connection", None)
+        if connection is None:
+            return
+        try:
+            connection.connection.close()
+        except pika.exceptions.AMQPError as e:
+            logging.warning(f"action: close_publisher_connection | result: fail | error: {e}")
+        self.publisher_local.connection = None
+
+    def publish_blocking(self, routing_key, msg_body):
+        """
+        Publica por la conexion persistente del thread. Si la conexion se cae, se
+        descarta, se abre una nueva y se reintenta el mismo mensaje: si el broker ya
+        lo habia recibido, los preprocessors descartan el duplicado por seq_number.
+        """
+        for attempt in range(PUBLISH_RETRIES + 1):
+            try:
+                self.get_publisher_connection().send_message(routing_key=routing_key, msg_body=msg_body)
+                return
+            except pika.exceptions.AMQPError as e:
+                logging.warning(f"action: publish | result: fail | attempt: {attempt + 1} | error: {e!r}")
+                self.close_publisher_connection()
+                if attempt == PUBLISH_RETRIES:
+                    raise
+                time.sleep(PUBLISH_RETRY_DELAY)
+
+    async def publish(self, routing_key, msg_body):
+        """
+        Publica en el pool de threads y espera la confirmacion del broker. Cada
+        cliente espera cada publicacion antes de leer el siguiente mensaje, asi
+        sus batches y EOFs llegan en orden aunque usen conexiones distintas.
+        """
+        await self.loop.run_in_executor(self.publishers, self.publish_blocking, routing_key, msg_body)
+
+    async def handle_client_connection(self, reader, writer, msg_type, client_id):
         logging.info(f"action: receive_message | result: success | code: {msg_type.type_message}")
         if msg_type.type_message == ClientCommunication.TYPE_QUERY:
-            self.__handle_query(client_sock, msg_type.payload, client_id)
+            await self.__handle_query(reader, msg_type.payload, client_id)
         if msg_type.type_message == ClientCommunication.TYPE_INIT:
-            self.__handle_init(client_sock, client_id)
+            await self.__handle_init(writer, msg_type.payload, client_id)
         # Agregar las demas querys aqui
 
-    def __handle_init(self, client_sock, client_id):
+    async def __handle_init(self, writer, offered_compression, client_id):
         """
         Handle init from client
 
-        Function blocks until an init is received. Then the
-        function is executed and the result is sent to the client
+        The client may send in the init payload the compression codecs it
+        supports (comma separated). If one of them is also supported here, the
+        answer is "<client_id>;<codec>" and every batch of the client arrives
+        compressed with it. Otherwise the answer is just the client id
         """
-        logging.info(f"action: handle_init | result: success | client_id: {client_id}")
+        codec = None
+        if offered_compression:
+            codec = negotiate(offered_compression, self.compression_codecs)
+        logging.info(f"action: handle_init | result: success | client_id: {client_id} | compression: {codec}")
+        payload = str(client_id)
+        if codec is not None:
+            self.clients_compression[client_id] = CODECS[codec]
+            payload += f";{codec}"
         dto_message = MessageProtocol(
             typeMessage=ClientCommunication.CODE_INIT,
-            payload=str(client_id)
+            payload=payload
         )
-        self.send_message(client_sock, dto_message)
+        await self.send_message(writer, dto_message)
 
 
-    def __handle_query(self, client_sock, query, client_id):
+    async def __handle_query(self, reader, query, client_id):
         """
         Handle query from client
 
-        Function blocks until a query is received. Then the
+        Function waits until a query is received. Then the
         function is executed and the result is sent to the client
         """
         query_number = int(query)
         if query_number == ALL_QUERY:
-            self.__handle_all_query(client_sock, client_id)
+            await self.__handle_all_query(reader, client_id)
         elif query_number == QUERY_1:
             self.start_query_1()
         elif query_number == 2:
@@ -266,10 +366,12 @@ class Gateway:
             self.start_query_5()
         
 
-    def __handle_all_query(self, client_sock, client_id):
+    async def __handle_all_query(self, reader, client_id):
         query_number = ClientCommunication.ALL_QUERYS.value
         while True:
-            dto_message = self.receive_message(client_sock)
+            dto_message = await self.receive_message(reader)
+            if not dto_message:
+                raise ConnectionResetError()
             if client_id not in self.clients_batch_received:
                 self.clients_batch_received[client_id] = {
                     ClientCommunication.BATCH_MOVIES: 0,
@@ -277,83 +379,83 @@ class Gateway:
                     ClientCommunication.BATCH_CREDITS: 0
                 }
             if dto_message.type_message == ClientCommunication.BATCH_MOVIES:
-                self.receive_file(client_sock, query_number, dto_message, ClientCommunication.EOF_MOVIES, client_id) 
+                await self.receive_file(reader, query_number, dto_message, ClientCommunication.EOF_MOVIES, client_id)
             elif dto_message.type_message == ClientCommunication.BATCH_RATINGS:
-                self.receive_file(client_sock, query_number, dto_message, ClientCommunication.EOF_RATINGS, client_id)
+                await self.receive_file(reader, query_number, dto_message, ClientCommunication.EOF_RATINGS, client_id)
             elif dto_message.type_message == ClientCommunication.BATCH_CREDITS:
-                self.receive_file(client_sock, query_number, dto_message, ClientCommunication.EOF_CREDITS, client_id)
+                await self.receive_file(reader, query_number, dto_message, ClientCommunication.EOF_CREDITS, client_id)
             elif dto_message.type_message == ClientCommunication.FINISH_SEND_FILES:
                 logging.info(f"action: receive_message | result: success | code: {dto_message.type_message}")            
                 break
 
-    def receive_file(self, client_sock, query_number, msg, eof_value, client_id):
+    async def receive_file(self, reader, query_number, msg, eof_value, client_id):
         """
         Receive a file from the client
 
-        Function blocks until a file is received. Then the
-        function is saved in the specified path
+        Function waits until the whole file is received, forwarding
+        every batch to the preprocessors
         """
         message = msg
         # Process the initial message that was passed in first
         while message.type_message != eof_value:
             self.clients_batch_received[client_id][message.type_message] += 1
-            batchData = message.payload.replace('|', '\n')
-            self.send_batch_to_preprocessor(
+            compression = self.clients_compression.get(client_id, NO_COMPRESSION)
+            if compression != NO_COMPRESSION:
+                # El cliente ya separa las filas con \n antes de comprimir, se publica tal cual
+                batchData = message.payload_bytes
+            else:
+                batchData = self.batch_lines(message)
+            await self.send_batch_to_preprocessor(
                 batch=batchData,
+                compression=compression,
                 type_batch=message.type_message,
                 seq_number=self.clients_batch_received[client_id][message.type_message],
                 query_number=query_number,
                 client_id=client_id
             )
-            # self.send_ack(client_sock, message.id_client, ClientCommunication.TYPE_ACK.value,"Batch received")
-            message = self.receive_message(client_sock)   
-
-        self.send_eof_to_preprocessor(message.type_message, query_number, client_id)
+            # No se lee el proximo batch mientras el pipeline este saturado
+            throttled = await self.backpressure.acquire()
+            if throttled:
+                self.clients_throttled[client_id] = self.clients_throttled.get(client_id, 0.0) + throttled
+            message = await self.receive_message(reader)
+            if not message:
+                raise ConnectionResetError()
+
+        await self.send_eof_to_preprocessor(message.type_message, query_number, client_id)
         return
 
-    def send_ack(self, client_sock, id_client, ack_type, message=None):
+    @staticmethod
+    def batch_lines(message) -> str | bytes:
         """
-        Send ack to the client
-
-        Function blocks until the ack is sent. Then the
-        function returns True if the ack was sent successfully
-        or False if there was an error
+        Payload del batch con una fila por linea. Los batches ASCII (todos los de
+        ratings) se procesan como bytes, sin decodificarlos ni volver a codificarlos;
+        el resto pasa por str, que ademas valida que sea UTF-8
         """
-        ack = MessageProtocol(
-            idClient=id_client,
-            typeMessage=ack_type,
-            payload=message
-        )
-        return self.send_message(client_sock, ack)
+        payload = bytes(message.payload_bytes)
+        if payload.isascii():
+            return payload.replace(b'|', b'\n')
+        return message.payload.replace('|', '\n')
 
-    def save_batch_in_file(self, batch, filename):
-        """
-        Save batch in a file by appending the new data
+    async def receive_message(self, reader) -> MessageProtocol:
         """
-        with open(filename, 'a') as f:
-            for line in batch:
-                f.write(line + '\n')
+        Receive a message from the client stream and decode it
 
-    def receive_message(self, sock) -> MessageProtocol:
-        """
-        Receive a message from the socket and decode it
-
-        Function blocks until a message is received. Then the
+        Function waits until a message is received. Then the
         message is decoded and returned
         """
-        return SocketHandler.receive_message_from(sock)
+        return await SocketHandler.receive_message_from_stream(reader)
 
-    def send_message(self, sock, message):
+    async def send_message(self, writer, message):
         """
-        Send a message to the socket
+        Send a message to the client stream
 
-        Function blocks until the message is sent. Then the
+        Function waits until the message is sent. Then the
         function returns True if the message was sent successfully
         or False if there was an error
         """
-        return SocketHandler.send_message_to(sock, message)
+        return await SocketHandler.send_message_to_stream(writer, message)
 
-    def send_batch_to_preprocessor(self, batch, type_batch, seq_number, query_number, client_id):
+    async def send_batch_to_preprocessor(self, batch, type_batch, seq_number, query_number, client_id, compression=NO_COMPRESSION):
         batch_type = None
         producer_queue = None
         id_worker = seq_number % self.n_workers  # Assuming 3 workers for movies
@@ -373,15 +475,17 @@ class Gateway:
             seq_number=seq_number,
             type=batch_type,
             payload=batch,
-            controller_name="gateway"
+            controller_name="gateway",
+            compression=compression
         )
 
-        self.publisher_connection.send_message(
+        await self.publish(
             routing_key=producer_queue,
-            msg_body=msg.encode_to_str()
+            msg_body=msg.encode_to_bytes()
         )
+        self.backpressure.on_publish(producer_queue)
 
-    def send_eof_to_preprocessor(self, type_batch, query_number, client_id):
+    async def send_eof_to_preprocessor(self, type_batch, query_number, client_id):
         typeEof = None
         producer_queue = None
         eof_number = 0
@@ -402,7 +506,7 @@ class Gateway:
             producer_queue = self.producer_queue_of_credits
 
         for i in range(self.n_workers):
-            self.publisher_connection.send_message(
+            await self.publish(
                 routing_key=producer_queue + f"_{i}",
                 msg_body=MiddlewareMessage(
                     query_number=query_number,
@@ -411,27 +515,55 @@ class Gateway:
                     type=typeEof,
                     payload="",
                     controller_name="gateway"
-                ).encode_to_str()
+                ).encode_to_bytes()
             )
 
 
     def send_result_query(self, result_query, type_query, client_id):
         """
-        Send result query to the client
+        Envia un resultado al cliente
 
-        Function blocks until the result query is sent. Then the
-        function returns True if the result query was sent successfully
-        or False if there was an error
+        Se llama desde el thread que consume reports_queue, compartido por todos
+        los clientes: el resultado se encola en la cola de salida del cliente sin
+        esperar a que se escriba ni a que haya lugar, asi un cliente lento nunca
+        frena los resultados de los demas
         """
-        msg = MessageProtocol(
-            # idClient=client_id,
-            typeMessage=type_query,
-            payload=result_query
-        )
-        with self.clients_lock:
-            if client_id in self.clients:
-                sock_client = self.clients[client_id]
-                self.send_message(sock_client, msg)
+        self.loop.call_soon_threadsafe(self.enqueue_result, result_query, type_query, client_id)
+
+    def enqueue_result(self, result_query, type_query, client_id):
+        outbox = self.clients.get(client_id)
+        if outbox is None:
+            logging.warning(f"action: send_result_query | result: fail | client_id: {client_id} | error: client not connected")
+            return
+        try:
+            outbox.put_nowait((type_query, result_query))
+        except asyncio.QueueFull:
+            # El cliente no lee sus resultados: se lo desconecta en lugar de acumularlos sin limite.
+            # Se corta el socket sin esperar a vaciar su buffer, y la conexion termina con abort
+            logging.error(f"action: send_result_query | result: fail | client_id: {client_id} | error: outbox full ({self.outbox_size} results), disconnecting client")
+            self.clients.pop(client_id, None)
+            writer = self.clients_writers.pop(client_id, None)
+            if writer is not None:
+                writer.transport.abort()
+
+    async def __write_results(self, writer, outbox, client_id):
+        """
+        Escribe al cliente los resultados de su cola de salida, todos los que haya
+        encolados antes de esperar a que se vacie el buffer del socket
+        """
+        while True:
+            type_query, result_query = await outbox.get()
+            SocketHandler.write_frame_to_stream(writer, type_query.value, result_query)
+            while not outbox.empty():
+                type_query, result_query = outbox.get_nowait()
+                SocketHandler.write_frame_to_stream(writer, type_query.value, result_query)
+            try:
+                await writer.drain()
+            except OSError as e:
+                logging.error(f"action: send_result_query | result: fail | client_id: {client_id} | error: {e}")
+                # Los resultados que lleguen despues se descartan
+                self.clients.pop(client_id, None)
+                return
 
     def start_query_1(self, batch):
         return 0
@@ -453,30 +585,19 @@ class Gateway:
         return 0
 
 
-    # El método __send_all ya no es necesario porque se utiliza SocketHandler
-
-    def __accept_new_connection(self):
-        """
-        Accept new connections
-
-        Function blocks until a connection to a client is made.
-        Then connection created is printed and returned
-        """
-        # Connection arrived
-        logging.info('action: accept_connections | result: in_progress')
-        client_handler, client_addr = self._socket_handler.accept_connection()
-        if client_handler:
-            logging.info(f'action: accept_connections | result: success | ip: {client_addr[0]}')
-            return client_handler.get_socket()
-        return None
-
-    def __signal_handler(self, signum, frame):
+    def __signal_handler(self, signum):
         signame = signal.Signals(signum).name
         logging.info(f"action: exit | result: success | signal: {signame}")
         self.serverIsAlive = False
-        self.__close_server()
-
-    def __close_server(self):
-        self._socket_handler.close()
+        self.stopped.set()
+
+    async def __close_server(self):
+        self.server.close()
+        if self.rabbit_mq_report_connection is not None:
+            connection = self.rabbit_mq_report_connection
+            connection.connection.add_callback_threadsafe(connection.channel.stop_consuming)
+        self.publishers.shutdown(wait=False, cancel_futures=True)
+        if self.backpressure_monitor is not None:
+            self.backpressure_monitor.cancel()
+        self.backpressure.close()
         logging.info("action: close_server | result: success")
-        exit(0)
\ No newline at end of file
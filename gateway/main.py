@@ -1,5 +1,6 @@
 from configparser import ConfigParser
-from gateway import Gateway
+from gateway import Gateway, DEFAULT_PUBLISHER_CONNECTIONS, DEFAULT_MAX_CLIENTS, DEFAULT_COMPRESSION, DEFAULT_OUTBOX_SIZE
+from backpressure import DEFAULT_HIGH_WATERMARK, DEFAULT_LOW_WATERMARK, DEFAULT_INTERVAL
 # from config.logger import Logger, setup_logger
 import os
 import logging
@@ -55,6 +56,14 @@ def main():
     try:
         config_params = initialize_config()
         n_workers = int(os.getenv("N_WORKERS"))
+        publisher_connections = int(os.getenv("GATEWAY_PUBLISHERS", DEFAULT_PUBLISHER_CONNECTIONS))
+        max_clients = int(os.getenv("GATEWAY_MAX_CLIENTS", DEFAULT_MAX_CLIENTS))
+        compression = os.getenv("GATEWAY_COMPRESSION", DEFAULT_COMPRESSION)
+        outbox_size = int(os.getenv("GATEWAY_OUTBOX_SIZE", DEFAULT_OUTBOX_SIZE))
+        backpressure_queues = [queue for queue in os.getenv("BACKPRESSURE_QUEUES", "").split(",") if queue]
+        high_watermark = int(os.getenv("BACKPRESSURE_HIGH_WATERMARK", DEFAULT_HIGH_WATERMARK))
+        low_watermark = int(os.getenv("BACKPRESSURE_LOW_WATERMARK", DEFAULT_LOW_WATERMARK))
+        backpressure_interval = float(os.getenv("BACKPRESSURE_INTERVAL", DEFAULT_INTERVAL))
         logging_level = config_params["logging_level"]
         port = config_params["port"]
         listen_backlog = config_params["listen_backlog"]
@@ -64,10 +73,15 @@ def main():
         # Log config parameters at the beginning of the program to verify the configuration
         # of the component
         logging.debug(f"action: config | result: success | port: {port} | "
-                    f"listen_backlog: {listen_backlog} | logging_level: {logging_level}")
+                    f"listen_backlog: {listen_backlog} | logging_level: {logging_level} | "
+                    f"publisher_connections: {publisher_connections} | max_clients: {max_clients} | "
+                    f"compression: {compression} | backpressure_queues: {backpressure_queues} | "
+                    f"high_watermark: {high_watermark} | low_watermark: {low_watermark} | "
+                    f"backpressure_interval: {backpressure_interval} | outbox_size: {outbox_size}")
 
         # Initialize server and start server loop
-        server = Gateway(port, listen_backlog, n_workers)
+        server = Gateway(port, listen_backlog, n_workers, publisher_connections, max_clients, compression,
+                         backpressure_queues, high_watermark, low_watermark, backpressure_interval, outbox_size)
         server.run()
     except Exception as e:
         logging.exception("Uncaught exception")
@@ -5,6 +5,33 @@ N_WORKERS=$2
 N_SINKERS=$3
 N_NLP=$4
 N_HEALTHCHECKERS=$5
+# Parametros opcionales, se toman del entorno
+PUBLISHER_BATCH_SIZE=${PUBLISHER_BATCH_SIZE:-20}
+PREFETCH_COUNT=${PREFETCH_COUNT:-20}
+CONSUME_BATCH_SIZE=${CONSUME_BATCH_SIZE:-10}
+GROUP_COMMIT_SIZE=${GROUP_COMMIT_SIZE:-20}
+NLP_BATCH_SIZE=${NLP_BATCH_SIZE:-32}
+NLP_CACHE_SIZE=${NLP_CACHE_SIZE:-100000}
+NLP_BACKEND=${NLP_BACKEND:-pytorch}
+NLP_MODEL_DIR=${NLP_MODEL_DIR:-/model}
+NLP_PROCESSES=${NLP_PROCESSES:-1}
+STATE_SNAPSHOT_EVERY=${STATE_SNAPSHOT_EVERY:-1000}
+STATE_SNAPSHOT_INTERVAL=${STATE_SNAPSHOT_INTERVAL:-30}
+GATEWAY_PUBLISHERS=${GATEWAY_PUBLISHERS:-4}
+GATEWAY_MAX_CLIENTS=${GATEWAY_MAX_CLIENTS:-1000}
+GATEWAY_COMPRESSION=${GATEWAY_COMPRESSION:-zlib,lz4,zstd}
+GATEWAY_OUTBOX_SIZE=${GATEWAY_OUTBOX_SIZE:-1000}
+# Joiners por id de pelicula, independiente de N_WORKERS (ver "Agregar joiners" en el README)
+N_JOINERS=${N_JOINERS:-$N_WORKERS}
+JOINER_VNODES=${JOINER_VNODES:-64}
+RATINGS_JOIN_MODE=${RATINGS_JOIN_MODE:-incremental}
+MOVIE_FILTER_ERROR_RATE=${MOVIE_FILTER_ERROR_RATE:-0.01}
+MOVIES_PUSHDOWN=${MOVIES_PUSHDOWN:-on}
+BACKPRESSURE_HIGH_WATERMARK=${BACKPRESSURE_HIGH_WATERMARK:-2000}
+BACKPRESSURE_LOW_WATERMARK=${BACKPRESSURE_LOW_WATERMARK:-1000}
+BACKPRESSURE_INTERVAL=${BACKPRESSURE_INTERVAL:-1}
+# Por defecto se vigilan tambien las colas de aggregator_nlp, la etapa mas lenta
+BACKPRESSURE_QUEUES=${BACKPRESSURE_QUEUES:-$(seq -s, -f "cleaned_movies_queue_nlp_%g" 0 $((N_NLP-1)) 2>/dev/null)}
 FILE_CONTROLLER="./.data/monitorable_process.txt"
 
 readonly COMPOSE_FILE="docker-compose-dev.yaml"
@@ -42,6 +69,14 @@ add_gateway() {
     environment:
       - PYTHONUNBUFFERED=1
       - N_WORKERS=$N_WORKERS
+      - GATEWAY_PUBLISHERS=$GATEWAY_PUBLISHERS
+      - GATEWAY_MAX_CLIENTS=$GATEWAY_MAX_CLIENTS
+      - GATEWAY_COMPRESSION=$GATEWAY_COMPRESSION
+      - GATEWAY_OUTBOX_SIZE=$GATEWAY_OUTBOX_SIZE
+      - BACKPRESSURE_QUEUES=$BACKPRESSURE_QUEUES
+      - BACKPRESSURE_HIGH_WATERMARK=$BACKPRESSURE_HIGH_WATERMARK
+      - BACKPRESSURE_LOW_WATERMARK=$BACKPRESSURE_LOW_WATERMARK
+      - BACKPRESSURE_INTERVAL=$BACKPRESSURE_INTERVAL
     volumes:
       - ./gateway/config.ini:/config.ini:ro
     networks:
@@ -64,6 +99,11 @@ add_movies_preprocessor() {
       - N_WORKERS=$N_WORKERS
       - WORKER_ID=$i
       - NLP_WORKERS=$N_NLP
+      - MOVIES_PUSHDOWN=$MOVIES_PUSHDOWN
+      - PUBLISHER_BATCH_SIZE=$PUBLISHER_BATCH_SIZE
+      - PREFETCH_COUNT=$PREFETCH_COUNT
+      - GROUP_COMMIT_SIZE=$GROUP_COMMIT_SIZE
+      - CONSUME_BATCH_SIZE=$CONSUME_BATCH_SIZE
     volumes:
       - ./.data/movies_preprocessor_$i:/.data
     networks:
@@ -84,7 +124,13 @@ add_ratings_preprocessor() {
     entrypoint: python3 /main.py
     environment:
       - N_WORKERS=$N_WORKERS
+      - N_JOINERS=$N_JOINERS
+      - JOINER_VNODES=$JOINER_VNODES
       - WORKER_ID=$i
+      - PUBLISHER_BATCH_SIZE=$PUBLISHER_BATCH_SIZE
+      - PREFETCH_COUNT=$PREFETCH_COUNT
+      - GROUP_COMMIT_SIZE=$GROUP_COMMIT_SIZE
+      - CONSUME_BATCH_SIZE=$CONSUME_BATCH_SIZE
     volumes:
       - ./.data/ratings_preprocessor_$i:/.data
     networks:
@@ -105,7 +151,13 @@ add_credits_preprocessor() {
     entrypoint: python3 /main.py
     environment:
       - N_WORKERS=$N_WORKERS
+      - N_JOINERS=$N_JOINERS
+      - JOINER_VNODES=$JOINER_VNODES
       - WORKER_ID=$i
+      - PUBLISHER_BATCH_SIZE=$PUBLISHER_BATCH_SIZE
+      - PREFETCH_COUNT=$PREFETCH_COUNT
+      - GROUP_COMMIT_SIZE=$GROUP_COMMIT_SIZE
+      - CONSUME_BATCH_SIZE=$CONSUME_BATCH_SIZE
     volumes:
       - ./.data/credits_preprocessor_$i:/.data
     networks:
@@ -127,6 +179,10 @@ add_filter_by_country() {
     environment:
       - N_WORKERS=$N_WORKERS
       - WORKER_ID=$i
+      - PUBLISHER_BATCH_SIZE=$PUBLISHER_BATCH_SIZE
+      - PREFETCH_COUNT=$PREFETCH_COUNT
+      - GROUP_COMMIT_SIZE=$GROUP_COMMIT_SIZE
+      - CONSUME_BATCH_SIZE=$CONSUME_BATCH_SIZE
     volumes:
       - ./.data/filter_by_country_$i:/.data
     networks:
@@ -148,6 +204,10 @@ add_filter_by_country_invesment() {
     environment:
       - N_WORKERS=$N_WORKERS
       - WORKER_ID=$i
+      - PUBLISHER_BATCH_SIZE=$PUBLISHER_BATCH_SIZE
+      - PREFETCH_COUNT=$PREFETCH_COUNT
+      - GROUP_COMMIT_SIZE=$GROUP_COMMIT_SIZE
+      - CONSUME_BATCH_SIZE=$CONSUME_BATCH_SIZE
     volumes:
       - ./.data/filter_by_country_invesment_$i:/.data
     networks:
@@ -168,8 +228,14 @@ add_filter_by_year() {
     entrypoint: python3 /main.py
     environment:
       - N_WORKERS=$N_WORKERS
+      - N_JOINERS=$N_JOINERS
+      - JOINER_VNODES=$JOINER_VNODES
       - N_SINKERS=$N_SINKERS
       - WORKER_ID=$i
+      - PUBLISHER_BATCH_SIZE=$PUBLISHER_BATCH_SIZE
+      - PREFETCH_COUNT=$PREFETCH_COUNT
+      - GROUP_COMMIT_SIZE=$GROUP_COMMIT_SIZE
+      - CONSUME_BATCH_SIZE=$CONSUME_BATCH_SIZE
     volumes:
       - ./.data/filter_by_year_$i:/.data
     networks:
@@ -192,6 +258,10 @@ add_group_by_country() {
       - N_SINKERS=$N_SINKERS
       - N_WORKERS=$N_WORKERS
       - WORKER_ID=$i
+      - PUBLISHER_BATCH_SIZE=$PUBLISHER_BATCH_SIZE
+      - PREFETCH_COUNT=$PREFETCH_COUNT
+      - GROUP_COMMIT_SIZE=$GROUP_COMMIT_SIZE
+      - CONSUME_BATCH_SIZE=$CONSUME_BATCH_SIZE
     volumes:
       - ./.data/group_by_country_$i:/.data
     networks:
@@ -213,6 +283,10 @@ add_group_by_sentiment() {
     environment:
       - N_SINKERS=$N_SINKERS
       - WORKER_ID=$i
+      - PUBLISHER_BATCH_SIZE=$PUBLISHER_BATCH_SIZE
+      - PREFETCH_COUNT=$PREFETCH_COUNT
+      - GROUP_COMMIT_SIZE=$GROUP_COMMIT_SIZE
+      - CONSUME_BATCH_SIZE=$CONSUME_BATCH_SIZE
     volumes:
       - ./.data/group_by_sentiment_$i:/.data
     networks:
@@ -225,7 +299,7 @@ add_group_by_sentiment() {
 }
 
 add_joiner_rating_by_id() {
-  for ((i=0; i<=N_WORKERS-1; i++)); do
+  for ((i=0; i<=N_JOINERS-1; i++)); do
     echo "joiner_rating_by_id_$i" >> "$FILE_CONTROLLER"
     echo "  joiner_rating_by_id_$i:
     container_name: joiner_rating_by_id_$i
@@ -235,6 +309,13 @@ add_joiner_rating_by_id() {
       - N_SINKERS=$N_SINKERS
       - WORKER_ID=$i
       - N_WORKERS=$N_WORKERS
+      - N_JOINERS=$N_JOINERS
+      - JOINER_VNODES=$JOINER_VNODES
+      - MOVIE_FILTER_ERROR_RATE=$MOVIE_FILTER_ERROR_RATE
+      - RATINGS_JOIN_MODE=$RATINGS_JOIN_MODE
+      - PREFETCH_COUNT=$PREFETCH_COUNT
+      - STATE_SNAPSHOT_EVERY=$STATE_SNAPSHOT_EVERY
+      - STATE_SNAPSHOT_INTERVAL=$STATE_SNAPSHOT_INTERVAL
     volumes:
       - ./.data/joiner_ratings_by_id_$i:/.data
     networks:
@@ -247,7 +328,7 @@ add_joiner_rating_by_id() {
 }
 
 add_joiner_credit_by_id() {
-  for ((i=0; i<=N_WORKERS-1; i++)); do
+  for ((i=0; i<=N_JOINERS-1; i++)); do
     echo "joiner_credit_by_id_$i" >> "$FILE_CONTROLLER"
     echo "  joiner_credit_by_id_$i:
     container_name: joiner_credit_by_id_$i
@@ -257,6 +338,12 @@ add_joiner_credit_by_id() {
       - N_SINKERS=$N_SINKERS
       - WORKER_ID=$i
       - N_WORKERS=$N_WORKERS
+      - N_JOINERS=$N_JOINERS
+      - JOINER_VNODES=$JOINER_VNODES
+      - MOVIE_FILTER_ERROR_RATE=$MOVIE_FILTER_ERROR_RATE
+      - PREFETCH_COUNT=$PREFETCH_COUNT
+      - STATE_SNAPSHOT_EVERY=$STATE_SNAPSHOT_EVERY
+      - STATE_SNAPSHOT_INTERVAL=$STATE_SNAPSHOT_INTERVAL
     volumes:
       - ./.data/joiner_credits_by_id_$i:/.data
     networks:
@@ -279,6 +366,15 @@ add_aggregator_nlp() {
     environment:
       - N_WORKERS=$N_WORKERS
       - WORKER_ID=$i
+      - PUBLISHER_BATCH_SIZE=$PUBLISHER_BATCH_SIZE
+      - PREFETCH_COUNT=$PREFETCH_COUNT
+      - GROUP_COMMIT_SIZE=$GROUP_COMMIT_SIZE
+      - CONSUME_BATCH_SIZE=$CONSUME_BATCH_SIZE
+      - NLP_BATCH_SIZE=$NLP_BATCH_SIZE
+      - NLP_CACHE_SIZE=$NLP_CACHE_SIZE
+      - NLP_BACKEND=$NLP_BACKEND
+      - NLP_MODEL_DIR=$NLP_MODEL_DIR
+      - NLP_PROCESSES=$NLP_PROCESSES
     volumes:
       - ./.data/aggregator_nlp_$i:/.data
     networks:
@@ -300,6 +396,10 @@ add_aggregator_r_b() {
     environment:
       - N_WORKERS=$N_WORKERS
       - WORKER_ID=$i
+      - PUBLISHER_BATCH_SIZE=$PUBLISHER_BATCH_SIZE
+      - PREFETCH_COUNT=$PREFETCH_COUNT
+      - GROUP_COMMIT_SIZE=$GROUP_COMMIT_SIZE
+      - CONSUME_BATCH_SIZE=$CONSUME_BATCH_SIZE
     volumes:
       - ./.data/aggregator_r_b_$i:/.data
     networks:
@@ -322,6 +422,7 @@ add_sinker_q1() {
     environment:
       - SINKER_ID=$i
       - N_WORKERS=$N_WORKERS
+      - PREFETCH_COUNT=$PREFETCH_COUNT
     volumes:
       - ./.data/query_1_sinker_$i:/.data
     networks:
@@ -343,6 +444,7 @@ add_sinker_q2() {
     environment:
       - SINKER_ID=$i
       - N_WORKERS=$N_WORKERS
+      - PREFETCH_COUNT=$PREFETCH_COUNT
     volumes:
       - ./.data/query_2_sinker_$i:/.data
     networks:
@@ -363,7 +465,9 @@ add_sinker_q3() {
     entrypoint: python3 /main.py
     environment:
       - N_WORKERS=$N_WORKERS
+      - N_JOINERS=$N_JOINERS
       - SINKER_ID=$i
+      - PREFETCH_COUNT=$PREFETCH_COUNT
     volumes:
       - ./.data/query_3_sinker_$i:/.data
     networks:
@@ -384,7 +488,9 @@ add_sinker_q4() {
     entrypoint: python3 /main.py
     environment:
       - N_WORKERS=$N_WORKERS
+      - N_JOINERS=$N_JOINERS
       - SINKER_ID=$i
+      - PREFETCH_COUNT=$PREFETCH_COUNT
     volumes:
       - ./.data/query_4_sinker_$i:/.data
     networks:
@@ -406,6 +512,7 @@ add_sinker_q5() {
     environment:
       - SINKER_ID=$i
       - N_WORKERS=$N_WORKERS
+      - PREFETCH_COUNT=$PREFETCH_COUNT
     volumes:
       - ./.data/query_5_sinker_$i:/.data
     networks:
@@ -595,7 +702,10 @@ add_movies_preprocessor
 add_ratings_preprocessor
 add_credits_preprocessor
 add_filter_by_country
-add_filter_by_country_invesment
+# Con MOVIES_PUSHDOWN=bypass los movies_preprocessor publican directo a group_by_country
+if [ "$MOVIES_PUSHDOWN" != "bypass" ]; then
+  add_filter_by_country_invesment
+fi
 add_filter_by_year
 add_group_by_country
 add_group_by_sentiment